@@ -1,23 +1,492 @@
 import os
 import json
+import time
+import logging
+import threading
+import itertools
 import requests
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from collections import OrderedDict
+from flask import Flask, Response, request, jsonify, render_template, send_file, stream_with_context, g, has_request_context
 from datetime import datetime
 
 # Importa la función de búsqueda de tu script original
-from todojunto import lookup_tableContents_raw
+from todojunto import (lookup_compiled, lookup_many, lookup_grid, sweep_values, compile_tableContents,
+                       pin_tables, TABLE_CACHE_STATS)
 from config import Config
+from response_cache import ResponseCache
+from upstream import UpstreamClient, combined_stats
+from local_index import LocalIndex, records_from_response
+from category_tree import CategoryTree
+from static_assets import StaticAssets, choose_encoding, etag_matches
+from response_store import ResponseStore, record_table, is_manifest
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, BYTES_BUCKETS, Stages
+from sampling_profiler import SamplingProfiler
+from best_cmc import best_cmc, coverage_index
+from search_index import SearchIndex
+from json_stream import ArrayStream
 
 # Inicializa la aplicación Flask
 app = Flask(__name__)
 
+logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('kcdb')
+
 # Asegúrate de que la carpeta 'responses' exista
 Config.ensure_responses_folder()
 
+# Cliente HTTP compartido (pool, timeouts y reintentos) hacia la API del BIPM
+upstream_client = UpstreamClient.from_config()
+# Otros clientes que también llaman a la API (asgi.py registra el async)
+_extra_upstream_clients = []
+
+
+def register_upstream_client(get_client):
+    """Suma a las estadísticas el cliente que devuelve get_client()."""
+    _extra_upstream_clients.append(get_client)
+
+
+def upstream_stats_summary():
+    """Estadísticas de todos los clientes hacia la API del BIPM, juntas."""
+    return combined_stats([upstream_client] + [get() for get in _extra_upstream_clients])
+
+
+# Almacén deduplicado de las respuestas guardadas (manifiestos + registros)
+response_store = ResponseStore(
+    Config.RESPONSES_FOLDER,
+    snapshot_prefixes=Config.SNAPSHOT_PREFIXES,
+    max_snapshots=Config.RESPONSES_MAX_SNAPSHOTS,
+    max_age_days=Config.RESPONSES_MAX_AGE_DAYS,
+    compact_interval=Config.RESPONSES_COMPACT_INTERVAL,
+)
+
+# Caché de respuestas de la API del BIPM (memoria + disco)
+response_cache = ResponseCache(
+    Config.get_response_cache_folder(),
+    ttl=Config.RESPONSE_CACHE_TTL,
+    stale_ttl=Config.RESPONSE_CACHE_STALE,
+    max_entries=Config.RESPONSE_CACHE_SIZE,
+    max_disk_entries=Config.RESPONSE_CACHE_DISK_ENTRIES,
+)
+
+# JSON estáticos servidos con variantes gzip/brotli precomprimidas
+static_assets = StaticAssets('.', Config.get_static_cache_folder(),
+                             [Config.DEFAULT_TREE_FILE, Config.DEFAULT_LOCAL_JSON],
+                             resolve=Config.get_dataset_file)
+
+def load_local_index(path=None):
+    """Construye el índice del dataset local, o devuelve None si no está disponible."""
+    path = path or Config.get_dataset_file(Config.DEFAULT_LOCAL_JSON)
+    if not os.path.exists(path):
+        return None
+    try:
+        return LocalIndex.load(path)
+    except (OSError, ValueError):
+        return None
+
+def load_category_tree(path=None):
+    """Carga el árbol de categorías para /api/options, o devuelve None si no está disponible."""
+    path = path or Config.get_dataset_file(Config.DEFAULT_TREE_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        return CategoryTree.load(path)
+    except (OSError, ValueError):
+        return None
+
+def index_saved_responses(search):
+    """
+    Agrega al índice de búsqueda las respuestas guardadas que todavía no
+    tiene (las de otros workers, o las que había al arrancar), de la más
+    vieja a la más nueva. Devuelve cuántos registros agregó.
+    """
+    added = 0
+    for path in reversed(response_store.snapshots()):
+        name = os.path.basename(path)
+        if name in search.sources:
+            continue
+        try:
+            # Las respuestas completas del formato anterior se leen de a un
+            # registro; un manifiesto no tiene "data" y queda entero en .meta
+            stream = ArrayStream.from_file(path)
+            try:
+                added += search.add(stream)
+            finally:
+                stream.close()
+            doc = stream.meta
+            if is_manifest(doc):
+                added += search.add_entries(doc['records'], response_store.get_record)
+            else:
+                added += search.add(records_from_response(doc))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("No se pudo indexar %s: %s", name, e)
+        search.sources.add(name)
+    return added
+
+def build_search_index(index):
+    """Índice de búsqueda de texto sobre el dataset local (si está) y las respuestas guardadas."""
+    search = SearchIndex(index.records if index is not None else (),
+                         max_segments=Config.SEARCH_MAX_SEGMENTS,
+                         max_expansions=Config.SEARCH_MAX_EXPANSIONS)
+    index_saved_responses(search)
+    return search
+
+# Estructuras de solo lectura construidas por warm_up: índice del dataset
+# local, árbol de categorías con las opciones de la cascada precalculadas e
+# índice de búsqueda de texto (este crece con las respuestas que se guardan)
+local_index = None
+category_tree = None
+search_index = None
+ready = threading.Event()
+# Generación del dataset (sync_dataset.py) con la que se construyeron
+dataset_generation = None
+_dataset_checked = 0.0
+_reload_lock = threading.Lock()
+
+def current_generation():
+    """Directorio de la generación vigente del dataset, o None si se usan los archivos de la raíz."""
+    link = os.path.join(Config.DATASET_FOLDER, 'current')
+    return os.path.realpath(link) if os.path.islink(link) else None
+
+def local_tables(index):
+    """Strings tableContents de los registros del dataset local."""
+    for record in index.records:
+        contents = record_table(record)
+        if contents is not None:
+            yield contents
+
+def warm_up():
+    """
+    Construye las estructuras de solo lectura (variantes de los JSON
+    estáticos, índice local, árbol de categorías y tablas compiladas del
+    dataset local) y marca la app como lista. Con gunicorn --preload
+    (gunicorn.conf.py) corre una sola vez en el master y los workers las
+    heredan ya construidas.
+    """
+    global local_index, category_tree, search_index, dataset_generation
+    start = time.perf_counter()
+    static_assets.warm()
+    dataset_generation = current_generation()
+    local_index = load_local_index()
+    category_tree = load_category_tree()
+    if category_tree is not None:
+        # Deja memorizadas las opciones de la cascada sin selección
+        category_tree.options([])
+    pinned = 0
+    if local_index is not None and Config.PRELOAD_TABLES > 0:
+        pinned = pin_tables(local_tables(local_index), limit=Config.PRELOAD_TABLES)
+    if local_index is not None:
+        # Cobertura de las tablas para /api/best_cmc
+        coverage_index(local_index)
+    search_index = build_search_index(local_index)
+    ready.set()
+    logger.info("App lista en %.2f s (dataset local: %s registros, árbol: %s caminos, tablas compiladas: %d, "
+                "búsqueda: %d registros)",
+                time.perf_counter() - start,
+                len(local_index) if local_index is not None else '-',
+                category_tree.size if category_tree is not None else '-', pinned, len(search_index))
+
+def start_warm_up():
+    """
+    Corre warm_up al importar la app: en segundo plano con
+    WARMUP_IN_BACKGROUND, salvo que gunicorn la esté precargando en el
+    master (los hilos no sobreviven al fork y ningún worker quedaría listo;
+    ahí el master no atiende, así que se prepara todo antes de crearlos).
+    """
+    if Config.WARMUP_IN_BACKGROUND and not Config.GUNICORN_PRELOAD:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+        return
+    if Config.WARMUP_IN_BACKGROUND:
+        logger.info("WARMUP_IN_BACKGROUND se ignora con preload_app: warm_up corre en el master")
+    warm_up()
+
+start_warm_up()
+
+def reload_dataset():
+    """
+    Reconstruye índice y árbol con la generación vigente del dataset y los
+    reemplaza juntos; mientras tanto se sigue atendiendo con los anteriores.
+    """
+    global local_index, category_tree, search_index, dataset_generation
+    generation = current_generation()
+    index = load_local_index()
+    tree = load_category_tree()
+    if tree is not None:
+        tree.options([])
+    if index is not None:
+        coverage_index(index)
+    search = build_search_index(index)
+    local_index, category_tree, search_index, dataset_generation = index, tree, search, generation
+    logger.info("Dataset recargado (%s): %s registros, %s caminos", generation or 'raíz',
+                len(index) if index is not None else '-', tree.size if tree is not None else '-')
+
+def _reload_in_background():
+    try:
+        reload_dataset()
+    except Exception:
+        logger.exception("No se pudo recargar el dataset")
+    finally:
+        _reload_lock.release()
+
+@app.before_request
+def check_dataset_generation():
+    """Cada DATASET_RELOAD_INTERVAL segundos mira si sync_dataset.py publicó una generación nueva."""
+    global _dataset_checked
+    if Config.DATASET_RELOAD_INTERVAL <= 0 or not ready.is_set():
+        return
+    now = time.monotonic()
+    if now - _dataset_checked < Config.DATASET_RELOAD_INTERVAL:
+        return
+    _dataset_checked = now
+    if current_generation() != dataset_generation and _reload_lock.acquire(blocking=False):
+        threading.Thread(target=_reload_in_background, name='dataset-reload', daemon=True).start()
+
+def not_ready():
+    """Respuesta 503 mientras warm_up no terminó."""
+    response = jsonify({"success": False, "message": "La aplicación se está iniciando"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+# --- Instrumentación --------------------------------------------------------
+
+REQUESTS = REGISTRY.counter(
+    'kcdb_http_requests_total', 'Solicitudes HTTP atendidas', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'kcdb_http_request_seconds', 'Duración de las solicitudes HTTP', ('endpoint',))
+STAGE_SECONDS = REGISTRY.histogram(
+    'kcdb_stage_seconds', 'Tiempo propio de cada etapa dentro de una solicitud', ('endpoint', 'stage'))
+PAYLOAD_BYTES = REGISTRY.histogram(
+    'kcdb_payload_bytes', 'Bytes leídos de la API (upstream) y enviados al cliente (response)',
+    ('endpoint', 'kind'), buckets=BYTES_BUCKETS)
+RESPONSE_CACHE_RESULTS = REGISTRY.counter(
+    'kcdb_response_cache_total', 'Resultados de la caché de respuestas de la API', ('result',))
+REGISTRY.callback(
+    'kcdb_table_cache_total', 'Aciertos y fallos de la caché de tablas compiladas', 'counter',
+    lambda: {(k,): v for k, v in TABLE_CACHE_STATS.items()}, ('result',))
+REGISTRY.callback(
+    'kcdb_upstream_calls_total', 'Llamadas a la API del BIPM por resultado', 'counter',
+    lambda: {(k,): v for k, v in upstream_stats_summary().items() if k in ('calls', 'errors', 'retries', 'busy')},
+    ('kind',))
+
+def stages():
+    """Etapas de la solicitud en curso (fuera de una solicitud, unas que se descartan)."""
+    if has_request_context() and 'stages' in g:
+        return g.stages
+    return Stages()
+
+def _endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def observe_request(endpoint, method, status, elapsed, request_stages):
+    """Registra las métricas de una solicitud terminada (también las usa asgi.py)."""
+    REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    for stage, seconds in request_stages.seconds.items():
+        STAGE_SECONDS.observe(max(seconds, 0.0), endpoint=endpoint, stage=stage)
+    if 'upstream_bytes' in request_stages.counts:
+        PAYLOAD_BYTES.observe(request_stages.counts['upstream_bytes'], endpoint=endpoint, kind='upstream')
+    logger.debug("%s %s %s %.1f ms [%s]", method, endpoint, status, elapsed * 1000,
+                 request_stages.server_timing())
+
+@app.before_request
+def start_instrumentation():
+    g.request_start = time.perf_counter()
+    g.stages = Stages()
+    if Config.PROFILE_TOKEN and request.headers.get(Config.PROFILE_HEADER) == Config.PROFILE_TOKEN:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        g.profile_path = os.path.join(Config.get_profile_folder(), f"profile_{timestamp}_{os.getpid()}.txt")
+        g.profiler = SamplingProfiler(interval=Config.PROFILE_INTERVAL).start()
+
+@app.after_request
+def add_instrumentation_headers(response):
+    g.response_status = response.status_code
+    if 'stages' in g and not response.is_streamed:
+        PAYLOAD_BYTES.observe(response.calculate_content_length() or 0,
+                              endpoint=_endpoint_label(), kind='response')
+        response.headers['Server-Timing'] = g.stages.server_timing()
+    if 'profiler' in g:
+        response.headers[Config.PROFILE_HEADER] = os.path.basename(g.profile_path)
+    return response
+
+@app.teardown_request
+def record_instrumentation(exc):
+    """Registra las métricas de la solicitud (al final, incluso en las respuestas en streaming)."""
+    request_stages = g.pop('stages', None)
+    if request_stages is None:
+        return
+    endpoint = _endpoint_label()
+    status = 500 if exc is not None else g.get('response_status', 500)
+    observe_request(endpoint, request.method, status,
+                    time.perf_counter() - g.request_start, request_stages)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        try:
+            profiler.write(g.profile_path)
+            logger.info("Perfil de %s %s: %d muestras en %s; más frecuentes: %s", request.method, endpoint,
+                        profiler.total, g.profile_path, profiler.top_functions())
+        except OSError as e:
+            logger.warning("No se pudo guardar el perfil %s: %s", g.profile_path, e)
+
+def table_info(record):
+    """Datos de la tabla de incertidumbre de un registro del KCDB, o None si no tiene."""
+    if (isinstance(record, dict) and 
+        'uncertaintyTable' in record and 
+        record['uncertaintyTable'].get('tableContents') and
+        record['uncertaintyTable']['tableContents'] != '<masked>'):
+        
+        return {
+            "id": record.get('id'),
+            "kcdbCode": record.get('kcdbCode', 'N/A'),
+            "quantityValue": record.get('quantityValue', 'N/A')
+        }
+    return None
+
+def extract_tables(data):
+    """Busca las tablas de incertidumbre disponibles en una respuesta del KCDB."""
+    tables_found = []
+    if 'data' in data and isinstance(data['data'], list):
+        for record in data['data']:
+            info = table_info(record)
+            if info is not None:
+                tables_found.append(info)
+    return tables_found
+
+def normalize_query(payload):
+    """
+    Separa el payload del cliente en (payload hacia la API, todas_las_páginas).
+    Por defecto se traen todas las páginas del resultado, así que page/pageSize
+    del cliente se ignoran; con "allPages": false se respeta la página pedida.
+    """
+    payload = dict(payload or {})
+    all_pages = bool(payload.pop('allPages', True))
+    if all_pages:
+        payload.pop('page', None)
+        payload.pop('pageSize', None)
+    return payload, all_pages
+
+def iter_result_pages(upstream_payload, all_pages):
+    """
+    Páginas de la respuesta de la API, en orden, cada una como un stream de
+    registros (json_stream.ArrayStream) con las demás claves en .meta.
+    """
+    if all_pages:
+        return upstream_client.iter_page_streams(upstream_payload)
+    return iter([upstream_client.stream(upstream_payload)])
+
+def snapshot_filename(prefix):
+    """Ruta nueva para guardar una respuesta de la API."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(Config.RESPONSES_FOLDER, f"{prefix}_{timestamp}.json")
+
+def save_snapshot(filename, entries, first_meta):
+    """Escribe el manifiesto de la consulta (con las claves de la primera página) y aplica la retención."""
+    count = len(entries)
+    total = (first_meta or {}).get('totalElements')
+    response_store.write_snapshot(filename, entries, meta={
+        "page": 0,
+        "pageSize": count,
+        "numberOfElements": count,
+        "totalElements": total if total is not None else count,
+    })
+    index_saved_entries(filename, entries)
+    response_store.apply_retention()
+
+def index_saved_entries(filename, entries):
+    """Agrega al índice de búsqueda los registros nuevos o modificados de una respuesta recién guardada."""
+    search = search_index
+    if search is None:
+        return
+    try:
+        search.add_entries(entries, response_store.get_record)
+    except (OSError, ValueError, KeyError):
+        logger.exception("No se pudo indexar %s", filename)
+    search.sources.add(os.path.basename(filename))
+
+_search_checked = 0.0
+_search_refresh_lock = threading.Lock()
+
+def _refresh_search_in_background(search):
+    try:
+        index_saved_responses(search)
+    except Exception:
+        logger.exception("No se pudo actualizar el índice de búsqueda")
+    finally:
+        _search_refresh_lock.release()
+
+def refresh_search_index():
+    """Cada SEARCH_REFRESH_INTERVAL segundos busca respuestas guardadas por otros workers."""
+    global _search_checked
+    if Config.SEARCH_REFRESH_INTERVAL <= 0 or search_index is None:
+        return
+    now = time.monotonic()
+    if now - _search_checked < Config.SEARCH_REFRESH_INTERVAL:
+        return
+    _search_checked = now
+    if _search_refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_search_in_background, args=(search_index,),
+                         name='search-refresh', daemon=True).start()
+
+def fetch_and_save(payload, prefix):
+    """
+    Consulta la API del BIPM (paginando si hace falta), guarda la respuesta y
+    devuelve {"filename", "tables"}. Los registros se leen de a uno del
+    cuerpo de cada página y pasan directo al almacén deduplicado y a la
+    búsqueda de tablas; el archivo `filename` queda como manifiesto de la
+    consulta, sin juntar todo el resultado en memoria.
+    """
+    upstream_payload, all_pages = normalize_query(payload)
+
+    filename = snapshot_filename(prefix)
+    tables_found = []
+    first_meta = None
+    st = stages()
+
+    def records():
+        nonlocal first_meta
+        for page in st.timed(iter_result_pages(upstream_payload, all_pages), 'upstream_fetch'):
+            for record in st.timed(page, 'upstream_fetch'):
+                info = table_info(record)
+                if info is not None:
+                    tables_found.append(info)
+                yield record
+            # El parseo ocurre mientras se lee la respuesta: se separa de la descarga
+            st.move('upstream_fetch', 'json_parse', page.parse_seconds)
+            st.count('upstream_bytes', page.bytes)
+            if first_meta is None:
+                first_meta = page.meta
+
+    try:
+        with st.time('file_write'):
+            entries = response_store.put_records(records(), pin=filename)
+            save_snapshot(filename, entries, first_meta)
+    finally:
+        response_store.unpin(filename)
+
+    return {"filename": filename, "tables": tables_found}
+
+def cached_query(payload, prefix):
+    """Devuelve (entrada, estado de caché) para el payload, consultando la API si hace falta."""
+    upstream_payload, all_pages = normalize_query(payload)
+    key_payload = dict(upstream_payload, allPages=all_pages)
+    entry, state = response_cache.get_or_fetch(key_payload, lambda: fetch_and_save(payload, prefix))
+    RESPONSE_CACHE_RESULTS.inc(result=state)
+    return entry, state
+
+def cache_headers(response, entry, state):
+    """Agrega las cabeceras de estado de la caché a la respuesta."""
+    response.headers['X-Cache'] = state
+    response.headers['Age'] = str(response_cache.age(entry))
+    return response
+
 @app.route('/')
 def index():
-    """Sirve la página HTML principal."""
-    return render_template('index.html')
+    """Sirve la página HTML principal (503 hasta que la app esté lista: es el health check)."""
+    if not ready.is_set():
+        return not_ready()
+    return render_template('index.html', static_versions=static_assets.versions())
 
 @app.route('/advanced_search')
 def advanced_search():
@@ -31,10 +500,32 @@ def test_files():
 
 @app.route('/<filename>')
 def serve_json_file(filename):
-    """Sirve archivos JSON estáticos"""
-    if filename in [Config.DEFAULT_TREE_FILE, Config.DEFAULT_LOCAL_JSON]:
-        return send_from_directory('.', filename)
-    return "Archivo no encontrado", 404
+    """
+    Sirve archivos JSON estáticos, comprimidos según Accept-Encoding, con
+    ETag fuerte (304 si no cambiaron) y caché larga para URLs versionadas (?v=).
+    """
+    asset = static_assets.get(filename)
+    if asset is None:
+        return "Archivo no encontrado", 404
+
+    encoding = choose_encoding(request.accept_encodings, list(asset.variants))
+    if etag_matches(request.headers.get('If-None-Match'), asset):
+        response = app.response_class(status=304)
+    elif encoding:
+        response = send_file(asset.variants[encoding], mimetype='application/json',
+                             etag=False, conditional=False, max_age=None)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(asset.path, mimetype='application/json',
+                             etag=False, conditional=False, max_age=None)
+
+    response.headers['ETag'] = asset.etag(encoding)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if request.args.get('v') == asset.version:
+        response.headers['Cache-Control'] = f'public, max-age={Config.STATIC_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/query_bipm', methods=['POST'])
 def query_bipm_api():
@@ -43,48 +534,141 @@ def query_bipm_api():
     guarda la respuesta y devuelve la lista de tablas encontradas.
     """
     payload = request.get_json()
-    bipm_url = "https://www.bipm.org/api/kcdb/cmc/searchData/physics"
-    headers = {"Content-Type": "application/json"}
-
-    try:
-        # 1. Realizar la consulta a la API del BIPM
-        response = requests.post(bipm_url, headers=headers, json=payload)
-        response.raise_for_status()  # Lanza un error si la respuesta no es 2xx
-        data = response.json()
-
-        # 2. Guardar la respuesta en un archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"responses/kcdb_response_{timestamp}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-
-        # 3. Buscar tablas de incertidumbre en la respuesta
-        tables_found = []
-        if 'data' in data and isinstance(data['data'], list):
-            for record in data['data']:
-                if (isinstance(record, dict) and 
-                    'uncertaintyTable' in record and 
-                    record['uncertaintyTable'].get('tableContents') and
-                    record['uncertaintyTable']['tableContents'] != '<masked>'):
-                    
-                    tables_found.append({
-                        "id": record.get('id'),
-                        "kcdbCode": record.get('kcdbCode', 'N/A'),
-                        "quantityValue": record.get('quantityValue', 'N/A')
-                    })
+
+    try:
+        # 1. Consultar la API del BIPM (o la caché) y guardar la respuesta
+        entry, cache_state = cached_query(payload, "kcdb_response")
+        filename = entry["filename"]
+
+        # 2. Tablas de incertidumbre encontradas en la respuesta
+        tables_found = entry["tables"]
         
-        return jsonify({
+        return cache_headers(jsonify({
             "success": True,
             "message": f"Respuesta guardada en '{filename}'",
             "filename": filename,
             "tables": tables_found
-        })
+        }), entry, cache_state)
 
     except requests.exceptions.RequestException as e:
         return jsonify({"success": False, "message": f"Error de red o API: {e}"}), 500
     except Exception as e:
         return jsonify({"success": False, "message": f"Error inesperado: {e}"}), 500
 
+def load_saved_tables(filename, table_ids):
+    """
+    Devuelve {table_id: tableContents} para los IDs pedidos que existan en el
+    archivo guardado, leyendo solo esas tablas a través del índice lateral.
+    """
+    with stages().time('table_load'):
+        return response_store.get_tables(filename, set(table_ids))
+
+@app.route('/api/query_bipm/stream', methods=['POST'])
+def query_bipm_stream():
+    """
+    Variante en streaming de /api/query_bipm: devuelve los registros como
+    NDJSON (un registro por línea) a medida que llegan las páginas de la API.
+    El total de elementos va en la cabecera X-Total-Elements.
+    """
+    upstream_payload, all_pages = normalize_query(request.get_json())
+    st = stages()
+
+    try:
+        with st.time('upstream_fetch'):
+            pages = iter_result_pages(upstream_payload, all_pages)
+            first = next(pages)
+            # Claves que la API manda antes de "data" (el total, si viene primero)
+            head = first.head()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return jsonify({"success": False, "message": f"Error de red o API: {e}"}), 500
+
+    def generate():
+        for page in st.timed(itertools.chain([first], pages), 'upstream_fetch'):
+            for record in st.timed(page, 'upstream_fetch'):
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+            st.move('upstream_fetch', 'json_parse', page.parse_seconds)
+            st.count('upstream_bytes', page.bytes)
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    total = head.get('totalElements')
+    if total is not None:
+        response.headers['X-Total-Elements'] = str(min(int(total), Config.UPSTREAM_MAX_RECORDS) if all_pages else total)
+    return response
+
+@app.route('/api/options', methods=['GET'])
+def cascade_options():
+    """
+    Opciones disponibles (y cantidad de caminos del árbol) para cada uno de
+    los selects de la cascada, dada la selección actual pasada como
+    parámetros de la URL (?countryValue=...&serviceValue=...).
+    """
+    if not ready.is_set():
+        return not_ready()
+    if category_tree is None:
+        return jsonify({"success": False, "message": f"Árbol no disponible: {Config.DEFAULT_TREE_FILE}"}), 404
+
+    selections = [request.args.get(f) or None for f in Config.CASCADE_FIELDS]
+    selections, levels = category_tree.options(selections)
+    return jsonify({
+        "success": True,
+        "fields": Config.CASCADE_FIELDS,
+        "selections": selections,
+        "options": [[{"value": v, "count": c} for v, c in opts] for opts in levels]
+    })
+
+@app.route('/api/local/query', methods=['POST'])
+def local_query():
+    """
+    Filtra el dataset local por los campos de la cascada usando el índice
+    del servidor y devuelve solo la página pedida de registros coincidentes.
+    """
+    if not ready.is_set():
+        return not_ready()
+    if local_index is None:
+        return jsonify({"success": False, "message": f"Dataset local no disponible: {Config.DEFAULT_LOCAL_JSON}"}), 404
+
+    req_data = request.get_json() or {}
+    try:
+        page = max(int(req_data.get('page', 0)), 0)
+        page_size = int(req_data.get('pageSize', Config.LOCAL_QUERY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "page/pageSize inválidos."}), 400
+    page_size = min(max(page_size, 1), Config.LOCAL_QUERY_MAX_PAGE_SIZE)
+
+    filters = {f: req_data[f] for f in Config.CASCADE_FIELDS if req_data.get(f)}
+    with stages().time('index_query'):
+        result = local_index.query(filters, page=page, page_size=page_size)
+    return jsonify(result)
+
+@app.route('/api/search', methods=['POST'])
+def text_search():
+    """
+    Búsqueda de texto libre ("q") en los registros del dataset local y de
+    las respuestas guardadas, con los filtros de la cascada. Devuelve una
+    página ordenada por relevancia y las facetas de la cascada.
+    """
+    if not ready.is_set():
+        return not_ready()
+
+    req_data = request.get_json() or {}
+    text = req_data.get('q') or ''
+    match = req_data.get('match', 'all')
+    if not isinstance(text, str) or match not in ('all', 'any'):
+        return jsonify({"success": False, "message": "q/match inválidos."}), 400
+    try:
+        page = max(int(req_data.get('page', 0)), 0)
+        page_size = int(req_data.get('pageSize', Config.LOCAL_QUERY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "page/pageSize inválidos."}), 400
+    page_size = min(max(page_size, 1), Config.LOCAL_QUERY_MAX_PAGE_SIZE)
+
+    filters = {f: req_data[f] for f in Config.CASCADE_FIELDS if req_data.get(f)}
+    refresh_search_index()
+    with stages().time('index_query'):
+        result = search_index.search(text, filters, page=page, page_size=page_size,
+                                     match_all=(match == 'all'), facet_size=Config.SEARCH_FACET_SIZE)
+    return jsonify(result)
+
 @app.route('/api/lookup', methods=['POST'])
 def lookup_uncertainty():
     """
@@ -101,24 +685,19 @@ def lookup_uncertainty():
         return jsonify({"success": False, "message": "Faltan parámetros en la solicitud."}), 400
 
     try:
-        # 1. Cargar el archivo JSON guardado
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # 2. Encontrar la tabla correcta por su ID
-        target_record = None
-        for record in data.get('data', []):
-            if record.get('id') == table_id:
-                target_record = record
-                break
-        
-        if not target_record:
+        # 1. Cargar la tabla correcta del archivo guardado
+        tables = load_saved_tables(filename, [table_id])
+        if table_id not in tables:
             return jsonify({"success": False, "message": f"No se encontró la tabla con ID {table_id}"}), 404
 
-        table_contents_str = target_record['uncertaintyTable']['tableContents']
+        table_contents_str = tables[table_id]
 
-        # 3. Ejecutar la función de búsqueda de todojunto.py
-        result = lookup_tableContents_raw(voltage_query, frequency_query, table_contents_str)
+        # 2. Compilar la tabla (o tomarla de la caché) y buscar el punto
+        st = stages()
+        with st.time('table_compile'):
+            table = compile_tableContents(table_contents_str)
+        with st.time('table_lookup'):
+            result = lookup_compiled(table, voltage_query, frequency_query)
 
         return jsonify({"success": True, "result": result})
 
@@ -127,48 +706,200 @@ def lookup_uncertainty():
     except Exception as e:
         return jsonify({"success": False, "message": f"Error durante la búsqueda: {e}"}), 500
 
+@app.route('/api/lookup/batch', methods=['POST'])
+def lookup_uncertainty_batch():
+    """
+    Evalúa muchos puntos (voltaje, frecuencia) en una sola solicitud, contra
+    una o varias tablas del mismo archivo guardado. Cada tabla se carga y
+    compila una vez; los resultados vuelven en el orden de entrada.
+    """
+    req_data = request.get_json()
+    filename = req_data.get('filename')
+    points = req_data.get('points')
+
+    if not filename or not isinstance(points, list):
+        return jsonify({"success": False, "message": "Faltan parámetros en la solicitud."}), 400
+
+    try:
+        table_ids = req_data.get('table_ids')
+        if table_ids is None and req_data.get('table_id') is not None:
+            table_ids = [req_data.get('table_id')]
+        default_ids = [int(t) for t in (table_ids or [])]
+
+        table_ids = list(default_ids)
+        normalized = []
+        for point in points:
+            if isinstance(point, dict) and point.get('table_id') is not None:
+                point = dict(point, table_id=int(point['table_id']))
+                table_ids.append(point['table_id'])
+            normalized.append(point)
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": f"table_id inválido: {e}"}), 400
+
+    if not table_ids:
+        return jsonify({"success": False, "message": "Faltan parámetros en la solicitud."}), 400
+
+    try:
+        tables = load_saved_tables(filename, table_ids)
+        # Los IDs ausentes en el archivo se informan como error por punto
+        requested = {t: tables.get(t) for t in table_ids}
+        with stages().time('table_lookup'):
+            results = lookup_many(normalized, requested, default_ids)
+
+        return jsonify({"success": True, "results": results})
+
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": f"Archivo no encontrado: {filename}"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error durante la búsqueda: {e}"}), 500
+
+@app.route('/api/lookup/grid', methods=['POST'])
+def lookup_uncertainty_grid():
+    """
+    Evalúa una tabla sobre un barrido completo de voltajes x frecuencias y
+    devuelve la superficie de incertidumbre como una grilla 2-D compacta
+    (null donde la tabla no tiene valor).
+    """
+    req_data = request.get_json()
+    filename = req_data.get('filename')
+    table_id = req_data.get('table_id')
+    voltages = req_data.get('voltages')
+    frequencies = req_data.get('frequencies')
+
+    if not all([filename, table_id, voltages, frequencies]):
+        return jsonify({"success": False, "message": "Faltan parámetros en la solicitud."}), 400
+
+    try:
+        table_id = int(table_id)
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": f"Parámetros inválidos: {e}"}), 400
+
+    try:
+        tables = load_saved_tables(filename, [table_id])
+        if table_id not in tables:
+            return jsonify({"success": False, "message": f"No se encontró la tabla con ID {table_id}"}), 404
+
+        # Los barridos se interpretan en las unidades de los ejes de la tabla
+        st = stages()
+        with st.time('table_compile'):
+            table = compile_tableContents(tables[table_id])
+        try:
+            xv = sweep_values(voltages, table.x_base, Config.GRID_MAX_POINTS)
+            yv = sweep_values(frequencies, table.y_base, Config.GRID_MAX_POINTS)
+        except (TypeError, ValueError, KeyError) as e:
+            return jsonify({"success": False, "message": f"Parámetros inválidos: {e}"}), 400
+
+        with st.time('table_lookup'):
+            grid = lookup_grid(xv, yv, tables[table_id])
+        rows = [[None if z != z else z for z in row] for row in grid.tolist()]
+
+        return jsonify({
+            "success": True,
+            "voltages": xv.tolist(),
+            "frequencies": yv.tolist(),
+            "grid": rows
+        })
+
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": f"Archivo no encontrado: {filename}"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error durante la búsqueda: {e}"}), 500
+
+# Índices de las respuestas guardadas usadas en /api/best_cmc (archivo -> LocalIndex)
+SAVED_INDEXES_SIZE = 8
+saved_indexes = OrderedDict()
+_saved_indexes_lock = threading.Lock()
+
+def saved_response_index(filename):
+    """LocalIndex sobre los registros de una respuesta guardada (los archivos no cambian: se cachea)."""
+    with _saved_indexes_lock:
+        index = saved_indexes.get(filename)
+        if index is not None:
+            saved_indexes.move_to_end(filename)
+            return index
+    index = LocalIndex(response_store.iter_records(filename))
+    with _saved_indexes_lock:
+        saved_indexes[filename] = index
+        while len(saved_indexes) > SAVED_INDEXES_SIZE:
+            saved_indexes.popitem(last=False)
+    return index
+
+@app.route('/api/best_cmc', methods=['POST'])
+def best_cmc_search():
+    """
+    Mejor CMC: las k tablas con menor incertidumbre en un punto o rango de
+    voltaje y frecuencia, entre los registros del dataset local (o de una
+    respuesta guardada, con "filename") que cumplen los filtros de la cascada.
+    """
+    req_data = request.get_json() or {}
+    voltage = req_data.get('voltage')
+    frequency = req_data.get('frequency')
+    filename = req_data.get('filename')
+
+    if voltage is None or frequency is None:
+        return jsonify({"success": False, "message": "Faltan parámetros en la solicitud."}), 400
+    try:
+        k = int(req_data.get('k', Config.BEST_CMC_RESULTS))
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": f"Parámetros inválidos: {e}"}), 400
+    k = min(max(k, 1), Config.BEST_CMC_MAX_RESULTS)
+    filters = {f: req_data[f] for f in Config.CASCADE_FIELDS if req_data.get(f)}
+
+    st = stages()
+    if filename:
+        try:
+            with st.time('table_load'):
+                index = saved_response_index(filename)
+        except FileNotFoundError:
+            return jsonify({"success": False, "message": f"Archivo no encontrado: {filename}"}), 404
+    else:
+        if not ready.is_set():
+            return not_ready()
+        if local_index is None:
+            return jsonify({"success": False, "message": f"Dataset local no disponible: {Config.DEFAULT_LOCAL_JSON}"}), 404
+        index = local_index
+
+    try:
+        with st.time('table_lookup'):
+            results, stats = best_cmc(index, voltage, frequency, filters, k,
+                                      processes=Config.BEST_CMC_PROCESSES,
+                                      parallel_min=Config.BEST_CMC_PARALLEL_MIN)
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({"success": False, "message": f"Parámetros inválidos: {e}"}), 400
+
+    return jsonify(dict(stats, success=True, results=results))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return Response(REGISTRY.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """Estadísticas de latencia y errores de las llamadas a la API del BIPM."""
+    return jsonify({"success": True, "stats": upstream_stats_summary()})
+
 @app.route('/api/advanced_search', methods=['POST'])
 def advanced_search_api():
     """
     Endpoint para búsqueda avanzada con múltiples parámetros.
     """
     payload = request.get_json()
-    bipm_url = "https://www.bipm.org/api/kcdb/cmc/searchData/physics"
-    headers = {"Content-Type": "application/json"}
-
-    try:
-        # 1. Realizar la consulta a la API del BIPM con parámetros avanzados
-        response = requests.post(bipm_url, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-
-        # 2. Guardar la respuesta en un archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"responses/advanced_search_{timestamp}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-
-        # 3. Buscar tablas de incertidumbre en la respuesta
-        tables_found = []
-        if 'data' in data and isinstance(data['data'], list):
-            for record in data['data']:
-                if (isinstance(record, dict) and 
-                    'uncertaintyTable' in record and 
-                    record['uncertaintyTable'].get('tableContents') and
-                    record['uncertaintyTable']['tableContents'] != '<masked>'):
-                    
-                    tables_found.append({
-                        "id": record.get('id'),
-                        "kcdbCode": record.get('kcdbCode', 'N/A'),
-                        "quantityValue": record.get('quantityValue', 'N/A')
-                    })
+
+    try:
+        # 1. Consultar la API del BIPM (o la caché) con parámetros avanzados
+        entry, cache_state = cached_query(payload, "advanced_search")
+        filename = entry["filename"]
+
+        # 2. Tablas de incertidumbre encontradas en la respuesta
+        tables_found = entry["tables"]
         
-        return jsonify({
+        return cache_headers(jsonify({
             "success": True,
             "message": f"Búsqueda avanzada completada. Respuesta guardada en '{filename}'",
             "filename": filename,
             "tables": tables_found
-        })
+        }), entry, cache_state)
 
     except requests.exceptions.RequestException as e:
         return jsonify({"success": False, "message": f"Error de red o API: {e}"}), 500
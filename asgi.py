@@ -0,0 +1,357 @@
+"""
+Modo de servicio async (ASGI) de la app.
+
+    uvicorn asgi:app --workers 4 --host 0.0.0.0 --port $PORT
+
+En el modo WSGI (gunicorn) cada consulta a la API del KCDB ocupa un worker
+durante toda la ida y vuelta. Acá las rutas que esperan a la API
+(/api/query_bipm, /api/advanced_search y /api/query_bipm/stream) se
+atienden en el event loop con el cliente async (async_upstream.py): la
+espera no ocupa hilos, y el parseo de las páginas y la escritura en el
+almacén corren en un pool de hilos de E/S.
+
+Las búsquedas en tablas (/api/lookup* y /api/best_cmc) ejecutan las vistas de Flask en un
+pool de hilos propio, así una tanda de consultas lentas no las demora. El
+resto de las rutas (páginas, JSON estáticos, opciones, dataset local,
+métricas) pasan tal cual a la app Flask de app.py. Los contratos JSON, la
+caché de respuestas, el almacén y las métricas son los mismos que en el
+modo WSGI. Las consultas idénticas simultáneas se resuelven una sola vez
+dentro del proceso (no entre workers, como hace el lock de archivo del
+modo WSGI).
+"""
+
+import io
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import app as wsgi
+from config import Config
+from json_stream import CHUNK_SIZE
+from metrics import Stages
+from response_cache import payload_key, HIT, STALE, MISS, COALESCED
+from async_upstream import AsyncUpstreamClient, UPSTREAM_ERRORS
+
+upstream_client = AsyncUpstreamClient.from_config()
+wsgi.register_upstream_client(lambda: upstream_client)
+
+# Parseo/escritura de respuestas y rutas de Flask; búsquedas en tablas aparte
+io_pool = ThreadPoolExecutor(Config.ASYNC_IO_WORKERS, thread_name_prefix='asgi-io')
+lookup_pool = ThreadPoolExecutor(Config.ASYNC_LOOKUP_WORKERS, thread_name_prefix='asgi-lookup')
+
+LOOKUP_ROUTES = {'/api/lookup', '/api/lookup/batch', '/api/lookup/grid', '/api/best_cmc'}
+
+# Rutas de consulta atendidas en el event loop: prefijo del archivo guardado y mensaje
+QUERY_ROUTES = {
+    '/api/query_bipm': ("kcdb_response", "Respuesta guardada en '{}'"),
+    '/api/advanced_search': ("advanced_search", "Búsqueda avanzada completada. Respuesta guardada en '{}'"),
+}
+STREAM_ROUTE = '/api/query_bipm/stream'
+
+# Consultas a la API en curso en este proceso: clave de caché -> tarea compartida
+_inflight = {}
+
+
+async def in_pool(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+# --- Consultas a la API -----------------------------------------------------
+
+async def iter_result_pages(upstream_payload, all_pages):
+    """Versión async de app.iter_result_pages."""
+    if all_pages:
+        pages = upstream_client.iter_page_streams(upstream_payload)
+        try:
+            async for page in pages:
+                yield page
+        finally:
+            await pages.aclose()
+    else:
+        page = await upstream_client.stream(upstream_payload)
+        try:
+            yield page
+        finally:
+            page.close()
+
+
+def save_page(page, tables_found, filename):
+    """
+    Lee una página y guarda sus registros en el almacén, fijados para el
+    manifiesto `filename` (corre en io_pool); devuelve sus entradas.
+    """
+    def records():
+        for record in page:
+            info = wsgi.table_info(record)
+            if info is not None:
+                tables_found.append(info)
+            yield record
+
+    return wsgi.response_store.put_records(records(), pin=filename)
+
+
+async def fetch_and_save(payload, prefix, st):
+    """Versión async de app.fetch_and_save: mismo manifiesto y mismas tablas."""
+    upstream_payload, all_pages = wsgi.normalize_query(payload)
+    filename = wsgi.snapshot_filename(prefix)
+    tables_found, entries, first_meta = [], [], None
+
+    pages = iter_result_pages(upstream_payload, all_pages)
+    try:
+        while True:
+            with st.time('upstream_fetch'):
+                try:
+                    page = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+            with st.time('file_write'):
+                entries.extend(await in_pool(io_pool, save_page, page, tables_found, filename))
+            st.move('file_write', 'json_parse', page.parse_seconds)
+            st.count('upstream_bytes', page.bytes)
+            if first_meta is None:
+                first_meta = page.meta
+        with st.time('file_write'):
+            await in_pool(io_pool, wsgi.save_snapshot, filename, entries, first_meta)
+    finally:
+        await pages.aclose()
+        wsgi.response_store.unpin(filename)
+    return {"filename": filename, "tables": tables_found}
+
+
+async def _fetch_and_cache(key, payload, prefix, st):
+    entry = await fetch_and_save(payload, prefix, st)
+    return await in_pool(io_pool, wsgi.response_cache.put, key, entry)
+
+
+def _ignore_result(task):
+    # Una revalidación en segundo plano que falla deja la entrada vieja
+    if not task.cancelled():
+        task.exception()
+
+
+def start_fetch(key, payload, prefix, st):
+    """(tarea, compartida): la consulta en curso para `key`, o una nueva."""
+    task = _inflight.get(key)
+    if task is not None:
+        return task, True
+    task = asyncio.ensure_future(_fetch_and_cache(key, payload, prefix, st))
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task, False
+
+
+async def cached_query(payload, prefix, st):
+    """Versión async de app.cached_query: (entrada, estado de caché)."""
+    upstream_payload, all_pages = wsgi.normalize_query(payload)
+    key = payload_key(dict(upstream_payload, allPages=all_pages))
+    entry, state = await in_pool(io_pool, wsgi.response_cache.get, key)
+    if state == STALE:
+        task, _ = start_fetch(key, payload, prefix, Stages())
+        task.add_done_callback(_ignore_result)
+    elif state != HIT:
+        task, shared = start_fetch(key, payload, prefix, st)
+        entry = await asyncio.shield(task)
+        state = COALESCED if shared else MISS
+    wsgi.RESPONSE_CACHE_RESULTS.inc(result=state)
+    return entry, state
+
+
+# --- ASGI -------------------------------------------------------------------
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _headers(pairs):
+    return [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in pairs]
+
+
+async def send_json(send, status, data, headers=()):
+    body = json.dumps(data).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': _headers([('Content-Type', 'application/json'),
+                                     ('Content-Length', len(body)), *headers])})
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def query_route(send, path, payload, st):
+    """/api/query_bipm y /api/advanced_search."""
+    prefix, message = QUERY_ROUTES[path]
+    try:
+        entry, cache_state = await cached_query(payload, prefix, st)
+    except UPSTREAM_ERRORS as e:
+        return await send_json(send, 500, {"success": False, "message": f"Error de red o API: {e}"})
+    except Exception as e:
+        return await send_json(send, 500, {"success": False, "message": f"Error inesperado: {e}"})
+
+    filename = entry["filename"]
+    return await send_json(send, 200, {
+        "success": True,
+        "message": message.format(filename),
+        "filename": filename,
+        "tables": entry["tables"]
+    }, headers=[('X-Cache', cache_state), ('Age', wsgi.response_cache.age(entry)),
+                ('Server-Timing', st.server_timing())])
+
+
+def ndjson(page):
+    return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in page).encode('utf-8')
+
+
+async def query_stream_route(send, payload, st):
+    """/api/query_bipm/stream: NDJSON página por página, con X-Total-Elements."""
+    upstream_payload, all_pages = wsgi.normalize_query(payload)
+    pages = iter_result_pages(upstream_payload, all_pages)
+    try:
+        with st.time('upstream_fetch'):
+            page = await pages.__anext__()
+            head = page.head()
+    except (*UPSTREAM_ERRORS, ValueError) as e:
+        await pages.aclose()
+        return await send_json(send, 500, {"success": False, "message": f"Error de red o API: {e}"})
+
+    headers = [('Content-Type', 'application/x-ndjson')]
+    total = head.get('totalElements')
+    if total is not None:
+        headers.append(('X-Total-Elements', min(int(total), Config.UPSTREAM_MAX_RECORDS) if all_pages else total))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': _headers(headers)})
+    try:
+        while page is not None:
+            with st.time('upstream_fetch'):
+                body = await in_pool(io_pool, ndjson, page)
+            st.move('upstream_fetch', 'json_parse', page.parse_seconds)
+            st.count('upstream_bytes', page.bytes)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            with st.time('upstream_fetch'):
+                page = await pages.__anext__()
+    except StopAsyncIteration:
+        pass
+    except (*UPSTREAM_ERRORS, ValueError) as e:
+        # Ya se mandó el 200: la respuesta queda cortada, como en el modo WSGI
+        wsgi.logger.warning("Stream de %s cortado: %s", STREAM_ROUTE, e)
+    finally:
+        await pages.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+    return 200
+
+
+def wsgi_environ(scope, body):
+    """Entorno WSGI equivalente a una solicitud HTTP de ASGI."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _next_block(chunks):
+    """Junta bloques del cuerpo WSGI hasta CHUNK_SIZE: (bytes, terminó)."""
+    out, size = [], 0
+    for chunk in chunks:
+        out.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            return b''.join(out), False
+    return b''.join(out), True
+
+
+async def call_flask(scope, receive, send, pool):
+    """Atiende la solicitud con la app Flask en `pool` (hooks, métricas y cabeceras incluidos)."""
+    environ = wsgi_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    def begin():
+        result = wsgi.app(environ, start_response)
+        return result, iter(result)
+
+    result, chunks = await in_pool(pool, begin)
+    try:
+        await send({'type': 'http.response.start', 'status': started['status'],
+                    'headers': _headers(started['headers'])})
+        done = False
+        while not done:
+            body, done = await in_pool(pool, _next_block, chunks)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': not done})
+    finally:
+        close = getattr(result, 'close', None)
+        if close is not None:
+            await in_pool(pool, close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await upstream_client.aclose()
+            io_pool.shutdown(wait=False)
+            lookup_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    path, method = scope['path'], scope['method']
+    if method != 'POST' or (path not in QUERY_ROUTES and path != STREAM_ROUTE):
+        pool = lookup_pool if path in LOOKUP_ROUTES else io_pool
+        return await call_flask(scope, receive, send, pool)
+
+    start = time.perf_counter()
+    st = Stages()
+    status = 500
+    try:
+        body = await read_body(receive)
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            status = await send_json(send, 400, {"success": False, "message": "JSON inválido."})
+            return
+        if path == STREAM_ROUTE:
+            status = await query_stream_route(send, payload, st)
+        else:
+            status = await query_route(send, path, payload, st)
+    finally:
+        wsgi.observe_request(path, method, status, time.perf_counter() - start, st)
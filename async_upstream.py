@@ -0,0 +1,181 @@
+"""
+Cliente async hacia la API del KCDB, para el modo de servicio ASGI (asgi.py).
+
+Misma política que UpstreamClient (timeouts, reintentos con backoff y
+jitter, límite de concurrencia y de tasa, estadísticas) pero sobre
+httpx.AsyncClient: mientras se espera a la API no se ocupa ningún hilo, así
+que un proceso puede tener cientos de consultas en vuelo. Cada página se
+baja a un archivo temporal (en memoria si es chica) y se entrega como un
+ArrayStream; su parseo lo hace quien la consume, fuera del event loop.
+"""
+
+import time
+import asyncio
+import tempfile
+from collections import deque
+
+import httpx
+
+from config import Config
+from json_stream import CHUNK_SIZE
+from upstream import _ClientBase, UpstreamBusy, RETRY_STATUS, SPOOL_MAX_BYTES
+
+# Errores de la API que las rutas informan como "Error de red o API"
+UPSTREAM_ERRORS = (httpx.HTTPError, UpstreamBusy)
+
+
+def _drain(stream):
+    for _ in stream:
+        pass
+
+
+class AsyncUpstreamClient(_ClientBase):
+    def __init__(self, url=None, connect_timeout=5.0, read_timeout=60.0, retries=2,
+                 backoff=0.5, max_backoff=10.0, pool_size=100, max_concurrency=256,
+                 queue_timeout=None, stats_window=1000, rate_limit=None):
+        super().__init__(url, connect_timeout, read_timeout, retries, backoff, max_backoff,
+                         queue_timeout, stats_window, rate_limit)
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        # El cliente httpx y el semáforo pertenecen a un event loop: se crean en el primer uso
+        self._loop = None
+        self._http = None
+        self._slots = None
+
+    @classmethod
+    def from_config(cls):
+        """Crea el cliente con los parámetros de Config."""
+        return cls(
+            connect_timeout=Config.UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout=Config.UPSTREAM_READ_TIMEOUT,
+            retries=Config.UPSTREAM_RETRIES,
+            backoff=Config.UPSTREAM_BACKOFF,
+            pool_size=Config.ASYNC_UPSTREAM_POOL_SIZE,
+            max_concurrency=Config.ASYNC_UPSTREAM_MAX_CONCURRENCY,
+            rate_limit=Config.UPSTREAM_RATE_LIMIT,
+        )
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            connect, read = self.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                headers={"Content-Type": "application/json"},
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+        self._loop = self._http = self._slots = None
+
+    async def _spool_once(self, http, target, payload):
+        """Un intento: (código de estado, archivo temporal con el cuerpo, o la respuesta si es un error)."""
+        async with http.stream('POST', target, json=payload) as response:
+            if response.status_code >= 400:
+                return response.status_code, response
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    spool.write(chunk)
+            except BaseException:
+                spool.close()
+                raise
+            spool.seek(0)
+            return response.status_code, spool
+
+    async def spool(self, payload, url=None):
+        """
+        Envía el payload por POST y devuelve el cuerpo de la respuesta en un
+        archivo temporal (posicionado al inicio). Lanza httpx.HTTPError si
+        se agotan los reintentos, o UpstreamBusy si no hubo lugar a tiempo.
+        """
+        http = self._bind()
+        target = self._target(url)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._count("busy")
+            raise UpstreamBusy("Demasiadas consultas simultáneas a la API")
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            attempt = 0
+            while True:
+                if self._rate is not None:
+                    await asyncio.sleep(self._rate.reserve())
+                try:
+                    status, body = await self._spool_once(http, target, payload)
+                    if status < 400:
+                        ok = True
+                        return body
+                    if status not in RETRY_STATUS or attempt >= self.retries:
+                        body.raise_for_status()
+                except httpx.TransportError:
+                    if attempt >= self.retries:
+                        raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(self._retry_delay(attempt - 1))
+        finally:
+            self._slots.release()
+            self._record(time.perf_counter() - start, ok)
+
+    async def stream(self, payload, url=None, limit=None):
+        """Consulta searchData y devuelve un ArrayStream sobre el cuerpo ya bajado."""
+        return self._spooled_stream(await self.spool(payload, url=url), limit)
+
+    async def iter_page_streams(self, payload, page_size=None, workers=None, max_records=None):
+        """
+        Versión async de UpstreamClient.iter_page_streams: entrega las
+        páginas en orden, cada una como un ArrayStream, con hasta `workers`
+        páginas pedidas por adelantado.
+        """
+        page_size = page_size or Config.UPSTREAM_PAGE_SIZE
+        workers = workers or Config.UPSTREAM_PAGE_WORKERS
+        max_records = max_records or Config.UPSTREAM_MAX_RECORDS
+        base = {k: v for k, v in payload.items() if k not in ('page', 'pageSize')}
+
+        def page_payload(page):
+            return dict(base, page=page, pageSize=page_size)
+
+        loop = asyncio.get_running_loop()
+        first = await self.stream(page_payload(0), limit=max_records)
+        try:
+            yield first
+            # Se termina de recorrer (fuera del loop) lo que el consumidor no
+            # leyó, para llegar a las claves que vienen después de "data"
+            await loop.run_in_executor(None, _drain, first)
+        finally:
+            first.close()
+        total, n_pages = self._page_count(first, page_size, max_records)
+        if n_pages <= 1:
+            return
+
+        pending = deque()
+        try:
+            next_page = 1
+            while next_page < n_pages and len(pending) < workers:
+                pending.append((next_page, asyncio.ensure_future(self.spool(page_payload(next_page)))))
+                next_page += 1
+            while pending:
+                page, task = pending.popleft()
+                spool = await task
+                if next_page < n_pages:
+                    pending.append((next_page, asyncio.ensure_future(self.spool(page_payload(next_page)))))
+                    next_page += 1
+                page_stream = self._spooled_stream(spool, total - page * page_size)
+                try:
+                    yield page_stream
+                finally:
+                    page_stream.close()
+        finally:
+            for _, task in pending:
+                task.cancel()
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    task.result().close()
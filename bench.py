@@ -0,0 +1,396 @@
+"""
+Benchmarks de los caminos calientes: parseo de unidades, compilación y
+búsqueda en tablas de incertidumbre, la búsqueda de texto con facetas, y
+las rutas /api/lookup y de consulta a través del cliente de pruebas de
+Flask contra un KCDB local (kcdb_stub).
+
+Las tablas y las respuestas guardadas son sintéticas, con tamaños parecidos
+a los del KCDB. Por cada benchmark se informan ops/s, latencia p50/p99 y
+memoria pico (tracemalloc, en una pasada aparte para no afectar los
+tiempos), y se comparan con la línea base guardada en bench_baseline.json.
+
+Uso:
+    python bench.py                     # corre todo y compara con la línea base
+    python bench.py --quick             # menos iteraciones (humo)
+    python bench.py --only lookup       # solo los benchmarks cuyo nombre contiene "lookup"
+    python bench.py --save-baseline     # guarda los resultados como nueva línea base
+    python bench.py --strict            # sale con código 1 si hay regresiones
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+from config import Config
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# Una caída de ops/s mayor a esta fracción respecto de la línea base es regresión
+DEFAULT_TOLERANCE = 0.25
+
+# (filas, columnas) de las tablas sintéticas
+TABLE_SIZES = {"small": (8, 4), "medium": (40, 12), "large": (200, 40)}
+
+V_STEPS = [(1, "mV"), (10, "mV"), (100, "mV"), (1, "V"), (10, "V"), (100, "V"), (1, "kV")]
+F_STEPS = [(10, "Hz"), (40, "Hz"), (1, "kHz"), (10, "kHz"), (20, "kHz"), (50, "kHz"),
+           (100, "kHz"), (300, "kHz"), (500, "kHz"), (1, "MHz"), (10, "MHz"), (30, "MHz")]
+
+
+# --- Datos sintéticos -------------------------------------------------------
+
+def frequency_label(col):
+    """Etiqueta de la columna `col` (desde 0) de las tablas sintéticas."""
+    value, unit = F_STEPS[col % len(F_STEPS)]
+    return f"{value * (1 + col // len(F_STEPS))} {unit}"
+
+
+def synthetic_table(n_rows, n_cols, seed=0):
+    """String tableContents con `n_rows` rangos de tensión y `n_cols` frecuencias."""
+    rng = random.Random(seed)
+    table = {"row_1": {"col_1": "Voltage"}}
+    for c in range(n_cols):
+        table["row_1"][f"col_{c + 2}"] = frequency_label(c)
+    for r in range(n_rows):
+        lo, hi = sorted(rng.sample(range(len(V_STEPS)), 2))
+        start, end = V_STEPS[lo], V_STEPS[hi]
+        row = {"col_1": f"{start[0]} {start[1]} to {end[0]} {end[1]}"}
+        for c in range(n_cols):
+            row[f"col_{c + 2}"] = "-" if rng.random() < 0.1 else str(rng.randint(1, 500))
+        table[f"row_{r + 2}"] = row
+    return json.dumps(table)
+
+
+def synthetic_records(n, size="medium", seed=0):
+    """Registros con la forma de searchData, cada uno con su tabla de incertidumbre."""
+    rng = random.Random(seed)
+    n_rows, n_cols = TABLE_SIZES[size]
+    countries = ["AR", "BR", "DE", "FR", "US", "JP", "MX", "ES"]
+    services = ["DC voltage", "AC voltage", "AC current", "Resistance"]
+    return [{
+        "id": i + 1,
+        "kcdbCode": f"EM-{countries[i % len(countries)]}-{i + 1:05d}",
+        "metrologyAreaLabel": "EM",
+        "countryValue": countries[i % len(countries)],
+        "serviceValue": services[i % len(services)],
+        "quantityValue": "Voltage",
+        "instrument": rng.choice(["Multimeter", "Calibrator", "Thermal converter"]),
+        "uncertaintyTable": {"tableContents": synthetic_table(n_rows, n_cols, seed=seed + i)},
+    } for i in range(n)]
+
+
+def synthetic_text_records(n, seed=0):
+    """Registros sin tabla con los campos de texto y de la cascada que indexa search_index."""
+    rng = random.Random(seed)
+    countries = ["AR", "BR", "DE", "FR", "US", "JP", "MX", "ES", "CN", "GB", "IT", "KR"]
+    quantities = ["AC voltage", "DC voltage", "AC current", "DC current", "Resistance", "Capacitance",
+                  "Inductance", "AC power", "Impedance", "RF power", "Electric field strength"]
+    instruments = ["Multimeter", "Calibrator", "Thermal converter", "Standard resistor", "Voltage divider",
+                   "Current shunt", "Capacitance bridge", "Power meter", "Josephson array", "Inductor"]
+    methods = ["AC-DC transfer", "Direct measurement", "Comparison with reference standard",
+               "Bridge method", "Sampling wattmeter", "Quantum Hall resistance"]
+    words = ["calibration", "uncertainty", "range", "frequency", "thermal", "converter", "reference",
+             "standard", "four-terminal", "pair", "traceable", "primary", "secondary", "digital"]
+    return [{
+        "id": i + 1,
+        "kcdbCode": f"EM-{countries[i % len(countries)]}-{i + 1:06d}",
+        "metrologyAreaLabel": "EM",
+        "countryValue": countries[i % len(countries)],
+        "serviceValue": rng.choice(quantities),
+        "quantityValue": rng.choice(quantities),
+        "instrument": rng.choice(instruments),
+        "instrumentMethod": rng.choice(methods),
+        "comments": " ".join(rng.choice(words) for _ in range(rng.randrange(12))),
+    } for i in range(n)]
+
+
+def write_saved_response(store, folder, records, prefix='kcdb_response'):
+    """Guarda `records` como una respuesta (manifiesto + índice lateral) y devuelve su filename."""
+    filename = os.path.join(folder, f"{prefix}_bench_{len(records)}.json")
+    entries = store.put_records(records)
+    store.write_snapshot(filename, entries, meta={"totalElements": len(entries)})
+    return filename
+
+
+# --- Medición ---------------------------------------------------------------
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def measure(fn, iterations, warmup=3, memory_iterations=3):
+    """Corre `fn` y devuelve {ops_per_sec, p50_ms, p99_ms, peak_kb, iterations}."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(iterations / total, 2),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+        "peak_kb": round(peak / 1024, 1),
+        "iterations": iterations,
+    }
+
+
+@contextmanager
+def patched(obj, **attrs):
+    """Reemplaza atributos de un módulo/clase y los restaura al salir."""
+    old = {name: getattr(obj, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(obj, name, value)
+
+
+@contextmanager
+def app_env(records):
+    """
+    App Flask apuntada a un KCDB local que sirve `records`, con las
+    respuestas en una carpeta temporal y la caché de respuestas apagada
+    (cada consulta llega a la API). Entrega (cliente, app_module, stub).
+    """
+    import app as app_module
+    from kcdb_stub import serve
+    from response_cache import ResponseCache
+    from response_store import ResponseStore
+    from upstream import UpstreamClient
+
+    with tempfile.TemporaryDirectory() as folder, serve() as stub:
+        stub.records = records
+        store = ResponseStore(folder, snapshot_prefixes=Config.SNAPSHOT_PREFIXES)
+        with patched(Config, BIPM_API_URL=stub.url, RESPONSES_FOLDER=folder), \
+                patched(app_module,
+                        response_store=store,
+                        response_cache=ResponseCache(os.path.join(folder, 'cache'), ttl=0, stale_ttl=0),
+                        upstream_client=UpstreamClient(retries=0)):
+            yield app_module.app.test_client(), app_module, stub
+
+
+# --- Benchmarks -------------------------------------------------------------
+# Cada uno recibe `quick` y entrega (nombre, medición) por cada variante; la
+# medición es una función sin argumentos, así --only no corre lo filtrado.
+
+def bench_parse_quantity(quick):
+    from todojunto import parse_quantity
+    labels = ["0.5 V", "500mV", "10 kHz", "1,5 MHz", "100 µV", "2 kV", "700kHz", "20 Hz"]
+    bases = ["V", "V", "Hz", "Hz", "V", "V", "Hz", "Hz"]
+    pairs = list(zip(labels, bases))
+
+    def run():
+        for label, base in pairs:
+            parse_quantity(label, base)
+
+    yield "parse_quantity[x8]", lambda: measure(run, 200 if quick else 5000)
+
+
+def bench_tableContents_to_cells(quick):
+    from todojunto import tableContents_to_cells
+    for size, (n_rows, n_cols) in TABLE_SIZES.items():
+        contents = synthetic_table(n_rows, n_cols, seed=1)
+        iterations = 5 if quick else max(20, 20000 // (n_rows * n_cols))
+        yield f"tableContents_to_cells[{size}]", lambda: measure(lambda: tableContents_to_cells(contents), iterations)
+
+
+def bench_lookup_raw(quick):
+    import todojunto
+    rng = random.Random(2)
+    for size, (n_rows, n_cols) in TABLE_SIZES.items():
+        contents = synthetic_table(n_rows, n_cols, seed=1)
+        points = [(f"{rng.uniform(0.001, 1000):.4f} V", frequency_label(rng.randrange(n_cols)))
+                  for _ in range(100)]
+
+        def run():
+            for v, f in points:
+                todojunto.lookup_tableContents_raw(v, f, contents)
+
+        yield f"lookup_tableContents_raw[{size},x100]", lambda: measure(run, 10 if quick else 300)
+
+    contents = synthetic_table(*TABLE_SIZES["medium"], seed=1)
+
+    def cold():
+        todojunto.clear_table_cache()
+        todojunto.lookup_tableContents_raw("1 V", "10 kHz", contents)
+
+    yield "lookup_tableContents_raw[medium,cold]", lambda: measure(cold, 5 if quick else 200)
+
+
+def bench_api_lookup(quick):
+    records = synthetic_records(50 if quick else 500)
+    with app_env(records) as (client, app_module, _):
+        filename = write_saved_response(app_module.response_store, Config.RESPONSES_FOLDER, records)
+        ids = [r["id"] for r in records]
+        state = {"i": 0}
+
+        def run():
+            state["i"] += 1
+            response = client.post('/api/lookup', json={
+                "filename": filename, "table_id": ids[state["i"] % len(ids)],
+                "voltage": "1 V", "frequency": "10 kHz",
+            })
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        yield f"api_lookup[{len(records)} records]", lambda: measure(run, 20 if quick else 1000)
+
+
+def bench_api_query(quick):
+    n = 100 if quick else 2000
+    records = synthetic_records(n, size="small")
+    with app_env(records) as (client, _, _stub), \
+            patched(Config, UPSTREAM_PAGE_SIZE=max(n // 4, 1)):
+
+        def query():
+            response = client.post('/api/query_bipm', json={"metrologyAreaLabel": "EM"})
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        yield f"api_query_bipm[{n} records]", lambda: measure(query, 3 if quick else 20, warmup=1, memory_iterations=1)
+
+        def stream():
+            response = client.post('/api/query_bipm/stream', json={"metrologyAreaLabel": "EM"})
+            assert response.status_code == 200
+            for _ in response.response:
+                pass
+
+        yield f"api_query_bipm_stream[{n} records]", lambda: measure(stream, 3 if quick else 20, warmup=1, memory_iterations=1)
+
+
+def bench_search(quick):
+    from local_index import LocalIndex
+    from search_index import SearchIndex
+    n = 2000 if quick else 50000
+    index = SearchIndex(LocalIndex(synthetic_text_records(n)).records)
+    queries = {
+        "words": "thermal converter AC-DC transfer",
+        "prefix": "volt div",
+        "filtered": "calibrator",
+    }
+    filters = {"filtered": {"countryValue": "DE"}}
+    for kind, text in queries.items():
+        run = (lambda text=text, f=filters.get(kind): index.search(text, f, page_size=20, facet_size=50))
+        yield f"search[{kind},{n} records]", lambda run=run: measure(run, 20 if quick else 300)
+
+
+BENCHMARKS = [
+    bench_parse_quantity,
+    bench_tableContents_to_cells,
+    bench_lookup_raw,
+    bench_api_lookup,
+    bench_api_query,
+    bench_search,
+]
+
+
+def run_benchmarks(quick=False, only=None, log=print):
+    """Corre los benchmarks (filtrados por `only`) y devuelve {nombre: resultado}."""
+    results = {}
+    for bench in BENCHMARKS:
+        for name, run in bench(quick):
+            if only and only not in name:
+                continue
+            result = results[name] = run()
+            log(f"{name:45s} {result['ops_per_sec']:>12.1f} ops/s  p50 {result['p50_ms']:>9.3f} ms  "
+                f"p99 {result['p99_ms']:>9.3f} ms  pico {result['peak_kb']:>9.1f} KiB")
+    return results
+
+
+# --- Línea base ---------------------------------------------------------------
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("results", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    doc = {
+        "python": sys.version.split()[0],
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compara con la línea base. Devuelve una fila por benchmark:
+    (nombre, ops/s actual, ops/s base o None, cociente, es_regresión).
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("ops_per_sec"):
+            rows.append((name, result["ops_per_sec"], None, None, False))
+            continue
+        ratio = result["ops_per_sec"] / base["ops_per_sec"]
+        rows.append((name, result["ops_per_sec"], base["ops_per_sec"], ratio, ratio < 1 - tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de búsqueda, compilación de tablas y rutas.")
+    parser.add_argument('--quick', action='store_true', help="menos iteraciones")
+    parser.add_argument('--only', help="solo benchmarks cuyo nombre contenga este texto")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="archivo de línea base")
+    parser.add_argument('--save-baseline', action='store_true', help="guarda los resultados como línea base")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="caída de ops/s tolerada (fracción)")
+    parser.add_argument('--strict', action='store_true', help="código de salida 1 si hay regresiones")
+    parser.add_argument('--output', help="escribe los resultados en JSON en este archivo")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, only=args.only)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = load_baseline(args.baseline) if args.only else {}
+        save_baseline(dict(baseline, **results), args.baseline)
+        print(f"\nLínea base guardada en {args.baseline}")
+        return 0
+
+    rows = compare(results, load_baseline(args.baseline), args.tolerance)
+    print("\n--- Comparación con la línea base ---")
+    regressions = 0
+    for name, ops, base_ops, ratio, regressed in rows:
+        if ratio is None:
+            print(f"{name:45s} {ops:>12.1f} ops/s  (sin línea base)")
+            continue
+        mark = "REGRESIÓN" if regressed else "ok"
+        print(f"{name:45s} {ops:>12.1f} vs {base_ops:>12.1f} ops/s  x{ratio:5.2f}  {mark}")
+        regressions += regressed
+    if regressions:
+        print(f"\n{regressions} benchmark(s) más lentos que la línea base (tolerancia {args.tolerance:.0%})")
+    return 1 if regressions and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Búsqueda de la mejor CMC: la menor incertidumbre entre todas las tablas
+que cubren un punto (o un rango) de voltaje y frecuencia.
+
+CoverageIndex guarda, para cada registro con tabla de un LocalIndex (el
+dataset local o una respuesta guardada), el rectángulo que abarca su tabla
+(voltaje mínimo/máximo y frecuencia mínima/máxima, en unidades base),
+agrupado por unidades de los ejes y ordenado por voltaje mínimo. Una
+consulta descarta con una búsqueda binaria y una máscara de numpy las tablas que no
+pueden cubrirla, y solo evalúa las que quedan. Si son muchas, se reparten
+entre los procesos de un pool (ProcessPoolExecutor con "spawn": los hijos
+solo importan este módulo y todojunto).
+
+Para un rango, la incertidumbre de una tabla es la peor dentro del rango
+y la tabla tiene que cubrirlo entero (CompiledTable.lookup_region).
+"""
+
+import heapq
+import weakref
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from response_store import record_table
+from todojunto import compile_tableContents, split_quantity
+
+# Registros evaluados por tarea del pool de procesos
+CHUNK_SIZE = 64
+
+
+def parse_range(spec):
+    """
+    (mínimo, máximo, unidad base o None) de un punto ("10 V") o un rango
+    ({"min": ..., "max": ...} o [mín, máx]) en unidades base.
+    """
+    if isinstance(spec, dict) and ('min' in spec or 'max' in spec):
+        lo, hi = spec.get('min'), spec.get('max')
+    elif isinstance(spec, list) and len(spec) == 2:
+        lo, hi = spec
+    else:
+        lo = hi = spec
+    if lo is None or hi is None:
+        raise ValueError("El rango necesita mínimo y máximo")
+    lo_value, lo_base = split_quantity(lo)
+    hi_value, hi_base = split_quantity(hi)
+    if lo_base is not None and hi_base is not None and lo_base != hi_base:
+        raise ValueError(f"Unidades distintas en el rango: {lo_base!r} y {hi_base!r}")
+    if lo_value > hi_value:
+        lo_value, hi_value = hi_value, lo_value
+    return lo_value, hi_value, lo_base or hi_base
+
+
+def evaluate_tables(items, region):
+    """[(ref, z)] de las tablas (ref, tableContents) que cubren la región; corre también en el pool."""
+    out = []
+    for ref, contents in items:
+        try:
+            z = compile_tableContents(contents).lookup_region(*region)
+        except Exception:
+            continue
+        if z is not None:
+            out.append((ref, z))
+    return out
+
+
+class CoverageIndex:
+    def __init__(self, index):
+        groups = {}
+        for rid, record in enumerate(index.records):
+            contents = record_table(record)
+            if contents is None:
+                continue
+            try:
+                table = compile_tableContents(contents)
+            except Exception:
+                continue
+            x_min, x_max, y_min, y_max = table.coverage
+            if x_min != x_min:  # tabla vacía
+                continue
+            groups.setdefault((table.x_base, table.y_base), []).append((x_min, x_max, y_min, y_max, rid))
+        self.groups = {}
+        for bases, rows in groups.items():
+            rows.sort()
+            columns = np.array(rows, dtype=np.float64).T
+            self.groups[bases] = (columns[0], columns[1], columns[2], columns[3], columns[4].astype(np.int64))
+        self.size = sum(len(g[4]) for g in self.groups.values())
+
+    def __len__(self):
+        return self.size
+
+    def candidates(self, x_range, y_range, allowed=None):
+        """
+        Ids de registro cuyas tablas pueden cubrir la región, como
+        [((x_base, y_base), ids)]. Una unidad None en la consulta acepta
+        cualquiera en ese eje. `allowed` limita a esos ids (filtros de la cascada).
+        """
+        x_lo, x_hi, x_base = x_range
+        y_lo, y_hi, y_base = y_range
+        out = []
+        for bases, (x_min, x_max, y_min, y_max, rids) in self.groups.items():
+            if (x_base is not None and bases[0] != x_base) or (y_base is not None and bases[1] != y_base):
+                continue
+            n = int(np.searchsorted(x_min, x_lo, side='right'))
+            mask = (x_max[:n] >= x_hi) & (y_min[:n] <= y_lo) & (y_max[:n] >= y_hi)
+            ids = rids[:n][mask]
+            if allowed is not None:
+                ids = ids[np.isin(ids, allowed)]
+            if len(ids):
+                out.append((bases, ids))
+        return out
+
+
+# Un CoverageIndex por LocalIndex vivo (se libera junto con el índice)
+_coverage = weakref.WeakKeyDictionary()
+_coverage_lock = threading.Lock()
+
+
+def coverage_index(index):
+    """CoverageIndex de un LocalIndex (se construye una vez por índice)."""
+    with _coverage_lock:
+        coverage = _coverage.get(index)
+        if coverage is None:
+            coverage = _coverage[index] = CoverageIndex(index)
+        return coverage
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def process_pool(processes):
+    """Pool de procesos compartido (se crea en el primer uso, dentro de cada worker)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def best_cmc(index, x_spec, y_spec, filters=None, k=10, processes=1, parallel_min=256):
+    """
+    Las `k` tablas de `index` (LocalIndex) con menor incertidumbre en la
+    región (voltaje, frecuencia), restringidas por los filtros de la
+    cascada. Devuelve (resultados, estadísticas).
+    """
+    x_range, y_range = parse_range(x_spec), parse_range(y_spec)
+    region = (x_range[0], x_range[1], y_range[0], y_range[1])
+    coverage = coverage_index(index)
+    allowed = None
+    if filters:
+        allowed = np.fromiter(index.match_ids(filters), dtype=np.int64)
+
+    refs = [int(rid) for _, ids in coverage.candidates(x_range, y_range, allowed) for rid in ids]
+    items = [(rid, record_table(index.records[rid])) for rid in refs]
+    if processes > 1 and len(items) >= parallel_min:
+        pool = process_pool(processes)
+        chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+        matches = [m for part in pool.map(evaluate_tables, chunks, [region] * len(chunks)) for m in part]
+    else:
+        matches = evaluate_tables(items, region)
+
+    best = heapq.nsmallest(k, matches, key=lambda m: (m[1], m[0]))
+    results = []
+    for rank, (rid, z) in enumerate(best, start=1):
+        record = index.records[rid]
+        results.append({
+            "rank": rank,
+            "id": record.get('id'),
+            "kcdbCode": record.get('kcdbCode', 'N/A'),
+            "country": record.get('countryValue'),
+            "quantityValue": record.get('quantityValue', 'N/A'),
+            "uncertainty": z,
+        })
+    stats = {"tables": len(coverage), "candidates": len(items), "matches": len(matches)}
+    return results, stats
+
@@ -0,0 +1,111 @@
+"""
+Opciones de la cascada calculadas en el servidor a partir de cmc_category_tree.json.
+
+El árbol se carga una vez y se aplana en la lista de caminos completos
+(un valor por campo de la cascada). Para cada nivel se guarda un índice
+valor -> ids de camino, así las opciones de un nivel dada una selección
+parcial (en cualquier nivel) salen de intersectar esas listas y contar los
+valores, sin recorrer el árbol. Los resultados por selección se memorizan.
+
+Los caminos se guardan como códigos enteros en un único array (un código
+por nivel, que apunta a la lista de valores distintos de ese nivel) y las
+listas de ids como arrays ordenados: pocos objetos grandes, que los workers
+de gunicorn comparten por copy-on-write si el árbol se carga en el master.
+"""
+
+import json
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+from config import Config
+from local_index import _intersect
+
+COUNT_KEY = '_count'
+
+
+def tree_paths(tree, depth):
+    """Caminos raíz-hoja de largo `depth` (los caminos más cortos se descartan, como en existsPath)."""
+    paths = []
+
+    def walk(node, prefix):
+        if not isinstance(node, dict):
+            return
+        if len(prefix) == depth:
+            paths.append(tuple(prefix))
+            return
+        for key in node:
+            if key != COUNT_KEY:
+                walk(node[key], prefix + [key])
+
+    walk(tree, [])
+    return paths
+
+
+class CategoryTree:
+    def __init__(self, tree, fields=None, cache_size=4096):
+        self.fields = list(fields or Config.CASCADE_FIELDS)
+        depth = self.depth = len(self.fields)
+        paths = tree_paths(tree, depth)
+        self.size = len(paths)
+        self.values = [sorted({path[level] for path in paths}) for level in range(depth)]
+        codes_by_level = [{v: i for i, v in enumerate(values)} for values in self.values]
+        self._codes = array('I', (codes_by_level[level][path[level]]
+                                  for path in paths for level in range(depth)))
+        postings = [{} for _ in range(depth)]
+        for pid, path in enumerate(paths):
+            for level, value in enumerate(path):
+                postings[level].setdefault(value, []).append(pid)
+        self.postings = [{v: array('I', ids) for v, ids in level.items()} for level in postings]
+        self._options_at = lru_cache(maxsize=cache_size)(self._compute_options_at)
+
+    def path(self, pid):
+        """Camino completo (tupla de valores) con id `pid`."""
+        base = pid * self.depth
+        return tuple(self.values[level][self._codes[base + level]] for level in range(self.depth))
+
+    @property
+    def paths(self):
+        return [self.path(pid) for pid in range(self.size)]
+
+    @classmethod
+    def load(cls, path):
+        """Carga el árbol desde un archivo JSON."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _compute_options_at(self, level, selections):
+        lists = []
+        for other, value in enumerate(selections):
+            if other == level or value is None:
+                continue
+            ids = self.postings[other].get(value)
+            if ids is None:
+                return ()
+            lists.append(ids)
+        candidates = _intersect(lists) if lists else range(self.size)
+        codes, depth = self._codes, self.depth
+        counts = Counter(codes[pid * depth + level] for pid in candidates)
+        values = self.values[level]
+        # Los códigos siguen el orden de los valores: ordenar por código es ordenar por valor
+        return tuple((values[code], n) for code, n in sorted(counts.items()))
+
+    def options_at(self, level, selections):
+        """[(valor, cantidad de caminos)] disponibles en `level` dada la selección de los demás niveles."""
+        return self._options_at(level, tuple(selections))
+
+    def options(self, selections):
+        """
+        Opciones de todos los niveles, con la misma lógica que repopulateAll:
+        se recorre nivel por nivel y una selección que ya no es válida se
+        descarta antes de calcular los niveles siguientes.
+        Devuelve (selecciones normalizadas, opciones por nivel).
+        """
+        selections = list(selections) + [None] * (len(self.fields) - len(selections))
+        levels = []
+        for level in range(len(self.fields)):
+            opts = self.options_at(level, selections)
+            if selections[level] is not None and selections[level] not in dict(opts):
+                selections[level] = None
+            levels.append(opts)
+        return selections, levels
@@ -6,20 +6,112 @@ class Config:
     DEFAULT_TREE_FILE = 'cmc_category_tree.json'
     DEFAULT_LOCAL_JSON = 'CMC_EM_MUNDIAL.json'
     
+    # Campos del filtrado en cascada (mismo orden que los selects de la interfaz)
+    CASCADE_FIELDS = [
+        'metrologyAreaLabel', 'countryValue', 'branchValue', 'serviceValue',
+        'subServiceValue', 'individualServiceValue', 'instrument', 'instrumentMethod'
+    ]
+    
     # Configuración de la API
-    BIPM_API_URL = "https://www.bipm.org/api/kcdb/cmc/searchData/physics"
+    BIPM_API_URL = os.environ.get('BIPM_API_URL', "https://www.bipm.org/api/kcdb/cmc/searchData/physics")
+    
+    # Cliente HTTP hacia la API (timeouts en segundos)
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 60))
+    UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+    UPSTREAM_BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', 0.5))
+    UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+    UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 8))
+    UPSTREAM_RATE_LIMIT = float(os.environ.get('UPSTREAM_RATE_LIMIT', 0))  # Solicitudes por segundo (0 = sin límite)
+    
+    # Modo de servicio async (asgi.py): consultas a la API en vuelo por proceso
+    # sin ocupar hilos; escrituras y búsquedas en tablas en pools de hilos aparte
+    ASYNC_UPSTREAM_POOL_SIZE = int(os.environ.get('ASYNC_UPSTREAM_POOL_SIZE', 100))
+    ASYNC_UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('ASYNC_UPSTREAM_MAX_CONCURRENCY', 256))
+    ASYNC_IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', 16))  # Parseo y escritura de respuestas, resto de las rutas
+    ASYNC_LOOKUP_WORKERS = int(os.environ.get('ASYNC_LOOKUP_WORKERS', os.cpu_count() or 4))  # Rutas /api/lookup*
+    
+    # Paginación automática de resultados grandes
+    UPSTREAM_PAGE_SIZE = int(os.environ.get('UPSTREAM_PAGE_SIZE', 1000))
+    UPSTREAM_PAGE_WORKERS = int(os.environ.get('UPSTREAM_PAGE_WORKERS', 4))
+    UPSTREAM_MAX_RECORDS = int(os.environ.get('UPSTREAM_MAX_RECORDS', 100000))
     
     # Configuración del servidor
     HOST = '0.0.0.0'
     PORT = int(os.environ.get('PORT', 5000))
     DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     
+    # Consultas sobre el dataset local (índice en el servidor)
+    LOCAL_QUERY_PAGE_SIZE = int(os.environ.get('LOCAL_QUERY_PAGE_SIZE', 100))
+    LOCAL_QUERY_MAX_PAGE_SIZE = int(os.environ.get('LOCAL_QUERY_MAX_PAGE_SIZE', 10000))
+    
+    # Búsqueda de texto libre con facetas (/api/search)
+    SEARCH_FIELDS = [
+        'quantityValue', 'instrument', 'instrumentMethod', 'comments',
+        'branchLabel', 'branchValue', 'serviceLabel', 'serviceValue',
+        'subServiceLabel', 'subServiceValue', 'individualServiceLabel', 'individualServiceValue'
+    ]
+    SEARCH_FACET_SIZE = int(os.environ.get('SEARCH_FACET_SIZE', 50))  # Valores por campo en las facetas
+    SEARCH_MAX_EXPANSIONS = int(os.environ.get('SEARCH_MAX_EXPANSIONS', 50))  # Términos por prefijo de cada palabra
+    SEARCH_MAX_SEGMENTS = int(os.environ.get('SEARCH_MAX_SEGMENTS', 8))  # Segmentos antes de fundir los agregados
+    SEARCH_REFRESH_INTERVAL = int(os.environ.get('SEARCH_REFRESH_INTERVAL', 30))  # Segundos entre búsquedas de respuestas guardadas por otros workers (0 = nunca)
+    
+    # Grillas de incertidumbre (/api/lookup/grid)
+    GRID_MAX_POINTS = int(os.environ.get('GRID_MAX_POINTS', 1000))  # Puntos por eje de cada barrido
+    
+    # Búsqueda de la mejor CMC entre tablas (/api/best_cmc)
+    BEST_CMC_RESULTS = int(os.environ.get('BEST_CMC_RESULTS', 10))  # Resultados por defecto (k)
+    BEST_CMC_MAX_RESULTS = int(os.environ.get('BEST_CMC_MAX_RESULTS', 100))
+    BEST_CMC_PROCESSES = int(os.environ.get('BEST_CMC_PROCESSES', 1))  # Procesos del pool de cada worker (1 = sin pool)
+    BEST_CMC_PARALLEL_MIN = int(os.environ.get('BEST_CMC_PARALLEL_MIN', 256))  # Tablas candidatas a partir de las que se usa el pool
+    
     # Configuración de archivos
     RESPONSES_FOLDER = 'responses'
     
+    # Retención de las respuestas guardadas (manifiestos de consultas)
+    SNAPSHOT_PREFIXES = ('kcdb_response_', 'advanced_search_')
+    RESPONSES_MAX_SNAPSHOTS = int(os.environ.get('RESPONSES_MAX_SNAPSHOTS', 200))
+    RESPONSES_MAX_AGE_DAYS = int(os.environ.get('RESPONSES_MAX_AGE_DAYS', 30))
+    RESPONSES_COMPACT_INTERVAL = int(os.environ.get('RESPONSES_COMPACT_INTERVAL', 300))  # Segundos mínimos entre revisiones completas para compactar
+    
+    # Caché de respuestas de la API (segundos; 0 desactiva)
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_STALE = int(os.environ.get('RESPONSE_CACHE_STALE', 86400))
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+    RESPONSE_CACHE_DISK_ENTRIES = int(os.environ.get('RESPONSE_CACHE_DISK_ENTRIES', 2048))  # Entradas en disco antes de podar las más viejas
+    RESPONSE_CACHE_SUBFOLDER = 'cache'
+    
+    # Entrega de los JSON estáticos (variantes comprimidas y caché del navegador)
+    STATIC_CACHE_SUBFOLDER = 'static'
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 31536000))
+    
+    # Arranque: las estructuras de solo lectura (índice local, árbol, tablas
+    # compiladas) se construyen antes de atender; en segundo plano, "/"
+    # responde 503 hasta que estén listas
+    WARMUP_IN_BACKGROUND = os.environ.get('WARMUP_IN_BACKGROUND', 'False').lower() == 'true'
+    # gunicorn.conf.py la define al precargar la app en el master (preload_app)
+    GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD', 'False').lower() == 'true'
+    PRELOAD_TABLES = int(os.environ.get('PRELOAD_TABLES', 5000))  # Tablas del dataset local compiladas al arrancar (0 = ninguna)
+    
+    # Dataset local sincronizado (sync_dataset.py): generaciones en
+    # DATASET_FOLDER/gen-*, la vigente apuntada por el enlace DATASET_FOLDER/current.
+    # Sin sincronizar, se usan los archivos de la raíz del proyecto
+    DATASET_FOLDER = os.environ.get('DATASET_FOLDER', 'dataset')
+    DATASET_RELOAD_INTERVAL = int(os.environ.get('DATASET_RELOAD_INTERVAL', 30))  # Segundos entre chequeos de una generación nueva (0 = nunca)
+    SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', 4))  # Segmentos área/país pedidos en paralelo
+    SYNC_RATE_LIMIT = float(os.environ.get('SYNC_RATE_LIMIT', 2))  # Solicitudes por segundo a la API durante la sincronización
+    SYNC_KEEP_GENERATIONS = int(os.environ.get('SYNC_KEEP_GENERATIONS', 3))
+    
     # Configuración de logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
+    # Profiler por muestreo a pedido: se activa en una solicitud que trae la
+    # cabecera PROFILE_HEADER con el valor PROFILE_TOKEN (vacío lo desactiva)
+    PROFILE_HEADER = 'X-Profile'
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+    PROFILE_SUBFOLDER = 'profiles'
+    
     @classmethod
     def get_tree_url(cls):
         """Obtiene la URL del archivo del árbol"""
@@ -30,6 +122,27 @@ class Config:
         """Obtiene la URL del archivo JSON local"""
         return f"/{cls.DEFAULT_LOCAL_JSON}"
     
+    @classmethod
+    def get_dataset_file(cls, name):
+        """Ruta de un archivo del dataset: el de la generación vigente, o el de la raíz si no hay"""
+        current = os.path.join(cls.DATASET_FOLDER, 'current', name)
+        return current if os.path.exists(current) else name
+    
+    @classmethod
+    def get_response_cache_folder(cls):
+        """Obtiene la carpeta del nivel en disco de la caché de respuestas"""
+        return os.path.join(cls.RESPONSES_FOLDER, cls.RESPONSE_CACHE_SUBFOLDER)
+    
+    @classmethod
+    def get_static_cache_folder(cls):
+        """Obtiene la carpeta de las variantes comprimidas de los JSON estáticos"""
+        return os.path.join(cls.RESPONSES_FOLDER, cls.STATIC_CACHE_SUBFOLDER)
+    
+    @classmethod
+    def get_profile_folder(cls):
+        """Obtiene la carpeta donde se guardan los perfiles de las solicitudes"""
+        return os.path.join(cls.RESPONSES_FOLDER, cls.PROFILE_SUBFOLDER)
+    
     @classmethod
     def ensure_responses_folder(cls):
         """Asegura que la carpeta de respuestas exista"""
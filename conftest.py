@@ -0,0 +1,32 @@
+"""
+Fixtures compartidas de las pruebas: un servidor HTTP local que imita el
+endpoint searchData del KCDB y un cliente de la app Flask apuntado a él.
+"""
+
+import pytest
+
+from kcdb_stub import KcdbStub, serve
+
+
+@pytest.fixture
+def kcdb_stub():
+    with serve(KcdbStub()) as stub:
+        yield stub
+
+
+@pytest.fixture
+def app_client(kcdb_stub, tmp_path, monkeypatch):
+    import app as app_module
+    from config import Config
+    from response_cache import ResponseCache
+    from response_store import ResponseStore
+    from upstream import UpstreamClient
+
+    monkeypatch.setattr(Config, 'BIPM_API_URL', kcdb_stub.url)
+    monkeypatch.setattr(Config, 'RESPONSES_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'response_cache',
+                        ResponseCache(str(tmp_path / 'cache'), ttl=60, stale_ttl=60))
+    monkeypatch.setattr(app_module, 'upstream_client', UpstreamClient(retries=0))
+    monkeypatch.setattr(app_module, 'response_store',
+                        ResponseStore(str(tmp_path), snapshot_prefixes=Config.SNAPSHOT_PREFIXES))
+    return app_module.app.test_client()
@@ -0,0 +1,26 @@
+# Configuración de gunicorn (Procfile / render.yaml: gunicorn -c gunicorn.conf.py app:app)
+#
+# La app se importa una sola vez en el master (preload_app): ahí warm_up
+# construye el índice del dataset local, el árbol de categorías y las tablas
+# compiladas, y los workers los heredan por copy-on-write. Antes de crear los
+# workers se congelan los objetos ya construidos (gc.freeze) para que las
+# pasadas del recolector de basura en cada worker no escriban sobre esas
+# páginas y la memoria total no crezca con la cantidad de workers.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+# La app se importa después de este archivo: así sabe que corre en el master
+# y no deja warm_up en un hilo que los workers no heredarían
+os.environ['GUNICORN_PRELOAD'] = 'true'
+
+
+def when_ready(server):
+    # Corre en el master, después de cargar la app y antes de crear los workers
+    gc.collect()
+    gc.freeze()
+    server.log.info("Objetos congelados antes del fork: %d", gc.get_freeze_count())
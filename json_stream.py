@@ -0,0 +1,255 @@
+"""
+Lectura incremental de respuestas JSON grandes.
+
+ArrayStream recorre el arreglo "data" de un documento
+{"data": [...], "totalElements": ..., ...} (o un arreglo en la raíz) y
+entrega los registros de a uno a medida que llegan los bytes, sin
+materializar el documento completo. Las demás claves de la raíz quedan en
+`meta` (completas al terminar de iterar).
+"""
+
+import re
+import json
+import time
+import codecs
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_END = object()
+# Para seguir la profundidad de un valor cortado (ver _ValueScan)
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_chunks(f, chunk_size=CHUNK_SIZE):
+    """Itera un archivo abierto en modo binario en bloques."""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class ArrayStream:
+    """
+    Registros del arreglo `key` de un documento JSON que llega en bloques
+    (bytes o str). Se recorre una sola vez: iterar de nuevo retoma donde
+    quedó el recorrido anterior (así, terminar de recorrer lo que un
+    consumidor dejó llega a las claves posteriores al arreglo). `limit`
+    corta después de esa cantidad de registros sin leer el resto. `bytes` y `parse_seconds`
+    acumulan lo leído y el tiempo de decodificación (para las métricas).
+    """
+
+    def __init__(self, chunks, key='data', limit=None):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._state = None
+        self._records = None
+        self.key = key
+        self.limit = limit
+        self.count = 0
+        self.bytes = 0
+        self.parse_seconds = 0.0
+        self.meta = {}
+
+    @classmethod
+    def from_file(cls, path, key='data', limit=None):
+        """Recorre el arreglo `key` de un archivo JSON."""
+        def chunks():
+            with open(path, 'rb') as f:
+                yield from file_chunks(f)
+        return cls(chunks(), key=key, limit=limit)
+
+    def close(self):
+        """Libera la fuente de los bloques (archivo o respuesta HTTP)."""
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+
+    def _fill(self):
+        """Agrega el próximo bloque al buffer; False si ya no hay más."""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            self._buf += self._utf8.decode(b'', final=True)
+            return False
+        # Descarta lo ya consumido para que el buffer no crezca sin límite
+        if self._pos > CHUNK_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self.bytes += len(chunk)
+        self._buf += self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def _peek(self):
+        """Primer carácter no blanco (sin consumirlo), o '' al final."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"JSON inválido: se esperaba {chars!r} y llegó {ch!r}")
+        self._pos += 1
+        return ch
+
+    def _value(self):
+        """Decodifica el próximo valor completo (pide más bytes si quedó cortado)."""
+        self._peek()
+        scan = None
+        while True:
+            start = time.perf_counter()
+            try:
+                # Un valor cortado se vuelve a decodificar recién cuando el
+                # escaneo ve su final: reintentar con cada bloque sería cuadrático
+                if scan is None or scan.complete(self._buf, self._pos) or self._eof:
+                    value, end = _decoder.raw_decode(self._buf, self._pos)
+                    # Un valor que termina justo en el borde (p. ej. un número) puede seguir
+                    if end < len(self._buf) or self._eof:
+                        self._pos = end
+                        return value
+            except json.JSONDecodeError:
+                # Con el valor entero a la vista, más bytes no lo arreglan
+                if self._eof or (scan is not None and scan.done):
+                    raise
+                scan = scan or _ValueScan()
+            finally:
+                self.parse_seconds += time.perf_counter() - start
+            self._fill()
+
+    def _member(self):
+        """Lee `"clave":` y devuelve la clave."""
+        name = self._value()
+        if not isinstance(name, str):
+            raise ValueError("JSON inválido: clave no textual")
+        self._expect(':')
+        return name
+
+    def head(self):
+        """
+        Avanza hasta el comienzo del arreglo y devuelve las claves de la raíz
+        vistas hasta ahí (p. ej. totalElements si viene antes de "data").
+        """
+        if self._state is not None:
+            return self.meta
+        if self._peek() == '[':
+            self._state = 'array'
+            return self.meta
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            self._state = 'done'
+            return self.meta
+        while True:
+            name = self._member()
+            if name == self.key and self._peek() == '[':
+                self._state = 'object'
+                return self.meta
+            self.meta[name] = self._value()
+            if self._expect(',}') == '}':
+                self._state = 'done'
+                return self.meta
+
+    def _items(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def __iter__(self):
+        if self._records is None:
+            self._records = self._iterate()
+        return self._records
+
+    def _iterate(self):
+        self.head()
+        if self._state == 'done':
+            return
+        in_object = self._state == 'object'
+        self._state = 'done'
+        items = self._items()
+        while self.limit is None or self.count < self.limit:
+            item = next(items, _END)
+            if item is _END:
+                break
+            self.count += 1
+            yield item
+        else:
+            return
+        if in_object:
+            while self._expect(',}') == ',':
+                name = self._member()
+                self.meta[name] = self._value()
+
+
+class _ValueScan:
+    """
+    Sigue la profundidad de un valor que llega cortado, retomando donde quedó
+    con cada bloque, para saber cuándo puede estar completo sin decodificarlo.
+    """
+
+    def __init__(self):
+        self.offset = 0  # Relativo al comienzo del valor (el buffer se recorta)
+        self.depth = 0
+        self.in_string = False
+        self.done = False
+
+    def complete(self, buf, start):
+        """True si el valor que empieza en buf[start] ya está entero (o no es un contenedor)."""
+        if self.done or buf[start] not in '[{"':
+            return True
+        pos = start + self.offset
+        while True:
+            if self.in_string:
+                m = _STRING_SPECIAL.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                if m.group() == '\\':
+                    if m.end() >= len(buf):
+                        # El escape quedó cortado: se retoma desde la barra
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                self.in_string = False
+                pos = m.end()
+                if self.depth == 0:
+                    self.done = True
+                    return True
+            else:
+                m = _STRUCTURAL.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                ch = m.group()
+                pos = m.end()
+                if ch == '"':
+                    self.in_string = True
+                elif ch in '[{':
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.done = True
+                        return True
+        self.offset = pos - start
+        return False
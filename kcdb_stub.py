@@ -0,0 +1,101 @@
+"""
+Servidor HTTP local que imita el endpoint searchData del KCDB.
+
+Lo usan las pruebas (fixture kcdb_stub) y los benchmarks (bench.py) para
+ejercitar la app y el cliente sin salir a la red.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILTER_FIELDS = [
+    'metrologyAreaLabel', 'countryValue', 'branchValue', 'serviceValue',
+    'subServiceValue', 'individualServiceValue', 'instrument', 'instrumentMethod'
+]
+
+
+class KcdbStub:
+    """Estado del servidor falso: registros servidos, payloads recibidos y ajustes."""
+
+    def __init__(self):
+        self.records = []
+        self.payloads = []
+        self.delay = 0.0
+        self.fail_times = 0
+        self.status = 200
+        self.data_first = False  # "data" antes que totalElements y demás claves
+        self.lock = threading.Lock()
+        self.url = None
+
+    @property
+    def calls(self):
+        return len(self.payloads)
+
+    def respond(self, payload):
+        with self.lock:
+            self.payloads.append(payload)
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                return 503, {"error": "unavailable"}
+        if self.delay:
+            time.sleep(self.delay)
+        matches = [
+            r for r in self.records
+            if all(r.get(f) == payload[f] for f in FILTER_FIELDS if f in payload)
+        ]
+        page = int(payload.get('page', 0))
+        size = int(payload.get('pageSize', len(matches) or 1))
+        data = matches[page * size:(page + 1) * size]
+        body = {
+            "page": page,
+            "pageSize": size,
+            "totalElements": len(matches),
+            "totalPages": -(-len(matches) // size) if size else 0,
+            "numberOfElements": len(data),
+        }
+        if self.data_first:
+            return self.status, dict({"data": data}, **body)
+        return self.status, dict(body, data=data)
+
+
+@contextmanager
+def serve(stub=None):
+    """Levanta el servidor en un puerto libre de 127.0.0.1 y entrega el KcdbStub (con .url)."""
+    stub = stub or KcdbStub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            status, body = stub.respond(payload)
+            raw = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Cola de conexiones para las pruebas con cientos de consultas simultáneas
+        request_queue_size = 256
+
+        def handle_error(self, request, client_address):
+            # Clientes que cortan antes de tiempo (pruebas de timeout)
+            pass
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}/api/kcdb/cmc/searchData/physics"
+    try:
+        yield stub
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,178 @@
+"""
+Índice en memoria sobre el dataset local de CMCs (CMC_EM_MUNDIAL.json).
+
+Se construye una sola vez: para cada uno de los campos de la cascada guarda
+un índice invertido valor -> ids de registro (array ordenado y compacto).
+Los campos instrument/instrumentMethod se separan en tokens al construir el
+índice, con la misma regla que recMatches en templates/index.html, así una
+consulta se resuelve intersectando listas de ids.
+
+Los registros no se guardan como objetos de Python sino serializados en un
+único buffer de bytes con un array de offsets (CompactRecords), y solo se
+decodifican los de la página pedida. Así el índice son unos pocos objetos
+grandes e inmutables: construido en el master de gunicorn (--preload), los
+workers lo comparten por copy-on-write sin tocar sus páginas.
+"""
+
+import re
+import json
+import bisect
+from array import array
+
+from config import Config
+from json_stream import ArrayStream
+
+# Campos que pueden tener varios valores en un string ("a, b; c / d")
+MULTI_VALUED_FIELDS = ('instrument', 'instrumentMethod')
+SPLIT_RE = re.compile(r'\s*[,;/]\s*')
+
+
+def records_from_response(resp):
+    """Extrae la lista de registros de una respuesta (lista, {"data": [...]} o {"results": [...]})."""
+    if isinstance(resp, list):
+        return resp
+    if isinstance(resp, dict):
+        if isinstance(resp.get('data'), list):
+            return resp['data']
+        if isinstance(resp.get('results'), list):
+            return resp['results']
+    return []
+
+
+def norm_value(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def field_values(record, field):
+    """Valores indexables de un campo del registro, ya normalizados."""
+    value = record.get(field)
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [norm_value(v) for v in value]
+    if field in MULTI_VALUED_FIELDS:
+        if not isinstance(value, str):
+            return []
+        return [part.strip() for part in SPLIT_RE.split(value) if part.strip()]
+    return [norm_value(value)]
+
+
+def _intersect(postings):
+    """Intersección de listas ordenadas de ids, empezando por la más corta."""
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        n = len(other)
+        kept = []
+        for rid in result:
+            i = bisect.bisect_left(other, rid)
+            if i < n and other[i] == rid:
+                kept.append(rid)
+        result = kept
+        if not result:
+            break
+    return result
+
+
+class CompactRecords:
+    """Secuencia de solo lectura de registros guardados como JSON compacto en un solo buffer."""
+    __slots__ = ('_blob', '_offsets')
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def from_records(cls, records):
+        blob = bytearray()
+        offsets = array('Q', [0])
+        for record in records:
+            blob += json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            offsets.append(len(blob))
+        return cls(bytes(blob), offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self._blob[self._offsets[i]:self._offsets[i + 1]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return len(self._blob) + self._offsets.itemsize * len(self._offsets)
+
+
+class LocalIndex:
+    def __init__(self, records, fields=None):
+        self.fields = list(fields or Config.CASCADE_FIELDS)
+        postings = {field: {} for field in self.fields}
+        blob = bytearray()
+        offsets = array('Q', [0])
+        for rid, record in enumerate(records):
+            blob += json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            offsets.append(len(blob))
+            if not isinstance(record, dict):
+                continue
+            for field in self.fields:
+                index = postings[field]
+                for value in set(field_values(record, field)):
+                    try:
+                        index.setdefault(value, []).append(rid)
+                    except TypeError:  # valores no hasheables: no se indexan
+                        pass
+        self.postings = {
+            field: {value: array('I', ids) for value, ids in index.items()}
+            for field, index in postings.items()
+        }
+        self.records = CompactRecords(bytes(blob), offsets)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga el dataset desde un archivo JSON y construye el índice. Los
+        registros se leen de a uno, sin tener el texto completo en memoria.
+        """
+        stream = ArrayStream.from_file(path)
+        index = cls(stream)
+        if not len(index) and stream.meta:
+            index = cls(records_from_response(stream.meta))
+        return index
+
+    def __len__(self):
+        return len(self.records)
+
+    def match_ids(self, filters):
+        """Ids (ordenados) de los registros que cumplen todos los filtros de la cascada."""
+        lists = []
+        for field in self.fields:
+            if field not in filters or filters[field] is None:
+                continue
+            ids = self.postings[field].get(norm_value(filters[field]))
+            if ids is None:
+                return []
+            lists.append(ids)
+        if not lists:
+            return range(len(self.records))
+        return _intersect(lists)
+
+    def query(self, filters, page=0, page_size=100):
+        """Devuelve una página de resultados con la forma de una respuesta de searchData."""
+        ids = self.match_ids(filters)
+        start = page * page_size
+        data = [self.records[rid] for rid in ids[start:start + page_size]]
+        return {
+            "page": page,
+            "pageSize": page_size,
+            "totalElements": len(ids),
+            "totalPages": -(-len(ids) // page_size) if page_size else 0,
+            "numberOfElements": len(data),
+            "data": data,
+        }
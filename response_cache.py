@@ -0,0 +1,239 @@
+"""
+Caché de respuestas de la API del KCDB.
+
+Las entradas se indexan por el payload de la consulta en forma canónica
+(JSON con claves ordenadas) y guardan solo los metadatos que devuelven las
+rutas (archivo guardado y tablas encontradas). Hay dos niveles: un LRU en
+memoria y una copia en disco bajo la carpeta de respuestas, que sobrevive
+a reinicios y se comparte entre workers. El disco se poda por antigüedad y
+cantidad de entradas, y los locks entre workers son un conjunto fijo de
+archivos (LOCK_STRIPES), no uno por consulta.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from singleflight import SingleFlight, file_lock
+
+# Estados devueltos por get_or_fetch (se exponen en la cabecera X-Cache)
+HIT = 'HIT'
+STALE = 'STALE'
+MISS = 'MISS'
+COALESCED = 'COALESCED'
+
+# Archivos de lock compartidos por todas las claves (una clave usa siempre el mismo)
+LOCK_STRIPES = 64
+
+
+def canonical_payload(payload):
+    """Serializa el payload de forma canónica para usarlo como clave."""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def payload_key(payload):
+    """Clave de caché (hash) del payload canónico."""
+    return hashlib.sha256(canonical_payload(payload).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caché LRU en memoria + disco con TTL y stale-while-revalidate.
+
+    - Una entrada más nueva que `ttl` segundos se sirve directamente (HIT).
+    - Entre `ttl` y `ttl + stale_ttl` se sirve igual (STALE) y se refresca
+      en segundo plano.
+    - Más vieja que eso, o si el archivo de respuesta ya no existe, se
+      vuelve a consultar (MISS).
+
+    Las consultas idénticas simultáneas se hacen una sola vez: entre hilos
+    con SingleFlight (los que esperan reciben COALESCED) y entre workers con
+    un lock de archivo por clave, tras el cual se revisa de nuevo el disco.
+    """
+
+    def __init__(self, folder, ttl=3600, stale_ttl=86400, max_entries=256,
+                 max_disk_entries=2048, prune_interval=60):
+        self.folder = folder
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._flight = SingleFlight()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 or self.stale_ttl > 0
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def _lock_path(self, key):
+        return os.path.join(self.folder, f"stripe-{int(key[:8], 16) % LOCK_STRIPES:02d}.lock")
+
+    def _read(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Devuelve (entrada, estado) con estado HIT/STALE, o (None, MISS)."""
+        if not self.enabled:
+            return None, MISS
+        entry = self._read(key)
+        if entry is None:
+            return None, MISS
+        if not os.path.exists(entry.get('filename', '')):
+            self.invalidate(key)
+            return None, MISS
+        age = time.time() - entry.get('stored_at', 0)
+        if age <= self.ttl:
+            return entry, HIT
+        if age <= self.ttl + self.stale_ttl:
+            return entry, STALE
+        self.invalidate(key)
+        return None, MISS
+
+    def put(self, key, entry):
+        """Guarda la entrada en memoria y en disco (escritura atómica)."""
+        if not self.enabled:
+            return entry
+        entry = dict(entry, stored_at=time.time())
+        self._remember(key, entry)
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+        if time.time() - self._pruned_at >= self.prune_interval:
+            self.prune()
+        return entry
+
+    def prune(self):
+        """
+        Borra del disco las entradas vencidas (más viejas que ttl + stale_ttl)
+        y las más viejas que excedan `max_disk_entries`, junto con temporales
+        y locks por clave abandonados. Devuelve cuántos archivos borró.
+        """
+        self._pruned_at = time.time()
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return 0
+        cutoff = self._pruned_at - (self.ttl + self.stale_ttl)
+        # Un temporal puede ser de una escritura en curso de otro worker
+        leftover_cutoff = min(cutoff, self._pruned_at - 3600)
+        entries, doomed = [], []
+        for name in names:
+            if name.startswith('stripe-'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if not name.endswith('.json'):
+                if mtime < leftover_cutoff:
+                    doomed.append(path)
+            elif mtime < cutoff:
+                doomed.append(path)
+            else:
+                entries.append((mtime, path))
+        entries.sort(reverse=True)
+        doomed.extend(path for _, path in entries[self.max_disk_entries:])
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _invalidate_memory(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def invalidate(self, key):
+        self._invalidate_memory(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Vacía solo el nivel en memoria."""
+        with self._lock:
+            self._memory.clear()
+
+    def _fetch_shared(self, key, fetch):
+        # Otro worker pudo haber completado la misma consulta mientras se
+        # esperaba el lock: en ese caso se usa su resultado.
+        with file_lock(self._lock_path(key)):
+            self._invalidate_memory(key)
+            entry, state = self.get(key)
+            if state == HIT:
+                return entry, HIT
+            return self.put(key, fetch()), MISS
+
+    def fetch(self, key, fetch):
+        """Consulta deduplicada (hilos y procesos); devuelve (entrada, estado)."""
+        (entry, state), shared = self._flight.do(key, lambda: self._fetch_shared(key, fetch))
+        return entry, (COALESCED if shared else state)
+
+    def _revalidate(self, key, fetch):
+        try:
+            self.fetch(key, fetch)
+        except Exception:
+            # Se sigue sirviendo la entrada vieja hasta que venza
+            pass
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _revalidate_async(self, key, fetch):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        threading.Thread(target=self._revalidate, args=(key, fetch), daemon=True).start()
+
+    def get_or_fetch(self, payload, fetch):
+        """
+        Devuelve (entrada, estado) para el payload. `fetch` es una función sin
+        argumentos que consulta la API y devuelve la entrada a guardar.
+        """
+        key = payload_key(payload)
+        entry, state = self.get(key)
+        if state == HIT:
+            return entry, HIT
+        if state == STALE:
+            self._revalidate_async(key, fetch)
+            return entry, STALE
+        return self.fetch(key, fetch)
+
+    def age(self, entry):
+        return max(0, int(time.time() - entry.get('stored_at', time.time())))
@@ -0,0 +1,612 @@
+"""
+Almacenamiento compacto y deduplicado de las respuestas guardadas.
+
+Cada registro se guarda una sola vez, direccionado por el hash de su
+contenido, como JSON compacto comprimido con zlib dentro de archivos "pack"
+de solo agregado (records/pack-NNNNNN.bin). Un log de índice
+(records/index.log) asocia cada hash con (pack, offset, largo).
+
+Cada consulta guardada (el `filename` que reciben los clientes) es un
+manifiesto liviano con la lista de [id, hash, hash de la tabla] de sus registros. Los
+archivos de respuesta completos del formato anterior se siguen leyendo.
+
+Las tablas de incertidumbre (tableContents) se guardan además como blobs
+propios, y junto a cada manifiesto se escribe un índice binario
+(`<filename>.idx`) ordenado por id de registro con la ubicación de su tabla
+en los packs. Así /api/lookup busca el id con bisect sobre un mmap del
+índice y lee solo ese tramo del pack, sin deserializar la respuesta.
+
+La retención borra los manifiestos más viejos (por cantidad y antigüedad)
+y la compactación reescribe los packs con solo los registros que algún
+manifiesto todavía usa. Para no leer todos los manifiestos con cada
+guardado, la retención suma en records/dead los bytes que referenciaban los
+manifiestos borrados (una cota superior, por la deduplicación) y solo se
+revisa en serio cuando esa cuenta pasa el umbral, como mucho una vez cada
+`compact_interval` segundos. Mientras una consulta se está guardando, sus
+hashes quedan fijados en records/pins/<manifiesto>.pins (también los de
+registros que ya estaban en el almacén), así una compactación de otro hilo
+o proceso no borra lo que el manifiesto todavía no escribió.
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+from singleflight import file_lock
+from json_stream import ArrayStream
+
+MANIFEST_FORMAT = 'kcdb-manifest/1'
+
+# Índice lateral: cabecera (magia, cantidad) + entradas (id, pack, offset, largo) ordenadas por id
+SIDECAR_MAGIC = b'KIDX0001'
+SIDECAR_HEADER = struct.Struct('<8sQ')
+SIDECAR_ENTRY = struct.Struct('<qIQI')
+
+# Fijaciones más viejas que esto (de un guardado que se interrumpió) se descartan
+PIN_MAX_AGE = 6 * 3600
+
+
+def record_hash(record):
+    """Hash del contenido del registro (JSON canónico)."""
+    canonical = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def table_hash(table_contents):
+    """Hash de un string tableContents (espacio de nombres distinto al de los registros)."""
+    return hashlib.sha256(b'table:' + table_contents.encode('utf-8')).hexdigest()[:32]
+
+
+def record_table(record):
+    """tableContents guardable del registro, o None (sin tabla o enmascarada)."""
+    table = record.get('uncertaintyTable') if isinstance(record, dict) else None
+    contents = table.get('tableContents') if isinstance(table, dict) else None
+    if isinstance(contents, str) and contents and contents != '<masked>':
+        return contents
+    return None
+
+
+class _SidecarIndex:
+    """Lector del índice lateral: búsqueda binaria directa sobre el mmap."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat_key = os.fstat(f.fileno()).st_mtime_ns
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = SIDECAR_HEADER.unpack_from(self.map, 0)
+        if magic != SIDECAR_MAGIC:
+            self.map.close()
+            raise ValueError(f'Índice inválido: {path}')
+
+    def _id_at(self, i):
+        return SIDECAR_ENTRY.unpack_from(self.map, SIDECAR_HEADER.size + i * SIDECAR_ENTRY.size)[0]
+
+    def find(self, record_id):
+        """(pack, offset, largo) de la tabla del registro, o None."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_at(mid) < record_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            rid, pack, offset, length = SIDECAR_ENTRY.unpack_from(
+                self.map, SIDECAR_HEADER.size + lo * SIDECAR_ENTRY.size)
+            if rid == record_id:
+                return pack, offset, length
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+def encode_record(record):
+    return zlib.compress(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def decode_record(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def is_manifest(doc):
+    return isinstance(doc, dict) and doc.get('format') == MANIFEST_FORMAT
+
+
+class ResponseStore:
+    def __init__(self, folder, snapshot_prefixes=(), max_snapshots=200, max_age_days=30,
+                 pack_max_bytes=64 * 1024 * 1024, open_files=32, write_batch=256, compact_interval=300):
+        self.folder = folder
+        self.records_folder = os.path.join(folder, 'records')
+        self.snapshot_prefixes = tuple(snapshot_prefixes)
+        self.max_snapshots = max_snapshots
+        self.max_age_days = max_age_days
+        self.pack_max_bytes = pack_max_bytes
+        self.write_batch = write_batch
+        self.compact_interval = compact_interval
+        self._index = {}
+        self._index_pos = 0
+        self._index_ino = None
+        self._lock = threading.RLock()
+        # Archivos usados hace poco (índices laterales y packs), ya mapeados en memoria
+        self.open_files = open_files
+        self._sidecars = OrderedDict()
+        self._pack_maps = OrderedDict()
+
+    # --- Índice de registros -------------------------------------------------
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.records_folder, 'index.log')
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.records_folder, 'store.lock')
+
+    @property
+    def _dead_path(self):
+        return os.path.join(self.records_folder, 'dead')
+
+    def _pack_path(self, pack):
+        return os.path.join(self.records_folder, f'pack-{pack:06d}.bin')
+
+    def _refresh_index(self):
+        """Lee las entradas nuevas del log (o todo, si otro proceso lo compactó)."""
+        try:
+            st = os.stat(self._index_path)
+        except OSError:
+            self._index, self._index_pos, self._index_ino = {}, 0, None
+            return
+        with self._lock:
+            if st.st_ino != self._index_ino or st.st_size < self._index_pos:
+                self._index, self._index_pos, self._index_ino = {}, 0, st.st_ino
+            if st.st_size == self._index_pos:
+                return
+            with open(self._index_path, 'r', encoding='ascii') as f:
+                f.seek(self._index_pos)
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # línea a medio escribir por otro proceso
+                    digest, pack, offset, length = line.split()
+                    self._index[digest] = (int(pack), int(offset), int(length))
+                    self._index_pos += len(line)
+
+    def _current_pack(self):
+        packs = [p for p, _, _ in self._index.values()]
+        pack = max(packs) if packs else 0
+        path = self._pack_path(pack)
+        if os.path.exists(path) and os.path.getsize(path) >= self.pack_max_bytes:
+            pack += 1
+        return pack
+
+    def put_records(self, records, pin=None):
+        """
+        Guarda los registros (y sus tablas de incertidumbre) que todavía no
+        estén en el almacén y devuelve la lista de entradas
+        [id, hash del registro, hash de la tabla o None], en el mismo orden.
+        `records` puede ser cualquier iterable (p. ej. un stream): se
+        consume y se escribe en tandas de `write_batch` registros. Con
+        `pin` (el filename del manifiesto que se va a escribir) los hashes
+        quedan fijados hasta write_snapshot(pin, ...).
+        """
+        entries = []
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.write_batch))
+            if not batch:
+                return entries
+            entries.extend(self._put_batch(batch, pin))
+
+    @property
+    def _pins_folder(self):
+        return os.path.join(self.records_folder, 'pins')
+
+    def _pin_path(self, filename):
+        return os.path.join(self._pins_folder, os.path.basename(filename) + '.pins')
+
+    def _pinned(self):
+        """Hashes fijados por guardados en curso (descarta las fijaciones abandonadas)."""
+        pinned = set()
+        try:
+            names = os.listdir(self._pins_folder)
+        except OSError:
+            return pinned
+        cutoff = time.time() - PIN_MAX_AGE
+        for name in names:
+            path = os.path.join(self._pins_folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    continue
+                with open(path, 'r', encoding='ascii') as f:
+                    pinned.update(line.strip() for line in f)
+            except OSError:
+                pass
+        pinned.discard('')
+        return pinned
+
+    def _put_batch(self, records, pin=None):
+        entries = []
+        pending = {}
+        for record in records:
+            digest = record_hash(record)
+            record_id = record.get('id') if isinstance(record, dict) else None
+            contents = record_table(record)
+            t_digest = table_hash(contents) if contents is not None else None
+            entries.append([record_id, digest, t_digest])
+            pending.setdefault(digest, lambda r=record: encode_record(r))
+            if t_digest is not None:
+                pending.setdefault(t_digest, lambda c=contents: zlib.compress(c.encode('utf-8')))
+
+        self._refresh_index()
+        if pin is None and all(d in self._index for d in pending):
+            return entries
+
+        os.makedirs(self.records_folder, exist_ok=True)
+        with file_lock(self._lock_path), self._lock:
+            if pin is not None:
+                # Bajo el lock del almacén: una compactación ya ve estos hashes
+                os.makedirs(self._pins_folder, exist_ok=True)
+                with open(self._pin_path(pin), 'a', encoding='ascii') as f:
+                    f.write(''.join(f'{d}\n' for d in pending))
+            self._refresh_index()
+            new = [(d, encode) for d, encode in pending.items() if d not in self._index]
+            if not new:
+                return entries
+            pack = self._current_pack()
+            lines = []
+            with open(self._pack_path(pack), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for digest, encode in new:
+                    blob = encode()
+                    f.write(blob)
+                    lines.append(f'{digest} {pack} {offset} {len(blob)}\n')
+                    offset += len(blob)
+            with open(self._index_path, 'a', encoding='ascii') as f:
+                f.write(''.join(lines))
+            self._refresh_index()
+        return entries
+
+    def _pack_map(self, pack, end):
+        """mmap del pack (se vuelve a mapear si creció o si fue reemplazado al compactar)."""
+        path = self._pack_path(pack)
+        ino = os.stat(path).st_ino
+        with self._lock:
+            cached = self._pack_maps.get(pack)
+            if cached is not None and cached[1] == ino and len(cached[0]) >= end:
+                self._pack_maps.move_to_end(pack)
+                return cached[0]
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if cached is not None:
+                cached[0].close()
+            self._pack_maps[pack] = (mm, ino)
+            self._pack_maps.move_to_end(pack)
+            while len(self._pack_maps) > self.open_files:
+                self._pack_maps.popitem(last=False)[1][0].close()
+            return mm
+
+    def _read_table_at(self, pack, offset, length):
+        mm = self._pack_map(pack, offset + length)
+        return zlib.decompress(mm[offset:offset + length]).decode('utf-8')
+
+    def get_record(self, digest):
+        """Lee un registro por su hash."""
+        for attempt in range(2):
+            self._refresh_index()
+            location = self._index.get(digest)
+            if location is None:
+                raise KeyError(digest)
+            pack, offset, length = location
+            try:
+                with open(self._pack_path(pack), 'rb') as f:
+                    f.seek(offset)
+                    return decode_record(f.read(length))
+            except (OSError, zlib.error):
+                # El pack pudo haber sido compactado por otro proceso
+                if attempt:
+                    raise
+                self._index_ino = None
+
+    # --- Manifiestos (consultas guardadas) ----------------------------------
+
+    def write_snapshot(self, filename, entries, meta=None):
+        """Escribe el manifiesto de una consulta y su índice lateral, de forma atómica."""
+        self.write_sidecar(filename, entries)
+        doc = dict(meta or {}, format=MANIFEST_FORMAT, records=entries)
+        tmp = f'{filename}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp, filename)
+        # El manifiesto ya protege sus registros
+        self.unpin(filename)
+
+    def unpin(self, filename):
+        """Suelta los hashes fijados para `filename` (p. ej. si el guardado falló)."""
+        try:
+            os.remove(self._pin_path(filename))
+        except OSError:
+            pass
+
+    @staticmethod
+    def sidecar_path(filename):
+        return f'{filename}.idx'
+
+    def write_sidecar(self, filename, entries):
+        """Índice lateral id de registro -> ubicación de su tabla (solo ids enteros)."""
+        self._refresh_index()
+        rows = {}
+        for entry in entries:
+            record_id, t_digest = entry[0], entry[2] if len(entry) > 2 else None
+            if t_digest is None or isinstance(record_id, bool) or not isinstance(record_id, int):
+                continue
+            location = self._index.get(t_digest)
+            if location is not None:
+                rows.setdefault(record_id, location)
+        path = self.sidecar_path(filename)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, len(rows)))
+            for record_id in sorted(rows):
+                f.write(SIDECAR_ENTRY.pack(record_id, *rows[record_id]))
+        os.replace(tmp, path)
+
+    def _sidecar(self, filename):
+        """Índice lateral de `filename` (desde la caché de archivos recientes), o None."""
+        path = self.sidecar_path(filename)
+        try:
+            stat_key = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            index = self._sidecars.get(path)
+            if index is not None and index.stat_key == stat_key:
+                self._sidecars.move_to_end(path)
+                return index
+            if index is not None:
+                index.close()
+            index = self._sidecars[path] = _SidecarIndex(path)
+            while len(self._sidecars) > self.open_files:
+                self._sidecars.popitem(last=False)[1].close()
+            return index
+
+    def get_tables(self, filename, ids):
+        """
+        {id: tableContents} de los ids pedidos que tengan tabla. Usa el índice
+        lateral si existe; si no (respuestas del formato anterior) o si quedó
+        desactualizado, lee los registros del archivo.
+        """
+        index = self._sidecar(filename)
+        if index is not None:
+            try:
+                tables = {}
+                for record_id in ids:
+                    location = index.find(record_id) if isinstance(record_id, int) else None
+                    if location is not None:
+                        tables[record_id] = self._read_table_at(*location)
+                if not os.path.exists(filename):
+                    raise FileNotFoundError(filename)
+                return tables
+            except (OSError, ValueError, zlib.error, struct.error):
+                if not os.path.exists(filename):
+                    raise
+        tables = {}
+        for record in self.iter_records(filename, ids):
+            record_id = record.get('id')
+            if record_id not in tables:
+                tables[record_id] = record['uncertaintyTable']['tableContents']
+        return tables
+
+    def iter_records(self, filename, ids=None):
+        """
+        Registros de una respuesta guardada, en orden. Acepta manifiestos y
+        archivos de respuesta completos del formato anterior. Con `ids` solo
+        se leen los registros con esos ids.
+        """
+        wanted = None if ids is None else set(ids)
+        # Los archivos completos se leen de a un registro; un manifiesto no
+        # tiene "data" y queda entero en .meta
+        stream = ArrayStream.from_file(filename)
+        try:
+            for record in stream:
+                if wanted is None or (isinstance(record, dict) and record.get('id') in wanted):
+                    yield record
+        finally:
+            stream.close()
+        doc = stream.meta
+        if not is_manifest(doc):
+            return
+        for record_id, digest, *_ in doc['records']:
+            if wanted is None or record_id in wanted:
+                yield self.get_record(digest)
+
+    def load_response(self, filename):
+        """Reconstruye la respuesta completa ({"data": [...], ...}) de un archivo guardado."""
+        with open(filename, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        if not is_manifest(doc):
+            return doc
+        out = {k: v for k, v in doc.items() if k not in ('format', 'records')}
+        out['data'] = [self.get_record(entry[1]) for entry in doc['records']]
+        return out
+
+    # --- Retención y compactación -------------------------------------------
+
+    def snapshots(self):
+        """Archivos de respuestas guardadas, del más nuevo al más viejo."""
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return []
+        return [path for _, path in self._snapshot_times(names)]
+
+    def _snapshot_times(self, names):
+        """(mtime, ruta) de las respuestas guardadas, de la más nueva a la más vieja."""
+        found = []
+        for name in names:
+            if not (name.endswith('.json') and name.startswith(self.snapshot_prefixes)):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                found.append((os.path.getmtime(path), path))
+            except OSError:
+                pass  # Otro proceso la borró mientras tanto
+        found.sort(reverse=True)
+        return found
+
+    def apply_retention(self):
+        """Borra las respuestas que exceden la cantidad o antigüedad máxima; compacta si hizo falta."""
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return 0
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = freed = 0
+        for i, (mtime, path) in enumerate(self._snapshot_times(names)):
+            if i < self.max_snapshots and mtime >= cutoff:
+                continue
+            size = self._manifest_bytes(path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+            try:
+                os.remove(self.sidecar_path(path))
+            except OSError:
+                pass
+        if removed:
+            self._add_dead_bytes(freed)
+            self.maybe_compact()
+        return removed
+
+    def _manifest_bytes(self, path):
+        """Bytes en los packs de los registros y tablas de un manifiesto (0 si no es uno)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if not is_manifest(doc):
+            return 0
+        self._refresh_index()
+        digests = {d for entry in doc['records'] for d in entry[1:3] if d}
+        return sum(self._index[d][2] for d in digests if d in self._index)
+
+    def _dead_state(self):
+        """(bytes sin usar estimados, momento de la última revisión completa)."""
+        try:
+            with open(self._dead_path, 'r', encoding='ascii') as f:
+                dead, checked_at = f.read().split()
+            return int(dead), float(checked_at)
+        except (OSError, ValueError):
+            return 0, 0.0
+
+    def _write_dead_state(self, dead, checked_at):
+        tmp = f'{self._dead_path}.tmp'
+        with open(tmp, 'w', encoding='ascii') as f:
+            f.write(f'{dead} {checked_at}\n')
+        os.replace(tmp, self._dead_path)
+
+    def _add_dead_bytes(self, freed):
+        if not os.path.isdir(self.records_folder):
+            return
+        with file_lock(self._lock_path), self._lock:
+            dead, checked_at = self._dead_state()
+            self._write_dead_state(dead + freed, checked_at)
+
+    def maybe_compact(self, min_dead_ratio=0.5):
+        """
+        compact() solo si la estimación de bytes sin usar pasa `min_dead_ratio`
+        y la última revisión completa tiene más de `compact_interval` segundos.
+        """
+        dead, checked_at = self._dead_state()
+        self._refresh_index()
+        total = sum(length for _, _, length in self._index.values())
+        if not total or dead / total < min_dead_ratio:
+            return False
+        if time.time() - checked_at < self.compact_interval:
+            return False
+        return self.compact(min_dead_ratio)
+
+    def _live_manifests(self):
+        manifests = {}
+        for path in self.snapshots():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    doc = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if is_manifest(doc):
+                manifests[path] = doc['records']
+        return manifests
+
+    def compact(self, min_dead_ratio=0.5):
+        """
+        Reescribe los packs con los registros todavía referenciados, si la
+        fracción de bytes sin usar supera `min_dead_ratio`.
+        """
+        if not os.path.exists(self._index_path):
+            return False
+        with file_lock(self._lock_path), self._lock:
+            self._index_ino = None
+            self._refresh_index()
+            manifests = self._live_manifests()
+            live = set()
+            for entries in manifests.values():
+                for entry in entries:
+                    live.update(d for d in entry[1:3] if d)
+            live |= self._pinned()
+            total = sum(length for _, _, length in self._index.values())
+            live_bytes = sum(length for d, (_, _, length) in self._index.items() if d in live)
+            # La cuenta exacta reemplaza a la estimación de la retención
+            self._write_dead_state(total - live_bytes, time.time())
+            if not total or (total - live_bytes) / total < min_dead_ratio:
+                return False
+
+            old_packs = {pack for pack, _, _ in self._index.values()}
+            pack = max(old_packs) + 1
+            offset = 0
+            lines = []
+            out = open(self._pack_path(pack), 'wb')
+            try:
+                for digest, (src, src_offset, length) in sorted(self._index.items(), key=lambda kv: kv[1]):
+                    if digest not in live:
+                        continue
+                    if offset >= self.pack_max_bytes:
+                        out.close()
+                        pack += 1
+                        offset = 0
+                        out = open(self._pack_path(pack), 'wb')
+                    with open(self._pack_path(src), 'rb') as f:
+                        f.seek(src_offset)
+                        out.write(f.read(length))
+                    lines.append(f'{digest} {pack} {offset} {length}\n')
+                    offset += length
+            finally:
+                out.close()
+
+            tmp = f'{self._index_path}.tmp'
+            with open(tmp, 'w', encoding='ascii') as f:
+                f.write(''.join(lines))
+            os.replace(tmp, self._index_path)
+            self._index_ino = None
+            self._refresh_index()
+            # Los índices laterales apuntan a los packs nuevos antes de borrar los viejos
+            for path, entries in manifests.items():
+                self.write_sidecar(path, entries)
+            for old in old_packs:
+                try:
+                    os.remove(self._pack_path(old))
+                except OSError:
+                    pass
+            self._write_dead_state(0, time.time())
+        return True
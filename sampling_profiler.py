@@ -0,0 +1,78 @@
+"""
+Profiler por muestreo para una solicitud puntual.
+
+Un hilo toma cada `interval` segundos la pila del hilo que atiende la
+solicitud (sys._current_frames) y cuenta cuántas veces aparece cada pila.
+El resultado se escribe en formato "collapsed" (una línea por pila,
+"a;b;c cantidad"), que leen flamegraph.pl, speedscope y similares. Tiene
+costo solo mientras está activo, así que se enciende por solicitud.
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.005, max_depth=64):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    @property
+    def total(self):
+        return sum(self.samples.values())
+
+    def collapsed(self):
+        """Pilas en formato collapsed, de la más frecuente a la menos."""
+        return ''.join(f'{stack} {n}\n' for stack, n in self.samples.most_common())
+
+    def top_functions(self, n=5):
+        """Funciones (hoja de la pila) con más muestras: [(etiqueta, cantidad)]."""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def write(self, path):
+        """Guarda las pilas en `path` (escritura atómica)."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        os.replace(tmp, path)
+        return path
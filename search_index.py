@@ -0,0 +1,346 @@
+"""
+Búsqueda de texto libre con facetas sobre los registros de CMC.
+
+Un índice invertido término -> (ids de registro, frecuencia) sobre los
+campos de texto (SEARCH_FIELDS: magnitud, instrumento, método, comentarios
+y etiquetas del servicio). Los textos se pasan a minúsculas, sin acentos, y
+se cortan en palabras; cada palabra de la consulta también encuentra los
+términos que empiezan con ella ("conv" -> "converter"), con menos peso que
+la palabra completa. Los resultados se ordenan por BM25 y, en la misma
+consulta, se cuentan los valores de los campos de la cascada entre los
+registros encontrados (facetas).
+
+El índice se arma por segmentos inmutables (postings en arrays de numpy,
+ordenados por término): el primero es el dataset local y reutiliza los
+registros compactos del LocalIndex; cada respuesta guardada agrega un
+segmento chico con los registros nuevos o modificados (por id y hash de
+contenido), y la versión anterior de un registro modificado queda marcada
+como borrada. Cuando hay más de `max_segments` segmentos los agregados se
+funden en uno. Una búsqueda lee una foto de los segmentos, sin locks.
+"""
+
+import re
+import bisect
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from config import Config
+from local_index import CompactRecords, field_values, norm_value
+from response_store import record_hash
+
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+# Peso de un término encontrado por prefijo respecto de la palabra completa
+PREFIX_WEIGHT = 0.5
+# Largo mínimo de una palabra de la consulta para buscarla también como prefijo
+PREFIX_MIN_LENGTH = 2
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Palabras de un texto en minúsculas y sin acentos ("AC-DC Transfer" -> ["ac", "dc", "transfer"])."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return WORD_RE.findall(''.join(c for c in text if not unicodedata.combining(c)))
+
+
+def record_tokens(record, fields):
+    tokens = []
+    for field in fields:
+        value = record.get(field)
+        for part in value if isinstance(value, list) else [value]:
+            if isinstance(part, str):
+                tokens.extend(tokenize(part))
+    return tokens
+
+
+class Segment:
+    """Postings, largos y facetas de un grupo fijo de registros."""
+
+    def __init__(self, records, fields, facet_fields):
+        if isinstance(records, CompactRecords):
+            self.records = records
+        else:
+            records = list(records)
+            self.records = CompactRecords.from_records(records)
+        self.facet_fields = list(facet_fields)
+        postings = {}
+        lengths = array('I')
+        self.ids = []
+        facet_index = [{} for _ in self.facet_fields]
+        facet_codes = [array('I') for _ in self.facet_fields]
+        facet_docs = [array('I') for _ in self.facet_fields]
+        for doc, record in enumerate(records):
+            if not isinstance(record, dict):
+                lengths.append(0)
+                self.ids.append(None)
+                continue
+            self.ids.append(record.get('id'))
+            counts = Counter(record_tokens(record, fields))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array('I'), array('I'))
+                entry[0].append(doc)
+                entry[1].append(tf)
+            for f, field in enumerate(self.facet_fields):
+                for value in set(field_values(record, field)):
+                    if isinstance(value, str) and value:
+                        facet_codes[f].append(facet_index[f].setdefault(value, len(facet_index[f])))
+                        facet_docs[f].append(doc)
+
+        self.terms = sorted(postings)
+        sizes = np.fromiter((len(postings[t][0]) for t in self.terms), dtype=np.int64, count=len(self.terms))
+        self.starts = np.concatenate(([0], np.cumsum(sizes)))
+        self.docs = np.concatenate([np.asarray(postings[t][0], dtype=np.uint32) for t in self.terms]
+                                   or [np.empty(0, np.uint32)])
+        self.tfs = np.concatenate([np.asarray(postings[t][1], dtype=np.float32) for t in self.terms]
+                                  or [np.empty(0, np.float32)])
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.total_length = float(self.lengths.sum())
+        # Facetas: pares (registro, código de valor) por campo, y los valores de cada código
+        self.facet_index = facet_index
+        self.facet_labels = [list(index) for index in facet_index]
+        self.facet_codes = [np.asarray(codes, dtype=np.int64) for codes in facet_codes]
+        self.facet_docs = [np.asarray(docs, dtype=np.int64) for docs in facet_docs]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def expand(self, word):
+        """{término: posición} de los términos que empiezan con `word` (o solo `word`, si es corta)."""
+        terms = self.terms
+        i = bisect.bisect_left(terms, word)
+        if len(word) < PREFIX_MIN_LENGTH:
+            return {word: i} if i < len(terms) and terms[i] == word else {}
+        j = bisect.bisect_left(terms, word + '\U0010ffff', i)
+        return {terms[k]: k for k in range(i, j)}
+
+    def df(self, position):
+        return int(self.starts[position + 1] - self.starts[position])
+
+    def filter_mask(self, filters):
+        """Máscara de los registros que cumplen los filtros de la cascada (None si no hay filtros)."""
+        mask = None
+        for f, field in enumerate(self.facet_fields):
+            if filters.get(field) is None:
+                continue
+            code = self.facet_index[f].get(norm_value(filters[field]))
+            hit = np.zeros(len(self), dtype=bool)
+            if code is not None:
+                hit[self.facet_docs[f][self.facet_codes[f] == code]] = True
+            mask = hit if mask is None else mask & hit
+        return mask
+
+    def facet_counts(self, matched):
+        """[{valor: cantidad}] por campo de la cascada, entre los registros de `matched`."""
+        out = []
+        for f, labels in enumerate(self.facet_labels):
+            codes = self.facet_codes[f][matched[self.facet_docs[f]]]
+            counts = np.bincount(codes, minlength=len(labels))
+            out.append({labels[c]: int(counts[c]) for c in np.flatnonzero(counts)})
+        return out
+
+
+class SearchIndex:
+    def __init__(self, records=(), fields=None, facet_fields=None, max_segments=8, max_expansions=50):
+        self.fields = list(fields or Config.SEARCH_FIELDS)
+        self.facet_fields = list(facet_fields or Config.CASCADE_FIELDS)
+        self.max_segments = max_segments
+        self.max_expansions = max_expansions
+        # Respuestas guardadas ya agregadas (nombres de archivo)
+        self.sources = set()
+        self._lock = threading.Lock()
+        self._where = {}
+        self._hashes = {}
+        # (segmentos, máscaras de registros vigentes): se reemplaza entero en cada cambio
+        self._state = ((), ())
+        segment = Segment(records, self.fields, self.facet_fields)
+        # Segmentos del dataset que no se funden con los agregados
+        self._base = 1 if len(segment) else 0
+        if len(segment):
+            self._publish([segment], [np.ones(len(segment), dtype=bool)], 0)
+
+    def __len__(self):
+        return int(sum(alive.sum() for alive in self._state[1]))
+
+    @property
+    def segments(self):
+        return len(self._state[0])
+
+    def _publish(self, segments, alive, first):
+        """Registra la ubicación de los registros de segments[first:] y reemplaza la foto."""
+        for s in range(first, len(segments)):
+            for doc, record_id in enumerate(segments[s].ids):
+                if isinstance(record_id, (int, str)) and alive[s][doc]:
+                    self._where[record_id] = (s, doc)
+        self._state = (tuple(segments), tuple(alive))
+
+    def _hash_of(self, record_id):
+        digest = self._hashes.get(record_id)
+        if digest is None:
+            s, doc = self._where[record_id]
+            digest = self._hashes[record_id] = record_hash(self._state[0][s].records[doc])
+        return digest
+
+    def needs(self, record_id, digest):
+        """True si el registro no está indexado o cambió su contenido."""
+        if not isinstance(record_id, (int, str)):
+            return True
+        return record_id not in self._where or self._hash_of(record_id) != digest
+
+    def add(self, records):
+        """
+        Agrega los registros nuevos o modificados en un segmento nuevo y
+        marca como borradas sus versiones anteriores. Devuelve cuántos agregó.
+        """
+        with self._lock:
+            fresh = {}
+            for record in records:
+                if not isinstance(record, dict):
+                    continue
+                record_id, digest = record.get('id'), record_hash(record)
+                if not self.needs(record_id, digest):
+                    continue
+                key = record_id if isinstance(record_id, (int, str)) else ('_', len(fresh))
+                fresh.pop(key, None)
+                fresh[key] = (record, digest)
+            if not fresh:
+                return 0
+
+            segments, alive = list(self._state[0]), list(self._state[1])
+            copied = set()
+            for key in fresh:
+                where = self._where.get(key)
+                if where is not None:
+                    s, doc = where
+                    if s not in copied:
+                        alive[s] = alive[s].copy()
+                        copied.add(s)
+                    alive[s][doc] = False
+            segment = Segment([record for record, _ in fresh.values()], self.fields, self.facet_fields)
+            segments.append(segment)
+            alive.append(np.ones(len(segment), dtype=bool))
+            for key, (_, digest) in fresh.items():
+                if not isinstance(key, tuple):
+                    self._hashes[key] = digest
+            first = len(segments) - 1
+            if len(segments) > self.max_segments:
+                segments, alive = self._merge(segments, alive)
+                first = self._base
+            self._publish(segments, alive, first)
+            return len(fresh)
+
+    def _merge(self, segments, alive):
+        """Funde los segmentos agregados (todos menos el primero) en uno solo."""
+        base = self._base
+        records = [segment.records[doc] for segment, mask in zip(segments[base:], alive[base:])
+                   for doc in np.flatnonzero(mask)]
+        merged = Segment(records, self.fields, self.facet_fields)
+        return segments[:base] + [merged], alive[:base] + [np.ones(len(merged), dtype=bool)]
+
+    def add_entries(self, entries, get_record):
+        """Agrega los registros de un manifiesto ([id, hash, ...]) que falten, leyéndolos con `get_record(hash)`."""
+        return self.add(get_record(entry[1]) for entry in entries if self.needs(entry[0], entry[1]))
+
+    def _expansions(self, segments, words):
+        """Por palabra: [(término, peso, idf, {segmento: posición})], con a lo sumo max_expansions términos."""
+        n_docs = sum(len(segment) for segment in segments)
+        out = []
+        for word in words:
+            found = {}
+            for s, segment in enumerate(segments):
+                for term, position in segment.expand(word).items():
+                    found.setdefault(term, {})[s] = position
+            df = {term: sum(segments[s].df(p) for s, p in where.items()) for term, where in found.items()}
+            terms = sorted(found, key=lambda t: (t != word, -df[t], t))[:self.max_expansions]
+            out.append([(term, 1.0 if term == word else PREFIX_WEIGHT,
+                         float(np.log1p((n_docs - df[term] + 0.5) / (df[term] + 0.5))), found[term])
+                        for term in terms])
+        return out
+
+    def search(self, text, filters=None, page=0, page_size=100, match_all=True, facet_size=None):
+        """
+        Registros que contienen las palabras de `text` (todas, o alguna con
+        match_all=False) y cumplen los filtros de la cascada, ordenados por
+        relevancia, con la forma de una respuesta de searchData más
+        "scores" y "facets" (valores de cada campo de la cascada con su
+        cantidad entre todos los encontrados, los `facet_size` más frecuentes).
+        """
+        segments, alive = self._state
+        filters = filters or {}
+        words = list(dict.fromkeys(tokenize(text or '')))
+        expansions = self._expansions(segments, words)
+        total_length = sum(segment.total_length for segment in segments)
+        avg_length = total_length / max(sum(len(segment) for segment in segments), 1)
+
+        found_scores, found_docs, found_segments = [], [], []
+        facets = [Counter() for _ in self.facet_fields]
+        for s, segment in enumerate(segments):
+            matched = alive[s].copy()
+            mask = segment.filter_mask(filters)
+            if mask is not None:
+                matched &= mask
+            scores = np.zeros(len(segment), dtype=np.float32)
+            any_hit = np.zeros(len(segment), dtype=bool)
+            for terms in expansions:
+                word_scores = np.zeros(len(segment), dtype=np.float32)
+                for _, weight, idf, where in terms:
+                    position = where.get(s)
+                    if position is None:
+                        continue
+                    lo, hi = segment.starts[position], segment.starts[position + 1]
+                    docs, tf = segment.docs[lo:hi], segment.tfs[lo:hi]
+                    norm = K1 * (1 - B + B * segment.lengths[docs] / avg_length)
+                    term_scores = weight * idf * tf * (K1 + 1) / (tf + norm)
+                    word_scores[docs] = np.maximum(word_scores[docs], term_scores)
+                hit = word_scores > 0
+                if match_all:
+                    matched &= hit
+                else:
+                    any_hit |= hit
+                scores += word_scores
+            if words and not match_all:
+                matched &= any_hit
+            for counter, counts in zip(facets, segment.facet_counts(matched)):
+                counter.update(counts)
+            docs = np.flatnonzero(matched)
+            found_docs.append(docs)
+            found_scores.append(scores[docs])
+            found_segments.append(np.full(len(docs), s))
+
+        scores = np.concatenate(found_scores or [np.empty(0, np.float32)])
+        docs = np.concatenate(found_docs or [np.empty(0, np.int64)])
+        where = np.concatenate(found_segments or [np.empty(0, np.int64)])
+        total = len(scores)
+        start, end = page * page_size, (page + 1) * page_size
+        if words and start < total:
+            # Orden por puntaje (y por posición en el índice entre empates), solo de lo necesario
+            keep = np.arange(total)
+            if total > end:
+                threshold = np.partition(scores, total - end)[total - end]
+                keep = np.flatnonzero(scores >= threshold)
+            order = keep[np.lexsort((docs[keep], where[keep], -scores[keep]))]
+        else:
+            order = np.arange(total)
+        chosen = order[start:end]
+        return {
+            "page": page,
+            "pageSize": page_size,
+            "totalElements": total,
+            "totalPages": -(-total // page_size) if page_size else 0,
+            "numberOfElements": len(chosen),
+            "data": [segments[where[i]].records[int(docs[i])] for i in chosen],
+            "scores": [round(float(scores[i]), 4) for i in chosen],
+            "facets": {
+                field: [{"value": v, "count": c}
+                        for v, c in sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))[:facet_size]]
+                for field, counter in zip(self.facet_fields, facets)
+            },
+        }
@@ -0,0 +1,76 @@
+"""
+Deduplicación de llamadas idénticas en curso ("single-flight").
+
+SingleFlight agrupa las llamadas concurrentes con la misma clave dentro de
+un proceso: la primera hace el trabajo y las demás esperan su resultado.
+file_lock extiende la exclusión a varios procesos del mismo host (workers
+de gunicorn) mediante un lock de archivo.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo deduplicación dentro del proceso
+    fcntl = None
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Ejecuta fn() una sola vez por clave entre los hilos concurrentes.
+        Devuelve (resultado, compartido); compartido es True para los hilos
+        que recibieron el resultado de otro. Los errores también se comparten.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+@contextmanager
+def file_lock(path):
+    """Lock exclusivo (bloqueante) sobre `path`, compartido entre procesos."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
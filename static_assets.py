@@ -0,0 +1,190 @@
+"""
+Entrega comprimida y cacheable de los JSON estáticos grandes
+(cmc_category_tree.json y el dataset local).
+
+Para cada archivo se calcula un hash del contenido (ETag fuerte y versión
+para las URLs) y se generan variantes gzip y brotli en disco. Las variantes
+se reconstruyen solo cuando cambia el archivo original (mtime o tamaño), y
+si ya existen en disco para ese hash se reutilizan entre reinicios.
+La variante brotli (calidad máxima, lenta) se arma en un hilo aparte
+cuando el archivo cambia con la app andando; hasta que esté se sirve gzip.
+warm() espera a que estén todas.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se sirve gzip
+    brotli = None
+
+# Codificación -> (extensión del archivo, sufijo del ETag)
+ENCODINGS = {
+    'br': ('br', '-br'),
+    'gzip': ('gz', '-gz'),
+}
+
+# Codificaciones que no se arman dentro de una solicitud
+BACKGROUND_ENCODINGS = ('br',)
+
+
+def _compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class StaticAsset:
+    __slots__ = ('path', 'stat_key', 'digest', 'variants')
+
+    def __init__(self, path, stat_key, digest, variants):
+        self.path = path
+        self.stat_key = stat_key
+        self.digest = digest
+        self.variants = variants
+
+    @property
+    def version(self):
+        return self.digest[:12]
+
+    def etag(self, encoding=None):
+        suffix = ENCODINGS[encoding][1] if encoding else ''
+        return f'"{self.digest}{suffix}"'
+
+
+class StaticAssets:
+    def __init__(self, folder, cache_folder, names, resolve=None):
+        self.folder = folder
+        # Opcional: nombre -> ruta del archivo (p. ej. la generación vigente del dataset)
+        self.resolve = resolve
+        self.cache_folder = cache_folder
+        self.names = list(names)
+        self._assets = {}
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def encodings(self):
+        return [e for e in ENCODINGS if e != 'br' or brotli is not None]
+
+    def _build(self, name, path, stat_key):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        os.makedirs(self.cache_folder, exist_ok=True)
+        variants = {}
+        later = []
+        for encoding in self.encodings:
+            ext = ENCODINGS[encoding][0]
+            variant = os.path.join(self.cache_folder, f"{name}.{digest}.{ext}")
+            if os.path.exists(variant):
+                variants[encoding] = variant
+            elif encoding in BACKGROUND_ENCODINGS:
+                later.append((encoding, variant))
+            else:
+                variants[encoding] = self._write_variant(encoding, data, variant)
+        self._remove_old_variants(name, digest)
+        asset = StaticAsset(path, stat_key, digest, variants)
+        if later:
+            thread = threading.Thread(target=self._build_later, args=(asset, data, later),
+                                      name=f'static-{name}', daemon=True)
+            self._pending[name] = thread
+            thread.start()
+        return asset
+
+    @staticmethod
+    def _write_variant(encoding, data, variant):
+        tmp = f"{variant}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_compress(encoding, data))
+        os.replace(tmp, variant)
+        return variant
+
+    def _build_later(self, asset, data, later):
+        for encoding, variant in later:
+            try:
+                self._write_variant(encoding, data, variant)
+            except OSError:
+                continue
+            # Se reemplaza el dict entero (en el orden de preferencia de ENCODINGS):
+            # quien ya lo leyó sigue con el anterior
+            variants = dict(asset.variants, **{encoding: variant})
+            asset.variants = {e: variants[e] for e in ENCODINGS if e in variants}
+
+    def wait(self):
+        """Espera a que terminen las variantes que se están armando en segundo plano."""
+        while self._pending:
+            _, thread = self._pending.popitem()
+            thread.join()
+
+    def _remove_old_variants(self, name, digest):
+        prefix = f"{name}."
+        for entry in os.listdir(self.cache_folder):
+            if entry.startswith(prefix) and not entry.startswith(f"{name}.{digest}."):
+                try:
+                    os.remove(os.path.join(self.cache_folder, entry))
+                except OSError:
+                    pass
+
+    def get(self, name):
+        """Devuelve el StaticAsset actualizado de `name`, o None si no existe."""
+        if name not in self.names:
+            return None
+        path = self.resolve(name) if self.resolve is not None else os.path.join(self.folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stat_key = (st.st_mtime_ns, st.st_size)
+        asset = self._assets.get(name)
+        if asset is not None and asset.stat_key == stat_key:
+            return asset
+        with self._lock:
+            asset = self._assets.get(name)
+            if asset is None or asset.stat_key != stat_key:
+                asset = self._assets[name] = self._build(name, path, stat_key)
+        return asset
+
+    def warm(self):
+        """Prepara todas las variantes (al arrancar)."""
+        for name in self.names:
+            self.get(name)
+        self.wait()
+
+    def versions(self):
+        """{nombre: versión} de los archivos disponibles, para armar URLs versionadas."""
+        out = {}
+        for name in self.names:
+            asset = self.get(name)
+            if asset is not None:
+                out[name] = asset.version
+        return out
+
+
+def choose_encoding(accept_encodings, available):
+    """Mejor codificación aceptada por el cliente entre las disponibles (o None)."""
+    best = None
+    best_quality = 0
+    for encoding in available:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def etag_matches(if_none_match, asset):
+    """True si el cliente ya tiene alguna variante del contenido actual."""
+    if not if_none_match:
+        return False
+    base = asset.digest
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == '*' or tag == base or tag in (base + s for _, s in ENCODINGS.values()):
+            return True
+    return False
@@ -0,0 +1,285 @@
+"""
+Sincronización del dataset local con la API del KCDB (job fuera de línea).
+
+    python sync_dataset.py [--areas EM] [--workers 4] [--rate 2] [--api-url URL]
+
+Recorre los pares área/país de cmc_category_tree.json y pide cada uno a
+searchData (todas las páginas, con el mismo payload que arma la interfaz)
+en paralelo y con un límite de solicitudes por segundo. Cada registro se
+compara por id y hash de contenido con la sincronización anterior, y solo
+los nuevos o modificados se escriben en el almacén deduplicado
+(DATASET_FOLDER/records); cada sincronización deja un manifiesto
+sync_*.json con los [id, hash] de todos sus registros.
+
+Si hubo cambios se arma una generación nueva (DATASET_FOLDER/gen-*/ con el
+dataset y el árbol de categorías reconstruido) y se publica cambiando el
+enlace DATASET_FOLDER/current con un único rename: quien lea ve la
+generación anterior completa o la nueva completa. La app detecta el cambio
+y reconstruye su índice y su árbol en segundo plano. Un segmento que falla
+conserva los registros que tenía en la sincronización anterior.
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import Config
+from upstream import UpstreamClient
+from response_store import ResponseStore, record_hash, is_manifest
+from local_index import field_values
+
+logger = logging.getLogger('kcdb.sync')
+
+SYNC_PREFIX = 'sync_'
+GENERATION_PREFIX = 'gen-'
+
+
+def tree_segments(tree, areas=None):
+    """Pares (área, país) del primer y segundo nivel del árbol, ordenados."""
+    segments = []
+    for area, countries in tree.items():
+        if area.startswith('_') or not isinstance(countries, dict):
+            continue
+        if areas and area not in areas:
+            continue
+        segments.extend((area, country) for country in countries if not country.startswith('_'))
+    return sorted(segments)
+
+
+def segment_payload(area, country, page_size=None):
+    """Payload de searchData para un segmento (como lo arma la cascada de la interfaz)."""
+    return {
+        "page": 0,
+        "pageSize": page_size or Config.UPSTREAM_PAGE_SIZE,
+        "showTable": True,
+        Config.CASCADE_FIELDS[0]: area,
+        Config.CASCADE_FIELDS[1]: country,
+    }
+
+
+def add_to_tree(tree, record, fields):
+    """
+    Agrega los caminos de la cascada del registro (hasta el primer campo
+    vacío). Los campos de varios valores (instrument, instrumentMethod) se
+    separan como en LocalIndex y recMatches: un camino por cada valor.
+    """
+    if not fields:
+        return
+    values = [v for v in dict.fromkeys(field_values(record, fields[0])) if isinstance(v, str) and v]
+    for value in values:
+        add_to_tree(tree.setdefault(value, {}), record, fields[1:])
+
+
+def sorted_tree(node):
+    return {k: sorted_tree(node[k]) for k in sorted(node)}
+
+
+class DatasetSync:
+    def __init__(self, client, folder=None, workers=None, page_size=None, max_records=None,
+                 keep_generations=None):
+        self.client = client
+        self.folder = folder or Config.DATASET_FOLDER
+        self.workers = workers or Config.SYNC_WORKERS
+        self.page_size = page_size or Config.UPSTREAM_PAGE_SIZE
+        self.max_records = max_records or Config.UPSTREAM_MAX_RECORDS
+        self.keep_generations = keep_generations or Config.SYNC_KEEP_GENERATIONS
+        self.store = ResponseStore(self.folder, snapshot_prefixes=(SYNC_PREFIX,),
+                                   max_snapshots=self.keep_generations, max_age_days=36500)
+
+    @property
+    def current_link(self):
+        return os.path.join(self.folder, 'current')
+
+    def previous(self):
+        """Manifiesto de la última sincronización ({} si no hay)."""
+        for path in self.store.snapshots():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    doc = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if is_manifest(doc):
+                return doc
+        return {}
+
+    @staticmethod
+    def previous_segments(doc):
+        """{(área, país): entradas} de un manifiesto (las entradas van contiguas por segmento)."""
+        out, start = {}, 0
+        records = doc.get('records', [])
+        for area, country, n in doc.get('segments', []):
+            out[(area, country)] = records[start:start + n]
+            start += n
+        return out
+
+    def fetch_segment(self, segment, known):
+        """
+        Baja un segmento y guarda los registros nuevos o modificados.
+        Devuelve (entradas [id, hash, hash de tabla], registros escritos).
+        """
+        entries, batch, slots = [], [], []
+
+        def flush():
+            for slot, entry in zip(slots, self.store.put_records(batch)):
+                entries[slot] = entry
+            batch.clear()
+            slots.clear()
+
+        payload = segment_payload(*segment, page_size=self.page_size)
+        written = 0
+        for page in self.client.iter_page_streams(payload, page_size=self.page_size, workers=1,
+                                                  max_records=self.max_records):
+            for record in page:
+                previous = known.get(record.get('id')) if isinstance(record, dict) else None
+                if previous is not None and previous[1] == record_hash(record):
+                    entries.append(previous)
+                    continue
+                slots.append(len(entries))
+                entries.append(None)
+                batch.append(record)
+                written += 1
+                if len(batch) >= self.store.write_batch:
+                    flush()
+        flush()
+        if len(entries) >= self.max_records:
+            logger.warning("%s / %s: se cortó en %d registros (UPSTREAM_MAX_RECORDS)", *segment, len(entries))
+        return entries, written
+
+    def run(self, segments, force=False):
+        """Sincroniza los segmentos y publica una generación nueva si algo cambió. Devuelve un resumen."""
+        prev_doc = self.previous()
+        prev_segments = self.previous_segments(prev_doc)
+        known = {e[0]: e for e in prev_doc.get('records', []) if e[0] is not None}
+        summary = {"segments": len(segments), "failed": [], "added": 0, "changed": 0,
+                   "removed": 0, "unchanged": 0, "written": 0, "generation": None}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(segment, pool.submit(self.fetch_segment, segment, known)) for segment in segments]
+            results = []
+            for segment, future in futures:
+                try:
+                    entries, written = future.result()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    logger.warning("%s / %s: falló (%s); se conservan sus registros anteriores", *segment, e)
+                    summary["failed"].append(list(segment))
+                    entries, written = prev_segments.get(segment, []), 0
+                results.append((segment, entries))
+                summary["written"] += written
+
+        seen = set()
+        for _, entries in results:
+            for record_id, digest, *_ in entries:
+                seen.add(record_id)
+                previous = known.get(record_id)
+                if previous is None:
+                    summary["added"] += 1
+                elif previous[1] != digest:
+                    summary["changed"] += 1
+                else:
+                    summary["unchanged"] += 1
+        summary["removed"] = len(set(known) - seen)
+        summary["records"] = sum(len(entries) for _, entries in results)
+
+        changed = summary["added"] or summary["changed"] or summary["removed"]
+        if not changed and not force and os.path.islink(self.current_link):
+            logger.info("Sin cambios: se mantiene la generación vigente")
+            return summary
+
+        name = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        entries = [entry for _, entries in results for entry in entries]
+        segments_meta = [[area, country, len(entries)] for (area, country), entries in results]
+        generation = self.write_generation(GENERATION_PREFIX + name, entries)
+        self.store.write_snapshot(os.path.join(self.folder, f"{SYNC_PREFIX}{name}.json"), entries,
+                                  meta={"segments": segments_meta, "generation": os.path.basename(generation),
+                                        "syncedAt": datetime.now().isoformat(timespec='seconds')})
+        self.publish(generation)
+        # Los manifiestos que se borran liberan sus registros en la compactación
+        self.store.max_snapshots = self.keep_generations
+        self.store.apply_retention()
+        self.prune_generations()
+        summary["generation"] = generation
+        return summary
+
+    def write_generation(self, name, entries):
+        """Escribe el dataset y el árbol de categorías de una generación nueva (aún no publicada)."""
+        path = os.path.join(self.folder, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp)
+        tree = {}
+        fields = Config.CASCADE_FIELDS
+        with open(os.path.join(tmp, Config.DEFAULT_LOCAL_JSON), 'w', encoding='utf-8') as f:
+            f.write('{"data":[')
+            for i, entry in enumerate(entries):
+                record = self.store.get_record(entry[1])
+                if i:
+                    f.write(',')
+                json.dump(record, f, separators=(',', ':'), ensure_ascii=False)
+                if isinstance(record, dict):
+                    add_to_tree(tree, record, fields)
+            f.write(f'],"totalElements":{len(entries)}}}')
+        with open(os.path.join(tmp, Config.DEFAULT_TREE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(sorted_tree(tree), f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def publish(self, generation):
+        """Apunta DATASET_FOLDER/current a la generación con un único rename (atómico)."""
+        tmp = f"{self.current_link}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(os.path.basename(generation), tmp)
+        os.replace(tmp, self.current_link)
+        logger.info("Generación publicada: %s", generation)
+
+    def prune_generations(self):
+        """Borra las generaciones más viejas (nunca la vigente)."""
+        current = os.path.realpath(self.current_link)
+        names = sorted(n for n in os.listdir(self.folder)
+                       if n.startswith(GENERATION_PREFIX) and not n.endswith('.tmp'))
+        for name in names[:-self.keep_generations]:
+            path = os.path.join(self.folder, name)
+            if os.path.realpath(path) != current:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sincroniza el dataset local con la API del KCDB.")
+    parser.add_argument('--tree', default=Config.get_dataset_file(Config.DEFAULT_TREE_FILE),
+                        help="Árbol de categorías con los pares área/país a recorrer")
+    parser.add_argument('--areas', nargs='*', help="Solo estas áreas (p. ej. EM)")
+    parser.add_argument('--folder', default=Config.DATASET_FOLDER)
+    parser.add_argument('--api-url', default=Config.BIPM_API_URL)
+    parser.add_argument('--workers', type=int, default=Config.SYNC_WORKERS)
+    parser.add_argument('--rate', type=float, default=Config.SYNC_RATE_LIMIT,
+                        help="Solicitudes por segundo a la API (0 = sin límite)")
+    parser.add_argument('--force', action='store_true', help="Publica una generación aunque no haya cambios")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    with open(args.tree, 'r', encoding='utf-8') as f:
+        segments = tree_segments(json.load(f), args.areas)
+    client = UpstreamClient(
+        url=args.api_url,
+        connect_timeout=Config.UPSTREAM_CONNECT_TIMEOUT,
+        read_timeout=Config.UPSTREAM_READ_TIMEOUT,
+        retries=Config.UPSTREAM_RETRIES,
+        backoff=Config.UPSTREAM_BACKOFF,
+        pool_size=max(Config.UPSTREAM_POOL_SIZE, args.workers * 2),
+        max_concurrency=max(Config.UPSTREAM_MAX_CONCURRENCY, args.workers * 2),
+        rate_limit=args.rate,
+    )
+    summary = DatasetSync(client, folder=args.folder, workers=args.workers).run(segments, force=args.force)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Pruebas de las rutas de consulta de app.py contra un servidor KCDB local.
+"""
+
+import json
+
+import pytest
+
+import app as app_module
+from config import Config
+from test_todojunto import TABLE
+
+
+@pytest.fixture
+def records(kcdb_stub, monkeypatch):
+    monkeypatch.setattr(Config, 'UPSTREAM_PAGE_SIZE', 100)
+    kcdb_stub.records = [
+        {"id": i, "kcdbCode": f"EM-{i}", "countryValue": "AR",
+         "uncertaintyTable": {"tableContents": "{}" if i % 2 else "<masked>"}}
+        for i in range(250)
+    ]
+    return kcdb_stub.records
+
+
+def test_query_trae_todas_las_paginas(app_client, records):
+    resp = app_client.post('/api/advanced_search', json={"countryValue": "AR", "page": 0, "pageSize": 20})
+
+    assert resp.status_code == 200
+    saved = app_module.response_store.load_response(resp.json["filename"])
+    assert [r["id"] for r in saved["data"]] == list(range(250))
+    assert saved["numberOfElements"] == saved["totalElements"] == 250
+    assert [t["id"] for t in resp.json["tables"]] == list(range(1, 250, 2))
+
+
+def test_query_una_sola_pagina(app_client, records, kcdb_stub):
+    resp = app_client.post('/api/query_bipm', json={"page": 1, "pageSize": 20, "allPages": False})
+
+    saved = app_module.response_store.load_response(resp.json["filename"])
+    assert [r["id"] for r in saved["data"]] == list(range(20, 40))
+    assert kcdb_stub.calls == 1
+
+
+def test_query_stream_ndjson(app_client, records):
+    resp = app_client.post('/api/query_bipm/stream', json={"countryValue": "AR"})
+
+    assert resp.mimetype == 'application/x-ndjson'
+    assert resp.headers['X-Total-Elements'] == '250'
+    lines = resp.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == list(range(250))
+
+
+def test_grilla_limita_los_puntos(app_client, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(Config, 'GRID_MAX_POINTS', 100)
+    entries = app_module.response_store.put_records([{"id": 1, "uncertaintyTable": {"tableContents": TABLE}}])
+    filename = app_module.snapshot_filename("kcdb_response")
+    app_module.save_snapshot(filename, entries, None)
+    payload = {"filename": filename, "table_id": 1, "voltages": ["5 V"],
+               "frequencies": {"start": "10 kHz", "stop": "50 kHz", "num": 100}}
+
+    resp = app_client.post('/api/lookup/grid', json=payload)
+    assert resp.status_code == 200 and len(resp.json["frequencies"]) == 100
+
+    payload["frequencies"]["num"] = 10**9
+    resp = app_client.post('/api/lookup/grid', json=payload)
+    assert resp.status_code == 400
+    assert "el máximo es 100" in resp.json["message"]
+
+
+def test_lookup_batch_un_resultado_por_punto(app_client):
+    entries = app_module.response_store.put_records([
+        {"id": 1, "uncertaintyTable": {"tableContents": TABLE}},
+        {"id": 2, "uncertaintyTable": {"tableContents": TABLE}},
+    ])
+    filename = app_module.snapshot_filename("kcdb_response")
+    app_module.save_snapshot(filename, entries, None)
+    points = [{"voltage": "2 V", "frequency": "10 kHz", "table_id": 1},
+              {"voltage": "2 V", "frequency": "10 kHz"}]
+
+    resp = app_client.post('/api/lookup/batch', json={"filename": filename, "points": points})
+    results = resp.json["results"]
+    assert resp.status_code == 200 and [r["index"] for r in results] == [0, 1]
+    assert results[0]["success"] and results[0]["result"] == 7.0
+    assert results[1]["success"] is False and "table_id" in results[1]["message"]
+
+    resp = app_client.post('/api/lookup/batch', json={"filename": filename, "points": points,
+                                                      "table_ids": [2, 9]})
+    assert [(r["index"], r["table_id"], r["success"]) for r in resp.json["results"]] == [
+        (0, 1, True), (1, 2, True), (1, 9, False)]
+
+    assert app_client.post('/api/lookup/batch', json={"filename": filename}).status_code == 400
+    resp = app_client.post('/api/lookup/batch', json={"filename": "no_existe.json", "points": points})
+    assert resp.status_code == 404
@@ -0,0 +1,166 @@
+"""
+Pruebas del modo de servicio async (asgi.py) contra un servidor KCDB local.
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import app as app_module
+import asgi
+from async_upstream import AsyncUpstreamClient
+from config import Config
+from test_todojunto import TABLE
+
+
+@pytest.fixture
+def client(app_client, kcdb_stub, monkeypatch):
+    """Corre `scenario(http)` contra la app ASGI con un cliente httpx en un loop nuevo."""
+    monkeypatch.setattr(Config, 'UPSTREAM_PAGE_SIZE', 100)
+    monkeypatch.setattr(asgi, 'upstream_client', AsyncUpstreamClient(retries=0))
+    kcdb_stub.records = [
+        {"id": i, "kcdbCode": f"EM-{i}", "countryValue": "AR",
+         "uncertaintyTable": {"tableContents": TABLE if i % 2 else "<masked>"}}
+        for i in range(250)
+    ]
+
+    def run(scenario):
+        async def main():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test', timeout=30) as http:
+                try:
+                    return await scenario(http)
+                finally:
+                    await asgi.upstream_client.aclose()
+        return asyncio.run(main())
+
+    return run
+
+
+def test_query_mismo_contrato_que_flask(client, app_client):
+    async def scenario(http):
+        first = await http.post('/api/advanced_search', json={"countryValue": "AR"})
+        second = await http.post('/api/advanced_search', json={"countryValue": "AR"})
+        return first, second
+
+    first, second = client(scenario)
+
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS' and second.headers['X-Cache'] == 'HIT'
+    assert 'upstream_fetch' in first.headers['Server-Timing']
+    body = first.json()
+    assert body["success"] and body["message"].startswith("Búsqueda avanzada completada")
+    assert [t["id"] for t in body["tables"]] == list(range(1, 250, 2))
+    saved = app_module.response_store.load_response(body["filename"])
+    assert [r["id"] for r in saved["data"]] == list(range(250))
+    assert saved["numberOfElements"] == saved["totalElements"] == 250
+    # El archivo guardado sirve igual para las rutas de Flask
+    resp = app_client.post('/api/lookup', json={"filename": body["filename"], "table_id": 1,
+                                                "voltage": "5 V", "frequency": "20 kHz"})
+    assert resp.json["success"]
+
+
+def test_query_una_sola_pagina(client, kcdb_stub):
+    async def scenario(http):
+        return await http.post('/api/query_bipm', json={"page": 1, "pageSize": 20, "allPages": False})
+
+    resp = client(scenario)
+
+    saved = app_module.response_store.load_response(resp.json()["filename"])
+    assert [r["id"] for r in saved["data"]] == list(range(20, 40))
+    assert kcdb_stub.calls == 1
+
+
+def test_query_stream_ndjson(client):
+    async def scenario(http):
+        return await http.post('/api/query_bipm/stream', json={"countryValue": "AR"})
+
+    resp = client(scenario)
+
+    assert resp.headers['Content-Type'] == 'application/x-ndjson'
+    assert resp.headers['X-Total-Elements'] == '250'
+    assert [json.loads(line)["id"] for line in resp.text.splitlines()] == list(range(250))
+
+
+def test_error_de_la_api(client, kcdb_stub):
+    kcdb_stub.fail_times = 1
+
+    async def scenario(http):
+        return await http.post('/api/query_bipm', json={"countryValue": "AR"})
+
+    resp = client(scenario)
+
+    assert resp.status_code == 500
+    assert resp.json()["message"].startswith("Error de red o API")
+
+
+def test_consultas_identicas_se_hacen_una_vez(client, kcdb_stub):
+    kcdb_stub.delay = 0.2
+
+    async def scenario(http):
+        payload = {"countryValue": "AR", "allPages": False}
+        return await asyncio.gather(*[http.post('/api/query_bipm', json=payload) for _ in range(5)])
+
+    responses = client(scenario)
+
+    assert sorted(r.headers['X-Cache'] for r in responses) == ['COALESCED'] * 4 + ['MISS']
+    assert len({r.json()["filename"] for r in responses}) == 1
+    assert kcdb_stub.calls == 1
+
+
+def test_consultas_lentas_no_demoran_las_busquedas(client, kcdb_stub):
+    async def scenario(http):
+        saved = await http.post('/api/query_bipm', json={"countryValue": "AR", "allPages": False})
+        filename = saved.json()["filename"]
+        kcdb_stub.delay = 1.0
+        start = time.perf_counter()
+        # Cien consultas distintas esperando a la API al mismo tiempo
+        slow = [asyncio.ensure_future(http.post('/api/query_bipm', json={"page": i, "allPages": False}))
+                for i in range(100)]
+        while kcdb_stub.calls < 50:
+            await asyncio.sleep(0.01)
+        lookup_start = time.perf_counter()
+        lookup = await http.post('/api/lookup', json={"filename": filename, "table_id": 1,
+                                                      "voltage": "5 V", "frequency": "20 kHz"})
+        lookup_seconds = time.perf_counter() - lookup_start
+        responses = await asyncio.gather(*slow)
+        return lookup, lookup_seconds, responses, time.perf_counter() - start
+
+    lookup, lookup_seconds, responses, elapsed = client(scenario)
+
+    assert lookup.json()["success"]
+    assert lookup_seconds < 0.5
+    assert [r.json() for r in responses if r.status_code != 200] == []
+    # En serie serían 100 s
+    assert elapsed < 10
+
+
+def test_rutas_de_flask_pasan_tal_cual(client):
+    async def scenario(http):
+        index = await http.get('/')
+        metrics = await http.get('/metrics')
+        missing = await http.get('/api/query_bipm')
+        return index, metrics, missing
+
+    index, metrics, missing = client(scenario)
+
+    assert index.status_code == 200 and 'text/html' in index.headers['Content-Type']
+    assert 'kcdb_http_requests_total' in metrics.text
+    assert missing.status_code == 405
+
+
+def test_estadisticas_cuentan_el_cliente_async(client, kcdb_stub):
+    async def scenario(http):
+        await http.post('/api/query_bipm', json={"countryValue": "AR"})
+        stats = await http.get('/api/upstream/stats')
+        metrics = await http.get('/metrics')
+        return stats, metrics
+
+    stats, metrics = client(scenario)
+
+    assert stats.json()["stats"]["calls"] == kcdb_stub.calls == 3
+    assert stats.json()["stats"]["p50"] is not None
+    assert 'kcdb_upstream_calls_total{kind="calls"} 3' in metrics.text
@@ -0,0 +1,49 @@
+"""
+Pruebas de humo de la suite de benchmarks (bench.py).
+"""
+
+import bench
+from response_store import ResponseStore
+from todojunto import compile_tableContents, parse_quantity, tableContents_to_cells
+
+
+def test_tablas_sinteticas_se_compilan():
+    for n_rows, n_cols in bench.TABLE_SIZES.values():
+        contents = bench.synthetic_table(n_rows, n_cols, seed=3)
+        assert tableContents_to_cells(contents)
+        expected = {parse_quantity(bench.frequency_label(c), "Hz") for c in range(n_cols)}
+        assert list(compile_tableContents(contents).frequencies) == sorted(expected)
+
+
+def test_respuesta_guardada_sintetica(tmp_path):
+    store = ResponseStore(str(tmp_path))
+    records = bench.synthetic_records(5, size="small")
+    filename = bench.write_saved_response(store, str(tmp_path), records)
+
+    tables = store.get_tables(filename, {1, 5})
+    assert tables == {1: records[0]["uncertaintyTable"]["tableContents"],
+                      5: records[4]["uncertaintyTable"]["tableContents"]}
+
+
+def test_run_benchmarks_filtra_y_mide():
+    results = bench.run_benchmarks(quick=True, only="parse_quantity", log=lambda *_: None)
+
+    assert list(results) == ["parse_quantity[x8]"]
+    result = results["parse_quantity[x8]"]
+    assert result["ops_per_sec"] > 0 and result["p50_ms"] <= result["p99_ms"]
+    assert result["peak_kb"] >= 0
+
+
+def test_compare_marca_regresiones():
+    baseline = {"a": {"ops_per_sec": 100.0}, "b": {"ops_per_sec": 100.0}}
+    results = {"a": {"ops_per_sec": 90.0}, "b": {"ops_per_sec": 50.0}, "c": {"ops_per_sec": 1.0}}
+
+    rows = {name: regressed for name, _, _, _, regressed in bench.compare(results, baseline, 0.25)}
+    assert rows == {"a": False, "b": True, "c": False}
+
+
+def test_linea_base_ida_y_vuelta(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    bench.save_baseline({"a": {"ops_per_sec": 1.5}}, path)
+    assert bench.load_baseline(path) == {"a": {"ops_per_sec": 1.5}}
+    assert bench.load_baseline(str(tmp_path / "no_existe.json")) == {}
@@ -0,0 +1,133 @@
+"""
+Pruebas de la búsqueda de la mejor CMC entre tablas (best_cmc.py).
+"""
+
+import pytest
+
+import app as app_module
+from best_cmc import best_cmc, coverage_index, parse_range
+from local_index import LocalIndex
+from test_todojunto import TABLE, make_table_contents
+
+# 7 µV/V a 5 V y 10 kHz; 8 a 50 kHz
+GOOD = make_table_contents([("1 V to 10 V", ["2", "3"])], ["10 kHz", "50 kHz"])
+# Solo milivoltios: nunca cubre 5 V
+LOW = make_table_contents([("10 mV to 100 mV", ["1", "1"])], ["10 kHz", "50 kHz"])
+# Corriente: otra unidad en el primer eje
+CURRENT = make_table_contents([("1 A to 10 A", ["0.5", "0.5"])], ["10 kHz", "50 kHz"])
+
+
+def record(i, table, country="AR"):
+    return {"id": i, "kcdbCode": f"EM-{i}", "countryValue": country, "metrologyAreaLabel": "EM",
+            "quantityValue": "AC voltage", "uncertaintyTable": {"tableContents": table}}
+
+
+@pytest.fixture
+def index():
+    return LocalIndex([
+        record(1, TABLE, "AR"),
+        record(2, GOOD, "DE"),
+        record(3, LOW, "DE"),
+        record(4, CURRENT, "AR"),
+        record(5, "<masked>", "AR"),
+        record(6, TABLE, "DE"),
+    ])
+
+
+def ranking(results):
+    return [(r["id"], r["uncertainty"]) for r in results]
+
+
+def test_parse_range():
+    assert parse_range("5 V") == (5.0, 5.0, 'V')
+    assert parse_range({"min": "500 mV", "max": "5 V"}) == (0.5, 5.0, 'V')
+    assert parse_range(["50 kHz", "10 kHz"]) == (10e3, 50e3, 'Hz')
+    with pytest.raises(ValueError):
+        parse_range({"min": "5 V", "max": "5 A"})
+    with pytest.raises(ValueError):
+        parse_range({"min": "5 V"})
+
+
+def test_ranking_y_poda(index):
+    results, stats = best_cmc(index, "5 V", "10 kHz")
+
+    assert ranking(results) == [(2, 2.0), (1, 7.0), (6, 7.0)]
+    assert [r["rank"] for r in results] == [1, 2, 3]
+    assert results[0]["kcdbCode"] == "EM-2" and results[0]["country"] == "DE"
+    # La tabla de mV y la de corriente no se evalúan
+    assert stats == {"tables": 5, "candidates": 3, "matches": 3}
+
+
+def test_top_k_y_filtros(index):
+    results, _ = best_cmc(index, "5 V", "10 kHz", k=1)
+    assert ranking(results) == [(2, 2.0)]
+
+    results, stats = best_cmc(index, "5 V", "10 kHz", filters={"countryValue": "AR"})
+    assert ranking(results) == [(1, 7.0)]
+    assert stats["candidates"] == 1
+
+
+def test_rango_toma_el_peor_caso_y_exige_cobertura(index):
+    results, _ = best_cmc(index, {"min": "5 V", "max": "5 V"}, ["10 kHz", "50 kHz"])
+    assert ranking(results) == [(2, 3.0), (1, 8.0), (6, 8.0)]
+
+    # GOOD no llega a 50 V
+    results, _ = best_cmc(index, ["5 V", "50 V"], "10 kHz")
+    assert ranking(results) == [(1, 7.0), (6, 7.0)]
+
+    # GOOD solo cubre 10-50 kHz: un rango más ancho de frecuencia la descarta
+    results, stats = best_cmc(index, "5 V", ["1 Hz", "1 MHz"])
+    assert results == [] and stats["candidates"] == 0
+    results, _ = best_cmc(index, "5 V", ["10 kHz", "100 kHz"])
+    assert ranking(results) == [(1, 45.0), (6, 45.0)]
+    # Las columnas que encierran el rango también cuentan
+    results, _ = best_cmc(index, "5 V", ["20 kHz", "30 kHz"])
+    assert ranking(results) == [(2, 3.0), (1, 8.0), (6, 8.0)]
+
+
+def test_unidades_del_eje(index):
+    results, _ = best_cmc(index, "5 A", "10 kHz")
+    assert ranking(results) == [(4, 0.5)]
+
+
+def test_indice_de_cobertura_cacheado(index):
+    assert coverage_index(index) is coverage_index(index)
+    assert len(coverage_index(index)) == 5
+
+
+def test_pool_de_procesos(index):
+    serial, _ = best_cmc(index, "5 V", "10 kHz")
+    parallel, stats = best_cmc(index, "5 V", "10 kHz", processes=2, parallel_min=1)
+    assert parallel == serial and stats["matches"] == 3
+
+
+def test_endpoint(monkeypatch, index):
+    monkeypatch.setattr(app_module, 'local_index', index)
+    client = app_module.app.test_client()
+
+    resp = client.post('/api/best_cmc', json={"voltage": "5 V", "frequency": "10 kHz",
+                                               "countryValue": "DE", "k": 5})
+    assert resp.status_code == 200
+    assert ranking(resp.json["results"]) == [(2, 2.0), (6, 7.0)]
+    assert resp.json["candidates"] == 2
+
+    assert client.post('/api/best_cmc', json={"voltage": "5 V"}).status_code == 400
+    assert client.post('/api/best_cmc', json={"voltage": "5 V", "frequency": "x"}).status_code == 400
+
+    monkeypatch.setattr(app_module, 'local_index', None)
+    assert client.post('/api/best_cmc', json={"voltage": "5 V", "frequency": "10 kHz"}).status_code == 404
+
+
+def test_endpoint_respuesta_guardada(app_client, index):
+    entries = app_module.response_store.put_records(index.records)
+    filename = app_module.snapshot_filename("kcdb_response")
+    app_module.save_snapshot(filename, entries, None)
+
+    resp = app_client.post('/api/best_cmc', json={"filename": filename,
+                                                  "voltage": "5 V", "frequency": "10 kHz", "k": 1})
+    assert ranking(resp.json["results"]) == [(2, 2.0)]
+    assert 'table_load' in resp.headers['Server-Timing']
+
+    resp = app_client.post('/api/best_cmc', json={"filename": "no_existe.json",
+                                                  "voltage": "5 V", "frequency": "10 kHz"})
+    assert resp.status_code == 404
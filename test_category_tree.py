@@ -0,0 +1,72 @@
+"""
+Pruebas de las opciones de la cascada calculadas sobre el árbol de categorías.
+"""
+
+import pytest
+
+import app as app_module
+from category_tree import CategoryTree
+
+FIELDS = ['area', 'country', 'service']
+TREE = {
+    "EM": {
+        "AR": {"DC voltage": {}, "AC voltage": {}},
+        "DE": {"DC voltage": {}, "Resistance": {}},
+    },
+    "TF": {
+        "DE": {"Frequency": {}},
+        "FR": {"_count": 3},
+    },
+}
+
+
+@pytest.fixture
+def tree():
+    return CategoryTree(TREE, fields=FIELDS)
+
+
+def values(opts):
+    return [v for v, _ in opts]
+
+
+def test_opciones_sin_seleccion(tree):
+    selections, levels = tree.options([None, None, None])
+    assert selections == [None, None, None]
+    assert levels[0] == (("EM", 4), ("TF", 1))
+    # FR no tiene caminos completos, igual que en existsPath
+    assert values(levels[1]) == ["AR", "DE"]
+    assert values(levels[2]) == ["AC voltage", "DC voltage", "Frequency", "Resistance"]
+
+
+def test_opciones_con_seleccion_en_cualquier_nivel(tree):
+    _, levels = tree.options([None, None, "DC voltage"])
+    assert levels[0] == (("EM", 2),)
+    assert levels[1] == (("AR", 1), ("DE", 1))
+    # El nivel seleccionado muestra sus alternativas compatibles con los demás
+    assert values(levels[2]) == ["AC voltage", "DC voltage", "Frequency", "Resistance"]
+
+    _, levels = tree.options([None, "DE", None])
+    assert values(levels[0]) == ["EM", "TF"]
+    assert values(levels[2]) == ["DC voltage", "Frequency", "Resistance"]
+
+
+def test_descarta_selecciones_invalidas(tree):
+    # Igual que repopulateAll: se valida nivel por nivel, de arriba hacia abajo
+    selections, levels = tree.options(["TF", "AR", "DC voltage"])
+    assert selections == [None, "AR", "DC voltage"]
+    assert values(levels[1]) == ["AR", "DE"]
+
+    selections, _ = tree.options(["EM", "FR", None])
+    assert selections == [None, None, None]
+
+
+def test_endpoint_options(monkeypatch):
+    monkeypatch.setattr(app_module, 'category_tree', CategoryTree(
+        {"EM": {"AR": {"a": {"b": {"c": {"d": {"e": {"f": {}}}}}}}}}))
+    client = app_module.app.test_client()
+
+    resp = client.get('/api/options?countryValue=AR&metrologyAreaLabel=XX')
+    assert resp.status_code == 200
+    assert resp.json["selections"][:2] == [None, "AR"]
+    assert resp.json["options"][0] == [{"value": "EM", "count": 1}]
+    assert resp.json["options"][7] == [{"value": "f", "count": 1}]
@@ -0,0 +1,111 @@
+"""
+Pruebas de la lectura incremental de respuestas JSON.
+"""
+
+import json
+
+import pytest
+
+import json_stream
+from json_stream import ArrayStream
+
+DOC = {
+    "page": 0,
+    "totalElements": 3,
+    "data": [
+        {"id": 1, "kcdbCode": "EM-AR-1", "value": 1.25e-6},
+        {"id": 2, "kcdbCode": "EM-DE-2", "label": "µV — Ω", "nested": {"a": [1, 2, {"b": None}]}},
+        {"id": 3, "value": 12345678901234567890},
+    ],
+    "numberOfElements": 3,
+}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 4096])
+def test_registros_y_meta_con_cualquier_corte_de_bloques(size):
+    raw = json.dumps(DOC, ensure_ascii=False, indent=1).encode('utf-8')
+    stream = ArrayStream(chunked(raw, size))
+
+    assert list(stream) == DOC["data"]
+    assert stream.meta == {"page": 0, "totalElements": 3, "numberOfElements": 3}
+    assert stream.count == 3
+
+
+def test_head_devuelve_las_claves_anteriores_a_data():
+    stream = ArrayStream(chunked(json.dumps(DOC).encode('utf-8'), 5))
+
+    assert stream.head() == {"page": 0, "totalElements": 3}
+    assert [r["id"] for r in stream] == [1, 2, 3]
+    assert stream.meta["numberOfElements"] == 3
+
+
+def test_arreglo_en_la_raiz_y_documentos_sin_data():
+    assert list(ArrayStream([b'[{"id": 1}, {"id": 2}]'])) == [{"id": 1}, {"id": 2}]
+    assert list(ArrayStream([b'{"data": []}'])) == []
+    stream = ArrayStream([b'{"results": [1], "format": "x"}'])
+    assert list(stream) == []
+    assert stream.meta == {"results": [1], "format": "x"}
+
+
+def test_iterar_de_nuevo_retoma_el_recorrido():
+    stream = ArrayStream([b'{"data": [{"id": 1}, {"id": 2}, {"id": 3}], "totalElements": 3}'])
+
+    for record in stream:
+        break
+    assert record == {"id": 1} and "totalElements" not in stream.meta
+    assert [r["id"] for r in stream] == [2, 3]
+    assert stream.meta == {"totalElements": 3}
+    assert list(stream) == []
+
+
+def test_limite_corta_sin_leer_el_resto():
+    stream = ArrayStream([b'{"data": [{"id": 1}, {"id": 2}, ', b'roto'], limit=2)
+
+    assert [r["id"] for r in stream] == [1, 2]
+
+
+@pytest.mark.parametrize("raw", [b'{"data": [{"id": 1}', b'{"data": [1 2]}', b'', b'{"a" 1}'])
+def test_json_invalido_lanza_value_error(raw):
+    with pytest.raises(ValueError):
+        list(ArrayStream([raw]))
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_strings_con_escapes_cortados(size):
+    data = [{"s": 'a "b" \\ [c] {d} \\"'}, ["]", "\\", {"x": "}"}], 'fin \\']
+    raw = json.dumps({"data": data, "n": 1}).encode('utf-8')
+    stream = ArrayStream(chunked(raw, size))
+
+    assert list(stream) == data and stream.meta == {"n": 1}
+
+
+def test_valor_grande_no_se_redecodifica_con_cada_bloque(monkeypatch):
+    calls = []
+
+    class Decoder:
+        def raw_decode(self, s, idx):
+            calls.append(idx)
+            return json.JSONDecoder().raw_decode(s, idx)
+
+    monkeypatch.setattr(json_stream, '_decoder', Decoder())
+    records = [{"id": i, "label": "x" * 50, "tags": ["a", "b"]} for i in range(20000)]
+    raw = json.dumps({"records": records}).encode('utf-8')
+    stream = ArrayStream(chunked(raw, 4096), key='other')
+
+    assert list(stream) == [] and stream.meta["records"] == records
+    # Un intento con el valor cortado y otro cuando está entero (más la clave)
+    assert len(raw) // 4096 > 100 and len(calls) <= 4
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / 'resp.json'
+    path.write_text(json.dumps(DOC), encoding='utf-8')
+
+    stream = ArrayStream.from_file(str(path))
+
+    assert [r["id"] for r in stream] == [1, 2, 3]
+    assert stream.meta["totalElements"] == 3
@@ -0,0 +1,61 @@
+"""
+Pruebas del índice sobre el dataset local y de /api/local/query.
+"""
+
+import pytest
+
+import app as app_module
+from local_index import LocalIndex
+
+RECORDS = [
+    {"id": 1, "metrologyAreaLabel": "EM", "countryValue": "AR", "serviceValue": "DC voltage",
+     "instrument": "Multimeter, Calibrator", "instrumentMethod": "Direct measurement"},
+    {"id": 2, "metrologyAreaLabel": "EM", "countryValue": "AR ", "serviceValue": "AC voltage",
+     "instrument": "Thermal converter / Multimeter", "instrumentMethod": "AC-DC transfer"},
+    {"id": 3, "metrologyAreaLabel": "EM", "countryValue": "DE", "serviceValue": "DC voltage",
+     "instrument": ["Calibrator"], "instrumentMethod": None},
+    {"id": 4, "metrologyAreaLabel": "TF", "countryValue": ["DE", "FR"], "serviceValue": "Frequency",
+     "instrument": "Counter;Multimeter"},
+]
+
+
+@pytest.fixture
+def index():
+    return LocalIndex(RECORDS)
+
+
+def ids(result):
+    return [r["id"] for r in result["data"]]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({}, [1, 2, 3, 4]),
+    ({"countryValue": "AR"}, [1, 2]),
+    ({"countryValue": " DE"}, [3, 4]),
+    ({"instrument": "Multimeter"}, [1, 2, 4]),
+    ({"instrument": "Calibrator", "serviceValue": "DC voltage"}, [1, 3]),
+    ({"instrument": "Multimeter", "metrologyAreaLabel": "EM", "countryValue": "AR"}, [1, 2]),
+    ({"instrumentMethod": "AC-DC transfer"}, [2]),
+    ({"countryValue": "XX"}, []),
+    ({"instrument": "Calibrator, Multimeter"}, []),
+])
+def test_query_equivale_a_recmatches(index, filters, expected):
+    assert ids(index.query(filters, page_size=10)) == expected
+
+
+def test_query_paginada(index):
+    page = index.query({"metrologyAreaLabel": "EM"}, page=1, page_size=2)
+    assert ids(page) == [3]
+    assert page["totalElements"] == 3 and page["totalPages"] == 2
+
+
+def test_endpoint_local_query(monkeypatch, index):
+    monkeypatch.setattr(app_module, 'local_index', index)
+    client = app_module.app.test_client()
+
+    resp = client.post('/api/local/query', json={"countryValue": "AR", "page": 0, "pageSize": 1, "foo": "bar"})
+    assert resp.status_code == 200
+    assert ids(resp.json) == [1] and resp.json["totalElements"] == 2
+
+    monkeypatch.setattr(app_module, 'local_index', None)
+    assert client.post('/api/local/query', json={}).status_code == 404
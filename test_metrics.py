@@ -0,0 +1,87 @@
+"""
+Pruebas de las métricas (metrics.py), del profiler por muestreo y de /metrics.
+"""
+
+import os
+import time
+
+from config import Config
+from metrics import Registry, Stages
+from sampling_profiler import SamplingProfiler
+
+
+def test_histograma_y_contador_en_formato_prometheus():
+    registry = Registry()
+    hist = registry.histogram('t_seconds', 'Tiempo', ('stage',), buckets=(0.1, 1.0))
+    counter = registry.counter('t_total', 'Total', ('result',))
+    hist.observe(0.05, stage='a')
+    hist.observe(0.5, stage='a')
+    hist.observe(5, stage='a')
+    counter.inc(result='HIT')
+    counter.inc(2, result='HIT')
+
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="a"} 3' in text
+    assert 't_total{result="HIT"} 3' in text
+    assert registry.counter('t_total', 'Total', ('result',)) is counter
+
+
+def test_stages_cuenta_tiempo_propio():
+    stages = Stages()
+    with stages.time('outer'):
+        time.sleep(0.02)
+        with stages.time('inner'):
+            time.sleep(0.03)
+    stages.move('inner', 'parse', 0.01)
+
+    assert 0.015 <= stages.seconds['outer'] < 0.03
+    assert 0.015 <= stages.seconds['inner'] < 0.03
+    assert stages.seconds['parse'] == 0.01
+    assert list(stages.timed(iter([1, 2]), 'it')) == [1, 2] and 'it' in stages.seconds
+    assert 'inner;dur=' in stages.server_timing()
+
+
+def test_profiler_muestrea_el_hilo(tmp_path):
+    profiler = SamplingProfiler(interval=0.001).start()
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    profiler.stop()
+
+    assert profiler.total > 0
+    assert 'test_profiler_muestrea_el_hilo' in profiler.collapsed()
+    path = profiler.write(str(tmp_path / 'p' / 'profile.txt'))
+    assert os.path.getsize(path) > 0
+
+
+def test_metrics_expone_etapas_y_cache(app_client, kcdb_stub):
+    kcdb_stub.records = [{"id": i, "uncertaintyTable": {"tableContents": "{}"}} for i in range(30)]
+
+    first = app_client.post('/api/query_bipm', json={"countryValue": None})
+    second = app_client.post('/api/query_bipm', json={"countryValue": None})
+    assert 'upstream_fetch;dur=' in first.headers['Server-Timing']
+    assert second.headers['X-Cache'] == 'HIT'
+
+    text = app_client.get('/metrics').get_data(as_text=True)
+    for stage in ('upstream_fetch', 'json_parse', 'file_write'):
+        assert f'kcdb_stage_seconds_count{{endpoint="/api/query_bipm",stage="{stage}"}}' in text
+    assert 'kcdb_response_cache_total{result="HIT"}' in text
+    assert 'kcdb_response_cache_total{result="MISS"}' in text
+    assert 'kcdb_payload_bytes_bucket{endpoint="/api/query_bipm",kind="upstream"' in text
+    assert 'kcdb_http_requests_total{endpoint="/api/query_bipm",method="POST",status="200"}' in text
+    assert 'kcdb_upstream_calls_total{kind="calls"}' in text
+
+
+def test_profiler_por_cabecera(app_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'PROFILE_TOKEN', 'secreto')
+
+    plain = app_client.get('/metrics', headers={Config.PROFILE_HEADER: 'otro'})
+    assert Config.PROFILE_HEADER not in plain.headers
+
+    resp = app_client.get('/metrics', headers={Config.PROFILE_HEADER: 'secreto'})
+    name = resp.headers[Config.PROFILE_HEADER]
+    assert os.path.exists(os.path.join(Config.get_profile_folder(), name))
@@ -0,0 +1,95 @@
+"""
+Pruebas del arranque con estructuras de solo lectura precargadas (warm_up)
+y de la verificación de disponibilidad en "/".
+"""
+
+import json
+import os
+import runpy
+import threading
+from array import array
+
+import app as app_module
+import todojunto
+from category_tree import CategoryTree
+from config import Config
+from local_index import CompactRecords, LocalIndex
+from test_todojunto import TABLE, make_table_contents
+
+
+def test_raiz_responde_503_hasta_estar_lista(monkeypatch):
+    client = app_module.app.test_client()
+    monkeypatch.setattr(app_module, 'ready', threading.Event())
+
+    resp = client.get('/')
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After']
+    assert client.get('/api/options').status_code == 503
+    assert client.post('/api/local/query', json={}).status_code == 503
+
+    app_module.ready.set()
+    assert client.get('/').status_code == 200
+
+
+def test_warm_up_construye_indices_y_fija_tablas(tmp_path, monkeypatch):
+    other = make_table_contents([("1 V to 2 V", ["5"])], ["1 kHz"])
+    records = [
+        {"id": 1, "countryValue": "AR", "uncertaintyTable": {"tableContents": TABLE}},
+        {"id": 2, "countryValue": "DE", "uncertaintyTable": {"tableContents": other}},
+        {"id": 3, "countryValue": "DE", "uncertaintyTable": {"tableContents": "<masked>"}},
+    ]
+    dataset = tmp_path / 'local.json'
+    dataset.write_text(json.dumps({"data": records}), encoding='utf-8')
+    monkeypatch.setattr(Config, 'DEFAULT_LOCAL_JSON', str(dataset))
+    monkeypatch.setattr(app_module, 'local_index', None)
+    monkeypatch.setattr(app_module, 'category_tree', None)
+    monkeypatch.setattr(app_module, 'ready', threading.Event())
+    todojunto.clear_table_cache()
+    try:
+        app_module.warm_up()
+
+        assert app_module.ready.is_set()
+        assert len(app_module.local_index) == 3
+        assert len(todojunto._pinned_tables) == 2
+        hits = todojunto.TABLE_CACHE_STATS["hits"]
+        assert todojunto.compile_tableContents(other) is todojunto.compile_tableContents(other)
+        assert todojunto.TABLE_CACHE_STATS["hits"] == hits + 2
+    finally:
+        todojunto.clear_table_cache()
+
+
+def test_estructuras_compactas():
+    index = LocalIndex([{"id": 1, "countryValue": "AR"}, {"id": 2, "countryValue": "ÁR"}, "x"])
+    assert isinstance(index.records, CompactRecords)
+    assert list(index.records) == [{"id": 1, "countryValue": "AR"}, {"id": 2, "countryValue": "ÁR"}, "x"]
+    assert index.records[-1] == "x"
+    assert all(isinstance(ids, array) for ids in index.postings["countryValue"].values())
+
+    tree = CategoryTree({"EM": {"AR": {"_count": 2}, "DE": {}}, "TF": {"AR": {}}}, fields=["area", "country"])
+    assert isinstance(tree._codes, array)
+    assert tree.paths == [("EM", "AR"), ("EM", "DE"), ("TF", "AR")]
+    assert tree.options_at(1, ["EM", None]) == (("AR", 1), ("DE", 1))
+
+
+def test_warm_up_en_segundo_plano_salvo_con_preload(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_module, 'warm_up', lambda: calls.append(threading.current_thread().name))
+    monkeypatch.setattr(Config, 'WARMUP_IN_BACKGROUND', True)
+
+    monkeypatch.setattr(Config, 'GUNICORN_PRELOAD', False)
+    app_module.start_warm_up()
+    for thread in threading.enumerate():
+        if thread.name == 'warm-up':
+            thread.join()
+    assert calls == ['warm-up']
+
+    # Precargada en el master de gunicorn: un hilo no llegaría a los workers
+    monkeypatch.setattr(Config, 'GUNICORN_PRELOAD', True)
+    app_module.start_warm_up()
+    assert calls == ['warm-up', threading.current_thread().name]
+
+
+def test_gunicorn_conf_avisa_el_preload(monkeypatch):
+    monkeypatch.setenv('GUNICORN_PRELOAD', 'false')
+    conf = runpy.run_path('gunicorn.conf.py')
+    assert conf['preload_app'] and os.environ['GUNICORN_PRELOAD'] == 'true'
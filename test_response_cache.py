@@ -0,0 +1,140 @@
+"""
+Pruebas de la caché de respuestas de la API contra un servidor KCDB local.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from response_cache import ResponseCache, payload_key
+from upstream import UpstreamClient
+
+
+@pytest.fixture
+def client(app_client, kcdb_stub):
+    kcdb_stub.records = [{"id": 1, "kcdbCode": "EM-AR-1", "countryValue": "AR",
+                          "uncertaintyTable": {"tableContents": "{}"}}]
+    return app_client
+
+
+def test_payload_key_canonico():
+    assert payload_key({"a": 1, "b": [1, 2]}) == payload_key({"b": [1, 2], "a": 1})
+    assert payload_key({"a": 1}) != payload_key({"a": 2})
+
+
+def test_consulta_repetida_usa_cache(client, kcdb_stub):
+    first = client.post('/api/query_bipm', json={"countryValue": "AR", "page": 0})
+    second = client.post('/api/query_bipm', json={"page": 0, "countryValue": "AR"})
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.json['filename'] == first.json['filename']
+    assert second.json['tables'] == [{"id": 1, "kcdbCode": "EM-AR-1", "quantityValue": "N/A"}]
+    assert kcdb_stub.calls == 1
+
+
+def test_nivel_en_disco_sobrevive_a_memoria(client, kcdb_stub):
+    client.post('/api/advanced_search', json={"countryValue": "AR"})
+    app_module.response_cache.clear()
+    again = client.post('/api/advanced_search', json={"countryValue": "AR"})
+
+    assert again.headers['X-Cache'] == 'HIT'
+    assert kcdb_stub.calls == 1
+
+
+def test_stale_while_revalidate(client, kcdb_stub, monkeypatch):
+    monkeypatch.setattr(app_module.response_cache, 'ttl', 0)
+    client.post('/api/query_bipm', json={"countryValue": "AR"})
+    time.sleep(0.01)
+    stale = client.post('/api/query_bipm', json={"countryValue": "AR"})
+
+    assert stale.headers['X-Cache'] == 'STALE'
+    deadline = time.time() + 5
+    while kcdb_stub.calls < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert kcdb_stub.calls == 2
+
+
+def test_errores_de_api_no_se_cachean(client, kcdb_stub):
+    kcdb_stub.fail_times = 1
+    failed = client.post('/api/query_bipm', json={"countryValue": "AR"})
+    ok = client.post('/api/query_bipm', json={"countryValue": "AR"})
+
+    assert failed.status_code == 500
+    assert ok.headers['X-Cache'] == 'MISS'
+
+
+def test_consultas_simultaneas_se_unifican(client, kcdb_stub):
+    kcdb_stub.delay = 0.2
+    results = []
+
+    def query():
+        resp = app_module.app.test_client().post('/api/query_bipm', json={"countryValue": "AR"})
+        results.append((resp.headers['X-Cache'], resp.json['filename']))
+
+    threads = [threading.Thread(target=query) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert kcdb_stub.calls == 1
+    assert len({filename for _, filename in results}) == 1
+    assert sorted(state for state, _ in results).count('MISS') == 1
+
+
+def test_consultas_simultaneas_entre_workers(kcdb_stub, tmp_path):
+    # Dos cachés sobre la misma carpeta simulan dos workers de gunicorn
+    kcdb_stub.delay = 0.2
+    folder = str(tmp_path / 'cache')
+    workers = [ResponseCache(folder), ResponseCache(folder)]
+    saved = tmp_path / 'saved.json'
+    saved.write_text('{}')
+
+    def fetch():
+        UpstreamClient(url=kcdb_stub.url).search({})
+        return {"filename": str(saved), "tables": []}
+
+    states = []
+    threads = [threading.Thread(target=lambda c=c: states.append(c.get_or_fetch({"q": 1}, fetch)[1]))
+               for c in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert kcdb_stub.calls == 1
+    assert sorted(states) == ['HIT', 'MISS']
+
+
+def test_disco_se_poda_por_edad_y_cantidad(tmp_path):
+    folder = tmp_path / 'cache'
+    cache = ResponseCache(str(folder), ttl=10, stale_ttl=10, max_disk_entries=3, prune_interval=3600)
+    saved = tmp_path / 'saved.json'
+    saved.write_text('{}')
+    keys = [payload_key({"q": i}) for i in range(6)]
+    # La primera vencida (más de ttl + stale_ttl); de las otras, sobran las dos más viejas
+    for key, age in zip(keys, [30, 5, 4, 3, 2, 1]):
+        cache.put(key, {"filename": str(saved), "tables": []})
+        os.utime(cache._path(key), (time.time() - age, time.time() - age))
+    # Lock por clave abandonado del formato anterior
+    legacy_lock = folder / f'{keys[0]}.json.lock'
+    legacy_lock.write_text('')
+    os.utime(legacy_lock, (time.time() - 7200, time.time() - 7200))
+
+    assert cache.prune() == 4
+    assert sorted(os.listdir(folder)) == sorted(f'{k}.json' for k in keys[3:])
+
+
+def test_locks_entre_workers_son_un_conjunto_fijo(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    saved = tmp_path / 'saved.json'
+    saved.write_text('{}')
+    for i in range(200):
+        cache.get_or_fetch({"q": i}, lambda: {"filename": str(saved), "tables": []})
+
+    locks = [n for n in os.listdir(tmp_path / 'cache') if n.endswith('.lock')]
+    assert 0 < len(locks) <= 64
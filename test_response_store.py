@@ -0,0 +1,159 @@
+"""
+Pruebas del almacén deduplicado de respuestas guardadas.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from response_store import ResponseStore, is_manifest
+
+
+def table_for(i):
+    return json.dumps({"row_1": {"col_1": "V", "col_2": f"{i} kHz"}, "row_2": {"col_1": "1 V", "col_2": "x" * 200}})
+
+
+def make_records(ids, version=0):
+    return [{"id": i, "kcdbCode": f"EM-{i}", "v": version,
+             "uncertaintyTable": {"tableContents": table_for(i)}}
+            for i in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResponseStore(str(tmp_path), snapshot_prefixes=('kcdb_response_',), max_snapshots=3)
+
+
+def save(store, tmp_path, name, records):
+    filename = str(tmp_path / f'kcdb_response_{name}.json')
+    store.write_snapshot(filename, store.put_records(records), meta={"totalElements": len(records)})
+    return filename
+
+
+def test_registros_se_guardan_una_sola_vez(store, tmp_path):
+    first = save(store, tmp_path, '1', make_records(range(100)))
+    pack_size = os.path.getsize(store._pack_path(0))
+    second = save(store, tmp_path, '2', make_records(range(50, 150)))
+
+    assert os.path.getsize(store._pack_path(0)) < pack_size * 1.6
+    # un blob por registro y otro por su tabla
+    assert len(store._index) == 300
+    with open(second, encoding='utf-8') as f:
+        assert is_manifest(json.load(f))
+
+    loaded = store.load_response(first)
+    assert loaded["data"] == make_records(range(100))
+    assert loaded["totalElements"] == 100
+
+
+def test_iter_records_por_id_y_formato_anterior(store, tmp_path):
+    filename = save(store, tmp_path, '1', make_records(range(10)))
+    assert [r["id"] for r in store.iter_records(filename, {3, 7})] == [3, 7]
+
+    legacy = tmp_path / 'legacy.json'
+    legacy.write_text(json.dumps({"data": make_records(range(5))}, indent=2))
+    assert [r["id"] for r in store.iter_records(str(legacy), {1, 4})] == [1, 4]
+    assert len(store.load_response(str(legacy))["data"]) == 5
+
+
+def test_otro_proceso_ve_los_registros_nuevos(store, tmp_path):
+    other = ResponseStore(str(tmp_path), snapshot_prefixes=('kcdb_response_',))
+    filename = save(store, tmp_path, '1', make_records(range(3)))
+    assert [r["id"] for r in other.iter_records(filename)] == [0, 1, 2]
+
+
+def test_retencion_y_compactacion(store, tmp_path):
+    files = []
+    for n in range(5):
+        files.append(save(store, tmp_path, str(n), make_records(range(n * 20, n * 20 + 20))))
+        os.utime(files[-1], (time.time() + n, time.time() + n))
+
+    assert store.apply_retention() == 2
+    assert [os.path.exists(f) for f in files] == [False, False, True, True, True]
+    # 40% de bytes sin usar: todavía no se compacta
+    assert len(store._index) == 200
+
+    store.max_snapshots = 2
+    assert store.apply_retention() == 1
+    assert len(store._index) == 80
+    assert [r["id"] for r in store.iter_records(files[3])] == list(range(60, 80))
+    assert store.get_tables(files[4], {85}) == {85: table_for(85)}
+    assert not os.path.exists(store.sidecar_path(files[0]))
+    assert sorted(os.listdir(store.records_folder)) == ['dead', 'index.log', 'pack-000001.bin', 'store.lock']
+
+
+def test_retencion_no_relee_los_manifiestos_en_cada_guardado(store, tmp_path, monkeypatch):
+    scans = []
+    live_manifests = store._live_manifests
+    monkeypatch.setattr(store, '_live_manifests', lambda: scans.append(1) or live_manifests())
+    # La misma consulta guardada muchas veces: borrar un manifiesto no libera nada
+    for n in range(10):
+        filename = save(store, tmp_path, str(n), make_records(range(20)))
+        os.utime(filename, (time.time() + n, time.time() + n))
+        store.apply_retention()
+
+    assert len(store.snapshots()) == 3 and len(store._index) == 40
+    # Una revisión completa cuando la estimación pasó el umbral; después espera compact_interval
+    assert len(scans) == 1
+    assert store._dead_state()[0] > 0
+
+
+def test_respuestas_borradas_por_otro_proceso_se_ignoran(store, tmp_path, monkeypatch):
+    kept = save(store, tmp_path, '1', make_records(range(3)))
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listdir(path) + ['kcdb_response_borrada.json'])
+
+    assert store.snapshots() == [kept]
+    assert store.apply_retention() == 0
+
+
+def test_compactacion_respeta_guardados_en_curso(store, tmp_path):
+    old = save(store, tmp_path, 'old', make_records(range(100)))
+    pending = str(tmp_path / 'kcdb_response_pending.json')
+    # La consulta en curso reutiliza los 100 registros ya guardados...
+    entries = store.put_records(make_records(range(100)), pin=pending)
+    # ...y mientras tanto otro guardado borra el único manifiesto que los usaba
+    os.remove(old)
+    other = ResponseStore(str(tmp_path), snapshot_prefixes=('kcdb_response_',))
+    assert other.compact() is False
+
+    store.write_snapshot(pending, entries)
+    assert not os.path.exists(store._pin_path(pending))
+    assert store.get_tables(pending, {42}) == {42: table_for(42)}
+    assert store.load_response(pending)["data"] == make_records(range(100))
+    # Ya sin fijación, lo que nadie usa se compacta
+    store.write_snapshot(pending, [])
+    assert store.compact() is True and len(store._index) == 0
+
+
+def test_fijaciones_abandonadas_se_descartan(store, tmp_path):
+    pending = str(tmp_path / 'kcdb_response_pending.json')
+    store.put_records(make_records(range(5)), pin=pending)
+    old = time.time() - 7 * 3600
+    os.utime(store._pin_path(pending), (old, old))
+
+    assert store.compact() is True
+    assert not os.path.exists(store._pin_path(pending))
+
+
+def test_get_tables_usa_el_indice_lateral(store, tmp_path, monkeypatch):
+    records = make_records(range(0, 2000, 7))
+    records.append({"id": 5000, "uncertaintyTable": {"tableContents": "<masked>"}})
+    filename = save(store, tmp_path, '1', records)
+
+    def no_full_scan(*args, **kwargs):
+        raise AssertionError("no debería leer el archivo completo")
+
+    monkeypatch.setattr(store, 'iter_records', no_full_scan)
+    assert store.get_tables(filename, {7, 1995, 8, 5000}) == {7: table_for(7), 1995: table_for(1995)}
+
+
+def test_get_tables_formato_anterior(store, tmp_path):
+    legacy = tmp_path / 'legacy.json'
+    legacy.write_text(json.dumps({"data": make_records(range(5))}, indent=2))
+    assert store.get_tables(str(legacy), {2}) == {2: table_for(2)}
+
+    with pytest.raises(FileNotFoundError):
+        store.get_tables(str(tmp_path / 'no_existe.json'), {1})
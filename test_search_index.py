@@ -0,0 +1,142 @@
+"""
+Pruebas de la búsqueda de texto libre con facetas (search_index.py).
+"""
+
+import json
+import os
+
+import pytest
+
+import app as app_module
+from config import Config
+from local_index import LocalIndex
+from search_index import SearchIndex, tokenize
+
+RECORDS = [
+    {"id": 1, "metrologyAreaLabel": "EM", "countryValue": "AR", "quantityValue": "AC voltage",
+     "instrument": "Thermal converter", "instrumentMethod": "AC-DC transfer"},
+    {"id": 2, "metrologyAreaLabel": "EM", "countryValue": "DE", "quantityValue": "AC voltage",
+     "instrument": "Thermal converter, Calibrator", "instrumentMethod": "AC-DC transfer",
+     "comments": "Transferencia térmica con convertidores de película delgada"},
+    {"id": 3, "metrologyAreaLabel": "EM", "countryValue": "DE", "quantityValue": "DC voltage",
+     "instrument": "Multimeter", "instrumentMethod": "Direct measurement"},
+    {"id": 4, "metrologyAreaLabel": "EM", "countryValue": "AR", "quantityValue": "Resistance",
+     "instrument": "Standard resistor", "serviceValue": "DC resistance"},
+]
+
+
+def ids(result):
+    return [r["id"] for r in result["data"]]
+
+
+def facet(result, field):
+    return {f["value"]: f["count"] for f in result["facets"][field]}
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(LocalIndex(RECORDS).records)
+
+
+def test_tokenize():
+    assert tokenize("Thermal Converter, AC-DC transfer") == ["thermal", "converter", "ac", "dc", "transfer"]
+    assert tokenize("Térmica  µV/V") == ["termica", "μv", "v"]
+
+
+def test_todas_las_palabras_y_ranking(index):
+    result = index.search("thermal converter AC-DC transfer")
+    assert ids(result) == [1, 2]
+    # El registro más corto puntúa más alto
+    assert result["scores"][0] > result["scores"][1]
+
+    assert ids(index.search("voltage multimeter")) == [3]
+    assert ids(index.search("voltage multimeter", match_all=False)) == [3, 1, 2]
+
+
+def test_prefijos_y_acentos(index):
+    assert sorted(ids(index.search("conv"))) == [1, 2]
+    assert ids(index.search("termica")) == [2]
+    # Un prefijo pesa la mitad que la palabra completa
+    full, prefix = index.search("transfer"), index.search("transf")
+    score = {q: dict(zip(ids(r), r["scores"])) for q, r in (("full", full), ("prefix", prefix))}
+    assert score["prefix"][1] == pytest.approx(score["full"][1] * 0.5, rel=1e-3)
+    # En el 2, "transferencia" (más rara) puntúa más que "transfer" como prefijo
+    assert ids(prefix) == [2, 1]
+    # Las palabras de una letra no se buscan como prefijo
+    assert ids(index.search("d")) == []
+
+
+def test_filtros_y_facetas(index):
+    result = index.search("voltage", {"countryValue": "DE"})
+    assert sorted(ids(result)) == [2, 3]
+    assert facet(result, "countryValue") == {"DE": 2}
+    assert facet(result, "instrument") == {"Thermal converter": 1, "Calibrator": 1, "Multimeter": 1}
+
+    result = index.search("", page=1, page_size=3)
+    assert ids(result) == [4] and result["totalElements"] == 4 and result["totalPages"] == 2
+    assert facet(result, "countryValue") == {"AR": 2, "DE": 2}
+    assert index.search("voltage", facet_size=1)["facets"]["countryValue"] == [{"value": "DE", "count": 2}]
+
+
+def test_agregados_reemplazan_y_se_funden(index):
+    changed = dict(RECORDS[2], comments="Superconducting Josephson array")
+    new = {"id": 9, "countryValue": "FR", "quantityValue": "DC voltage", "instrument": "Josephson array"}
+
+    assert index.add([changed, new]) == 2
+    assert index.add([changed, new, RECORDS[0]]) == 0
+    assert ids(index.search("josephson")) == [9, 3]
+    assert ids(index.search("multimeter")) == [3]
+    assert len(index) == 5 and index.segments == 2
+
+    index.max_segments = 2
+    index.add([dict(new, comments="otra versión")])
+    assert index.segments == 2
+    assert sorted(ids(index.search("josephson"))) == [3, 9]
+    assert ids(index.search("otra")) == [9]
+    assert sorted(ids(index.search(""))) == [1, 2, 3, 4, 9]
+
+
+def test_endpoint(monkeypatch, index):
+    monkeypatch.setattr(app_module, 'search_index', index)
+    client = app_module.app.test_client()
+
+    resp = client.post('/api/search', json={"q": "ac-dc transfer", "countryValue": "AR", "pageSize": 5})
+    assert resp.status_code == 200
+    assert ids(resp.json) == [1]
+    assert facet(resp.json, "metrologyAreaLabel") == {"EM": 1}
+    assert 'index_query' in resp.headers['Server-Timing']
+
+    assert client.post('/api/search', json={"q": 5}).status_code == 400
+    assert client.post('/api/search', json={"q": "x", "match": "some"}).status_code == 400
+
+
+def test_respuestas_guardadas_se_indexan(app_client, kcdb_stub, monkeypatch, index):
+    monkeypatch.setattr(app_module, 'search_index', index)
+    monkeypatch.setattr(Config, 'SEARCH_REFRESH_INTERVAL', 0)
+    kcdb_stub.records = [{"id": 20 + i, "countryValue": "JP", "quantityValue": "Inductance",
+                          "instrument": "Inductance bridge"} for i in range(3)]
+
+    resp = app_client.post('/api/query_bipm', json={"countryValue": "JP"})
+    assert resp.json["success"]
+    found = app_client.post('/api/search', json={"q": "inductance bridge"}).json
+    assert ids(found) == [20, 21, 22] and facet(found, "countryValue") == {"JP": 3}
+
+    # Una respuesta guardada por otro worker se agrega al revisar la carpeta
+    entries = app_module.response_store.put_records([{"id": 30, "quantityValue": "Capacitance"}])
+    app_module.response_store.write_snapshot(
+        os.path.join(app_module.response_store.folder, "kcdb_response_otro.json"), entries)
+    assert app_module.index_saved_responses(index) == 1
+    assert app_module.index_saved_responses(index) == 0
+    assert ids(index.search("capacitance")) == [30]
+
+
+def test_respuestas_del_formato_anterior_se_leen_en_streaming(app_client, monkeypatch, index):
+    folder = app_module.response_store.folder
+    with open(os.path.join(folder, "kcdb_response_viejo.json"), 'w', encoding='utf-8') as f:
+        json.dump({"totalElements": 2, "data": [{"id": 40, "quantityValue": "Inductance"},
+                                                 {"id": 41, "quantityValue": "Inductance"}]}, f)
+    # El archivo no se carga entero con json.load
+    monkeypatch.setattr(json, 'load', lambda *a, **k: pytest.fail("json.load del archivo completo"))
+
+    assert app_module.index_saved_responses(index) == 2
+    assert sorted(ids(index.search("inductance"))) == [40, 41]
@@ -0,0 +1,105 @@
+"""
+Pruebas de la entrega comprimida y cacheable de los JSON estáticos.
+"""
+
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+import app as app_module
+import static_assets
+from static_assets import StaticAssets
+
+NAME = 'cmc_category_tree.json'
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    (tmp_path / NAME).write_text(json.dumps({"EM": {"AR": {}}} | {f"k{i}": "x" * 50 for i in range(200)}))
+    assets = StaticAssets(str(tmp_path), str(tmp_path / 'static'), [NAME])
+    monkeypatch.setattr(app_module, 'static_assets', assets)
+    return assets
+
+
+@pytest.fixture
+def client(assets):
+    return app_module.app.test_client()
+
+
+def test_sirve_gzip_con_etag(client, assets, tmp_path):
+    resp = client.get(f'/{NAME}', headers={'Accept-Encoding': 'gzip'})
+
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    assert resp.headers['Cache-Control'] == 'no-cache'
+    body = gzip.decompress(resp.get_data())
+    assert body == (tmp_path / NAME).read_bytes()
+    assert len(resp.get_data()) < len(body) / 5
+
+
+def test_sin_compresion_y_304(client):
+    resp = client.get(f'/{NAME}')
+    assert 'Content-Encoding' not in resp.headers
+    etag = resp.headers['ETag']
+
+    again = client.get(f'/{NAME}', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+
+def test_url_versionada_cache_larga(client, assets):
+    version = assets.versions()[NAME]
+    resp = client.get(f'/{NAME}?v={version}', headers={'Accept-Encoding': 'gzip'})
+    assert 'immutable' in resp.headers['Cache-Control']
+
+    stale = client.get(f'/{NAME}?v=viejo')
+    assert stale.headers['Cache-Control'] == 'no-cache'
+
+
+def test_reconstruye_al_cambiar_el_archivo(client, assets, tmp_path):
+    before = assets.get(NAME)
+    path = tmp_path / NAME
+    path.write_text('{"nuevo": true}')
+    os.utime(path, ns=(before.stat_key[0] + 10**9, before.stat_key[0] + 10**9))
+
+    after = assets.get(NAME)
+    assets.wait()
+    assert after.digest != before.digest
+    assert sorted(os.listdir(tmp_path / 'static')) == sorted(
+        os.path.basename(p) for p in after.variants.values())
+
+    resp = client.get(f'/{NAME}', headers={'If-None-Match': before.etag('gzip'), 'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert json.loads(gzip.decompress(resp.get_data())) == {"nuevo": True}
+
+
+def test_solo_archivos_permitidos(client):
+    assert client.get('/config.py').status_code == 404
+
+
+def test_brotli_se_arma_fuera_de_la_solicitud(client, assets, monkeypatch):
+    brotli = pytest.importorskip("brotli")
+    monkeypatch.setattr(static_assets, 'brotli', brotli)
+    release = threading.Event()
+    compress = static_assets._compress
+
+    def slow_compress(encoding, data):
+        if encoding == 'br':
+            assert release.wait(5)
+        return compress(encoding, data)
+
+    monkeypatch.setattr(static_assets, '_compress', slow_compress)
+    headers = {'Accept-Encoding': 'br, gzip'}
+
+    # Mientras se arma brotli, la solicitud no espera y recibe gzip
+    assert client.get(f'/{NAME}', headers=headers).headers['Content-Encoding'] == 'gzip'
+    release.set()
+    assets.wait()
+    resp = client.get(f'/{NAME}', headers=headers)
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert resp.headers['ETag'] == assets.get(NAME).etag('br')
+    assert brotli.decompress(resp.get_data()) == open(assets.get(NAME).path, 'rb').read()
@@ -0,0 +1,180 @@
+"""
+Pruebas de la sincronización del dataset contra un servidor KCDB local.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+import app as app_module
+from config import Config
+from local_index import LocalIndex
+from sync_dataset import DatasetSync, tree_segments, main
+from upstream import UpstreamClient, RateLimiter
+
+TREE = {"EM": {"Argentina": {}, "Uruguay": {"_count": 1}}, "TF": {"Chile": {}}}
+
+
+def record(i, country, area='EM', **extra):
+    return dict({
+        "id": i,
+        "metrologyAreaLabel": area,
+        "countryValue": country,
+        "branchValue": "DC and low frequency",
+        "serviceValue": "DC voltage",
+        "subServiceValue": f"Sub {i % 2}",
+        "individualServiceValue": "Voltage",
+        "instrument": "Multimeter",
+        "instrumentMethod": "Comparison",
+        "uncertaintyTable": {"tableContents": f'{{"row_1":"1 V","col_1":"1 Hz","cell_1_1":"{i}"}}'},
+    }, **extra)
+
+
+@pytest.fixture
+def stub(kcdb_stub):
+    kcdb_stub.records = ([record(i, 'Argentina') for i in range(5)]
+                         + [record(i, 'Uruguay') for i in range(5, 8)]
+                         + [record(100, 'Chile', area='TF')])
+    return kcdb_stub
+
+
+@pytest.fixture
+def sync(stub, tmp_path):
+    client = UpstreamClient(url=stub.url, retries=0)
+    return DatasetSync(client, folder=str(tmp_path / 'dataset'), workers=2, page_size=2)
+
+
+def read_dataset(sync):
+    with open(os.path.join(sync.current_link, Config.DEFAULT_LOCAL_JSON), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_tree_segments():
+    assert tree_segments(TREE) == [("EM", "Argentina"), ("EM", "Uruguay"), ("TF", "Chile")]
+    assert tree_segments(TREE, areas=["TF"]) == [("TF", "Chile")]
+
+
+def test_primera_sincronizacion_publica_generacion(sync, stub):
+    summary = sync.run(tree_segments(TREE))
+
+    assert summary["added"] == 9 and summary["written"] == 9 and not summary["failed"]
+    assert os.path.realpath(sync.current_link) == summary["generation"]
+    doc = read_dataset(sync)
+    assert [r["id"] for r in doc["data"]] == [0, 1, 2, 3, 4, 5, 6, 7, 100]
+    assert doc["totalElements"] == 9
+    with open(os.path.join(sync.current_link, Config.DEFAULT_TREE_FILE), encoding='utf-8') as f:
+        tree = json.load(f)
+    assert sorted(tree) == ["EM", "TF"]
+    assert sorted(tree["EM"]["Argentina"]["DC and low frequency"]["DC voltage"]) == ["Sub 0", "Sub 1"]
+    # Cada segmento se pidió por área y país, página por página
+    assert {(p["metrologyAreaLabel"], p["countryValue"]) for p in stub.payloads} == set(tree_segments(TREE))
+    assert all(p["showTable"] for p in stub.payloads)
+
+
+def test_arbol_separa_instrumentos(sync, stub):
+    stub.records[0]["instrument"] = "Thermal converter, multimeter"
+    stub.records[0]["instrumentMethod"] = "AC-DC transfer; Comparison"
+    sync.run(tree_segments(TREE))
+
+    with open(os.path.join(sync.current_link, Config.DEFAULT_TREE_FILE), encoding='utf-8') as f:
+        tree = json.load(f)
+    instruments = tree["EM"]["Argentina"]["DC and low frequency"]["DC voltage"]["Sub 0"]["Voltage"]
+    assert sorted(instruments) == ["Multimeter", "Thermal converter", "multimeter"]
+    assert sorted(instruments["Thermal converter"]) == ["AC-DC transfer", "Comparison"]
+    # Cada opción del árbol encuentra registros en el índice local
+    index = LocalIndex.load(os.path.join(sync.current_link, Config.DEFAULT_LOCAL_JSON))
+    for instrument in instruments:
+        assert index.match_ids({"instrument": instrument})
+
+
+def test_sin_cambios_no_escribe_ni_publica(sync):
+    first = sync.run(tree_segments(TREE))
+    second = sync.run(tree_segments(TREE))
+
+    assert second["generation"] is None
+    assert second["written"] == 0 and second["unchanged"] == 9
+    assert os.path.realpath(sync.current_link) == first["generation"]
+
+
+def test_delta_escribe_solo_lo_modificado(sync, stub):
+    first = sync.run(tree_segments(TREE))
+    stub.records[1] = record(1, 'Argentina', serviceValue="AC voltage")
+    del stub.records[6]
+    stub.records.append(record(8, 'Uruguay'))
+
+    summary = sync.run(tree_segments(TREE))
+
+    assert (summary["added"], summary["changed"], summary["removed"], summary["unchanged"]) == (1, 1, 1, 7)
+    assert summary["written"] == 2
+    assert summary["generation"] != first["generation"]
+    # La generación anterior queda intacta hasta que se poda
+    assert os.path.isdir(first["generation"])
+    ids = [r["id"] for r in read_dataset(sync)["data"]]
+    assert ids == [0, 1, 2, 3, 4, 5, 7, 8, 100]
+    assert read_dataset(sync)["data"][1]["serviceValue"] == "AC voltage"
+
+
+def test_segmento_fallido_conserva_lo_anterior(sync, stub):
+    sync.workers = 1
+    sync.run(tree_segments(TREE))
+    stub.records = [r for r in stub.records if r["countryValue"] != 'Argentina']
+    stub.fail_times = 1  # falla el primer segmento (EM / Argentina)
+
+    summary = sync.run(tree_segments(TREE))
+
+    assert summary["failed"] == [["EM", "Argentina"]]
+    assert summary["removed"] == 0 and summary["generation"] is None
+    assert len(read_dataset(sync)["data"]) == 9
+
+
+def test_poda_generaciones_viejas(sync, stub):
+    sync.keep_generations = 2
+    generations = []
+    for i in range(4):
+        stub.records.append(record(200 + i, 'Chile', area='TF'))
+        generations.append(sync.run(tree_segments(TREE))["generation"])
+
+    remaining = sorted(n for n in os.listdir(sync.folder) if n.startswith('gen-'))
+    assert [os.path.join(sync.folder, n) for n in remaining] == generations[-2:]
+    assert len(sync.store.snapshots()) == 2
+
+
+def test_cli(stub, tmp_path, capsys):
+    tree_file = tmp_path / 'tree.json'
+    tree_file.write_text(json.dumps(TREE))
+    folder = tmp_path / 'dataset'
+
+    code = main(['--tree', str(tree_file), '--areas', 'TF', '--folder', str(folder),
+                 '--api-url', stub.url, '--rate', '0'])
+
+    assert code == 0
+    assert json.loads(capsys.readouterr().out)["added"] == 1
+    assert os.path.islink(folder / 'current')
+
+
+def test_rate_limiter_espacia_las_solicitudes():
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_app_recarga_la_generacion_publicada(sync, app_client, monkeypatch):
+    monkeypatch.setattr(Config, 'DATASET_FOLDER', sync.folder)
+    for name in ('local_index', 'category_tree', 'dataset_generation'):
+        monkeypatch.setattr(app_module, name, getattr(app_module, name))
+    sync.run(tree_segments(TREE))
+
+    app_module.reload_dataset()
+
+    assert app_module.dataset_generation == os.path.realpath(sync.current_link)
+    assert len(app_module.local_index) == 9
+    assert app_module.category_tree.values[0] == ["EM", "TF"]
+    resp = app_client.get(f'/{Config.DEFAULT_LOCAL_JSON}')
+    assert resp.status_code == 200
+    assert json.loads(resp.get_data())["totalElements"] == 9
+    resp = app_client.post('/api/local/query', json={"countryValue": "Uruguay"})
+    assert resp.get_json()["totalElements"] == 3
@@ -0,0 +1,224 @@
+"""
+Pruebas de las funciones de búsqueda de incertidumbre de todojunto.py
+"""
+
+import json
+import random
+
+import pytest
+
+import todojunto
+from todojunto import (
+    CompiledTable,
+    compile_tableContents,
+    lookup_tableContents_raw,
+    tableContents_to_cells,
+)
+
+
+def make_table_contents(rows, frequencies):
+    """Arma un string tableContents a partir de filas (etiqueta, valores) y etiquetas de frecuencia."""
+    table = {"row_1": {"col_1": "Voltage"}}
+    for i, label in enumerate(frequencies, start=2):
+        table["row_1"][f"col_{i}"] = label
+    for r, (label, values) in enumerate(rows, start=2):
+        row = {"col_1": label}
+        for c, value in enumerate(values, start=2):
+            row[f"col_{c}"] = value
+        table[f"row_{r}"] = row
+    return json.dumps(table)
+
+
+TABLE = make_table_contents(
+    [
+        ("100 mV to 1 V", ["30", "30", "45", "80"]),
+        ("1 V to 10 V", ["7", "8", "15", "45"]),
+        ("10 V to 100 V", ["7", "10", "-", "-"]),
+    ],
+    ["10 kHz", "50 kHz", "70 kHz", "700 kHz"],
+)
+
+
+def brute_force(xv, yv, tableContents_str):
+    matches = [
+        c["z"] for c in tableContents_to_cells(tableContents_str)
+        if c["x"]["start"] <= xv <= c["x"]["end"] and c["y"]["start"] <= yv <= c["y"]["end"]
+    ]
+    return min(matches) if matches else None
+
+
+@pytest.mark.parametrize("voltage, frequency, expected", [
+    ("0.5 V", "10 kHz", 30.0),
+    ("500mV", "700kHz", 80.0),
+    ((1, "V"), (50, "kHz"), 8.0),
+    ({"value": 10, "unit": "V"}, {"value": 70, "unit": "kHz"}, 15.0),
+    ("1V", "10 kHz", 7.0),
+    ("10 V", "10 kHz", 7.0),
+    ("2 V", "0.7 MHz", 45.0),
+    ("0.05 V", "10 kHz", None),
+    ("1200 V", "10 kHz", None),
+    ("1 V", "2 MHz", None),
+    ("50 V", "700 kHz", None),
+])
+def test_lookup_casos_basicos(voltage, frequency, expected):
+    assert lookup_tableContents_raw(voltage, frequency, TABLE) == expected
+
+
+def test_tabla_compilada_coincide_con_busqueda_lineal():
+    rng = random.Random(1234)
+    rows = []
+    for _ in range(25):
+        a, b = sorted(rng.choice([0.001, 0.01, 0.1, 1, 2, 5, 10, 100, 1000]) for _ in range(2))
+        values = [rng.choice(["-", str(rng.randint(1, 99))]) for _ in range(6)]
+        rows.append((f"{a} V to {b} V", values))
+    freqs = ["10 Hz", "1 kHz", "10 kHz", "100 kHz", "1 MHz", "10 kHz"]
+    contents = make_table_contents(rows, freqs)
+    table = CompiledTable(tableContents_to_cells(contents))
+
+    voltages = [0.0005, 0.001, 0.005, 0.01, 0.1, 0.5, 1, 1.5, 2, 5, 7, 10, 100, 500, 1000, 2000]
+    frequencies = [1, 10, 100, 1e3, 1e4, 5e4, 1e5, 1e6, 1e7]
+    for v in voltages:
+        for f in frequencies:
+            assert table.lookup(float(v), float(f)) == brute_force(v, f, contents)
+
+
+def test_cache_reutiliza_y_acota_tablas(monkeypatch):
+    todojunto.clear_table_cache()
+    monkeypatch.setattr(todojunto, "TABLE_CACHE_SIZE", 2)
+    first = compile_tableContents(TABLE)
+    assert compile_tableContents(TABLE) is first
+
+    other_a = make_table_contents([("1 V", ["1"])], ["1 kHz"])
+    other_b = make_table_contents([("2 V", ["2"])], ["1 kHz"])
+    compile_tableContents(other_a)
+    compile_tableContents(other_b)
+    assert compile_tableContents(TABLE) is not first
+    todojunto.clear_table_cache()
+
+
+def test_cache_por_string_sin_rehashear(monkeypatch):
+    todojunto.clear_table_cache()
+    big = make_table_contents([(f"{i} V to {i + 1} V", ["1"] * 20) for i in range(1, 400)],
+                              [f"{i} kHz" for i in range(1, 21)])
+    first = compile_tableContents(big)
+    # Un string igual pero distinto objeto encuentra la misma tabla
+    assert compile_tableContents("".join(list(big))) is first
+
+    def no_compile(_):
+        raise AssertionError("un acierto no vuelve a compilar")
+
+    monkeypatch.setattr(todojunto, "tableContents_to_cells", no_compile)
+    hits = todojunto.TABLE_CACHE_STATS["hits"]
+    for _ in range(100):
+        assert compile_tableContents(big) is first
+    assert todojunto.TABLE_CACHE_STATS["hits"] == hits + 100
+    todojunto.clear_table_cache()
+
+
+def test_cache_acotada_por_caracteres(monkeypatch):
+    todojunto.clear_table_cache()
+    monkeypatch.setattr(todojunto, "TABLE_CACHE_MAX_CHARS", len(TABLE) + 10)
+    first = compile_tableContents(TABLE)
+    compile_tableContents(make_table_contents([("1 V", ["1"])], ["1 kHz"]))
+    assert compile_tableContents(TABLE) is not first
+    todojunto.clear_table_cache()
+
+
+def test_lookup_many_respeta_orden_y_errores_por_punto():
+    other = make_table_contents([("1 V to 10 V", ["3"])], ["10 kHz"])
+    points = [
+        {"voltage": "0.5 V", "frequency": "10 kHz"},
+        ("2 V", "10 kHz"),
+        {"voltage": "abc", "frequency": "10 kHz"},
+        {"voltage": "2 V", "frequency": "10 kHz", "table_id": 3},
+    ]
+    results = todojunto.lookup_many(points, {1: TABLE, 2: other, 3: None})
+
+    assert [(r["index"], r.get("table_id")) for r in results] == [
+        (0, 1), (0, 2), (0, 3), (1, 1), (1, 2), (1, 3), (2, None), (3, 3),
+    ]
+    assert results[0]["result"] == 30.0 and results[1]["result"] is None
+    assert results[3]["result"] == 7.0 and results[4]["result"] == 3.0
+    assert results[2]["success"] is False
+    assert results[6]["success"] is False
+    assert results[7]["success"] is False
+
+
+def test_lookup_many_ids_por_defecto():
+    results = todojunto.lookup_many([("2 V", "10 kHz")], {1: TABLE, 2: TABLE}, default_table_ids=[2])
+    assert [r["table_id"] for r in results] == [2]
+    results = todojunto.lookup_many([("2 V", "10 kHz")], {1: TABLE}, default_table_ids=[])
+    assert results == [{"index": 0, "success": False,
+                        "message": "El punto no indica table_id y no hay tablas por defecto"}]
+
+
+def test_lookup_grid_coincide_con_lookup_puntual():
+    np = pytest.importorskip("numpy")
+    voltages = np.array([0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 1000])
+    frequencies = np.array([1e3, 1e4, 5e4, 7e4, 1e5, 7e5, 1e6])
+    grid = todojunto.lookup_grid(voltages, frequencies, TABLE)
+
+    assert grid.shape == (voltages.size, frequencies.size)
+    for i, v in enumerate(voltages):
+        for j, f in enumerate(frequencies):
+            expected = lookup_tableContents_raw(float(v), float(f), TABLE)
+            if expected is None:
+                assert np.isnan(grid[i, j])
+            else:
+                assert grid[i, j] == expected
+
+
+def test_sweep_values():
+    np = pytest.importorskip("numpy")
+    values = todojunto.sweep_values({"start": "1 kHz", "stop": "1 MHz", "num": 4, "scale": "log"}, "Hz")
+    assert np.allclose(values, [1e3, 1e4, 1e5, 1e6])
+    assert list(todojunto.sweep_values(["1 V", "10 mV"], "V")) == [1.0, 0.01]
+    with pytest.raises(ValueError):
+        todojunto.sweep_values({"start": "1 V", "stop": "2 V", "num": 10**9}, "V", max_num=1000)
+    with pytest.raises(ValueError):
+        todojunto.sweep_values(["1 V", "2 V", "3 V"], "V", max_num=2)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("100 mV", (0.1, "V")),
+    ("1,5kHz", (1500.0, "Hz")),
+    ("2 GHz", (2e9, "Hz")),
+    ("10 µA", (10e-6, "A")),
+    ("10 μA", (10e-6, "A")),
+    ("3 kohm", (3000.0, "Ω")),
+    ("1 MΩ", (1e6, "Ω")),
+    ("1e-3 V", (1e-3, "V")),
+    ("5m", (5e-3, None)),
+    ("12", (12.0, None)),
+])
+def test_parse_label(text, expected):
+    value, base = todojunto.parse_label(text)
+    assert value == pytest.approx(expected[0]) and base == expected[1]
+
+
+@pytest.mark.parametrize("text", ["abc", "1 dB", "1 mm", "V"])
+def test_parse_label_rechaza_unidades_desconocidas(text):
+    with pytest.raises(ValueError):
+        todojunto.parse_label(text)
+
+
+def test_parse_quantity_verifica_la_unidad_base():
+    assert todojunto.parse_quantity("10 mA", "A") == pytest.approx(0.01)
+    assert todojunto.parse_quantity("5k", "Hz") == 5000.0
+    with pytest.raises(ValueError):
+        todojunto.parse_quantity("10 mA", "V")
+
+
+def test_tablas_con_otras_unidades():
+    current = make_table_contents(
+        [("10 µA to 1 mA", ["50", "60"]), ("1 mA to 1 A", ["20", "-"])],
+        ["40 Hz", "1 GHz"],
+    )
+    assert lookup_tableContents_raw("100 µA", "1 GHz", current) == 60.0
+    assert lookup_tableContents_raw("0.5 A", "40 Hz", current) == 20.0
+    with pytest.raises(ValueError):
+        lookup_tableContents_raw("1 V", "40 Hz", current)
+
+    results = todojunto.lookup_many([("1 mA", "40 Hz"), ("1 V", "40 Hz")], {1: current})
+    assert results[0]["result"] == 20.0
+    assert results[1]["success"] is False
@@ -0,0 +1,109 @@
+"""
+Pruebas del cliente HTTP compartido contra un servidor KCDB local.
+"""
+
+import threading
+
+import pytest
+import requests
+
+from upstream import UpstreamClient, UpstreamBusy
+
+
+def test_reintenta_errores_transitorios(kcdb_stub):
+    kcdb_stub.records = [{"id": 1}]
+    kcdb_stub.fail_times = 2
+    client = UpstreamClient(url=kcdb_stub.url, retries=2, backoff=0.001)
+
+    data = client.search({"page": 0})
+
+    assert data["data"] == [{"id": 1}]
+    assert kcdb_stub.calls == 3
+    stats = client.stats()
+    assert stats["calls"] == 1 and stats["retries"] == 2 and stats["errors"] == 0
+    assert stats["p50"] is not None
+
+
+def test_agota_reintentos(kcdb_stub):
+    kcdb_stub.fail_times = 10
+    client = UpstreamClient(url=kcdb_stub.url, retries=1, backoff=0.001)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.search({})
+    assert kcdb_stub.calls == 2
+    assert client.stats()["errors"] == 1
+
+
+def test_timeout_de_lectura(kcdb_stub):
+    kcdb_stub.delay = 0.5
+    client = UpstreamClient(url=kcdb_stub.url, read_timeout=0.05, retries=0)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        client.search({})
+
+
+def test_limite_de_concurrencia(kcdb_stub):
+    kcdb_stub.delay = 0.3
+    client = UpstreamClient(url=kcdb_stub.url, retries=0, max_concurrency=1, queue_timeout=0.05)
+    worker = threading.Thread(target=client.search, args=({},))
+    worker.start()
+    while kcdb_stub.calls == 0:
+        pass
+
+    with pytest.raises(UpstreamBusy):
+        client.search({})
+    worker.join()
+    assert client.stats()["busy"] == 1
+
+
+def test_iter_pages_en_orden_y_en_paralelo(kcdb_stub):
+    kcdb_stub.records = [{"id": i} for i in range(2500)]
+    client = UpstreamClient(url=kcdb_stub.url, retries=0)
+
+    pages = list(client.iter_pages({"page": 3, "pageSize": 20}, page_size=1000, workers=3))
+
+    assert [len(p["data"]) for p in pages] == [1000, 1000, 500]
+    assert [r["id"] for p in pages for r in p["data"]] == list(range(2500))
+    assert sorted(p["page"] for p in kcdb_stub.payloads) == [0, 1, 2]
+    assert all(p["pageSize"] == 1000 for p in kcdb_stub.payloads)
+
+
+def test_iter_pages_respeta_maximo_de_registros(kcdb_stub):
+    kcdb_stub.records = [{"id": i} for i in range(50)]
+    client = UpstreamClient(url=kcdb_stub.url, retries=0)
+
+    pages = list(client.iter_pages({}, page_size=10, workers=2, max_records=25))
+
+    assert [r["id"] for p in pages for r in p["data"]] == list(range(25))
+    assert kcdb_stub.calls == 3
+
+
+def test_iter_page_streams_entrega_registros_de_a_uno(kcdb_stub):
+    kcdb_stub.records = [{"id": i} for i in range(35)]
+    client = UpstreamClient(url=kcdb_stub.url, retries=0)
+
+    seen = []
+    for page in client.iter_page_streams({}, page_size=10, workers=2):
+        seen.append([r["id"] for r in page])
+        assert page.meta["pageSize"] == 10
+
+    assert [len(p) for p in seen] == [10, 10, 10, 5]
+    assert [i for p in seen for i in p] == list(range(35))
+
+
+def test_total_al_final_aunque_el_consumidor_corte_la_primera_pagina(kcdb_stub):
+    kcdb_stub.records = [{"id": i} for i in range(35)]
+    kcdb_stub.data_first = True
+    client = UpstreamClient(url=kcdb_stub.url, retries=0)
+
+    seen, pages = [], []
+    for page in client.iter_page_streams({}, page_size=10, workers=2):
+        pages.append(page)
+        for record in page:
+            seen.append(record["id"])
+            if record["id"] == 2:
+                break  # Deja sin leer el resto de la página 0
+
+    assert pages[0].meta["totalElements"] == 35
+    assert seen == [0, 1, 2] + list(range(10, 35))
+    assert kcdb_stub.calls == 4
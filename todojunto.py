@@ -1,6 +1,18 @@
+import re
 import json
+import math
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional, Union, Any, Dict, Tuple
 
+try:
+    import numpy as np
+except ImportError:  # el modo vectorizado es opcional
+    np = None
+
 QuantityLike = Union[float, int, str, Tuple[Union[float, int], str], Dict[str, Any]]
 
 SI_PREFIX = {
@@ -8,74 +20,112 @@ SI_PREFIX = {
     "u": 1e-6, "µ": 1e-6, "μ": 1e-6, "m": 1e-3, "c": 1e-2, "d": 1e-1,
     "": 1.0, "da": 1e1, "h": 1e2, "k": 1e3, "M": 1e6, "G": 1e9, "T": 1e12
 }
-BASE_UNITS = {"V", "Hz"}
+
+# Unidades base de las magnitudes de las tablas EM del KCDB (con sus variantes de escritura)
+UNIT_ALIASES = {
+    "V": "V", "v": "V",
+    "Hz": "Hz", "hz": "Hz", "HZ": "Hz",
+    "A": "A",
+    "Ω": "Ω", "\u2126": "Ω", "ohm": "Ω", "Ohm": "Ω", "ohms": "Ω", "Ohms": "Ω",
+    "S": "S", "F": "F", "H": "H", "W": "W", "s": "s", "C": "C", "J": "J",
+}
+BASE_UNITS = set(UNIT_ALIASES.values())
+
+UNIT_CACHE_SIZE = 4096
+
+
+def _alternation(options) -> str:
+    # Las opciones más largas primero ("da" antes que "d", "Hz" antes que "H")
+    return "|".join(re.escape(o) for o in sorted(options, key=len, reverse=True) if o)
+
+
+_UNIT_RE = re.compile(
+    rf"(?P<prefix>{_alternation(SI_PREFIX)})?(?P<base>{_alternation(UNIT_ALIASES)})?"
+)
+_QUANTITY_RE = re.compile(
+    r"\s*(?P<number>[+-]?(?:\d+(?:[.,]\d*)?|[.,]\d+)(?:[eE][+-]?\d+)?)\s*(?P<unit>.*?)\s*"
+)
+
 
 def _coerce_number(x: Union[str, float, int]) -> float:
     if isinstance(x, (int, float)):
         return float(x)
     return float(x.replace(",", "."))
 
-def convert_with_unit(value: float, unit: str, expected_base: str) -> float:
-    unit = unit.strip()
-    if unit.endswith("hz"):
-        unit = unit[:-2] + "Hz"
-    if unit.endswith("v"):
-        unit = unit[:-1] + "V"
-    if unit.endswith("Hz") or unit.endswith("V"):
-        base = "V" if unit.endswith("V") else "Hz"
-        prefix = unit[: -len(base)]
-    else:
-        base = expected_base
-        prefix = unit
-    if base != expected_base:
-        raise ValueError(f"Unidad base {base!r} no coincide con esperada {expected_base!r}")
-    if prefix not in SI_PREFIX:
-        raise ValueError(f"Prefijo SI desconocido: {prefix!r}")
-    return value * SI_PREFIX[prefix]
 
-def parse_quantity(q: QuantityLike, expected_base: str) -> float:
-    if expected_base not in BASE_UNITS:
-        raise ValueError(f"expected_base debe ser 'V' o 'Hz'")
+@lru_cache(maxsize=UNIT_CACHE_SIZE)
+def parse_unit(unit: str) -> Tuple[float, Optional[str]]:
+    """
+    Separa una unidad en (factor del prefijo SI, unidad base). La base es
+    None si la unidad es solo un prefijo ("k", "m") o está vacía.
+    """
+    m = _UNIT_RE.fullmatch(unit.strip())
+    if m is None:
+        raise ValueError(f"Unidad desconocida: {unit!r}")
+    base = m.group("base")
+    return SI_PREFIX[m.group("prefix") or ""], UNIT_ALIASES[base] if base else None
+
+
+@lru_cache(maxsize=UNIT_CACHE_SIZE)
+def parse_label(text: str) -> Tuple[float, Optional[str]]:
+    """
+    Convierte una etiqueta como "100 mV", "1,5kHz" o "10 µA" en
+    (valor en unidades base, unidad base o None si no trae unidad).
+    """
+    m = _QUANTITY_RE.fullmatch(text)
+    if m is None:
+        raise ValueError(f"Cantidad inválida: {text!r}")
+    factor, base = parse_unit(m.group("unit"))
+    return _coerce_number(m.group("number")) * factor, base
+
+
+def split_quantity(q: QuantityLike) -> Tuple[float, Optional[str]]:
+    """(valor en unidades base, unidad base o None) de cualquier forma de cantidad aceptada."""
     if isinstance(q, (int, float)):
-        return float(q)
+        return float(q), None
     if isinstance(q, tuple) and len(q) == 2:
-        return convert_with_unit(_coerce_number(q[0]), str(q[1]), expected_base)
+        factor, base = parse_unit(str(q[1]))
+        return _coerce_number(q[0]) * factor, base
     if isinstance(q, dict):
-        return convert_with_unit(_coerce_number(q.get("value")), str(q.get("unit")), expected_base)
+        factor, base = parse_unit(str(q.get("unit")))
+        return _coerce_number(q.get("value")) * factor, base
     if isinstance(q, str):
-        s = q.strip().replace(" ", "")
-        i = 0
-        while i < len(s) and (s[i].isdigit() or s[i] in "+-.,"):
-            i += 1
-        num = _coerce_number(s[:i])
-        unit = s[i:] or expected_base
-        return convert_with_unit(num, unit, expected_base)
+        return parse_label(q)
     raise TypeError(f"Tipo no soportado: {type(q)}")
 
+
+def _check_base(base: Optional[str], expected_base: str) -> None:
+    if base is not None and base != expected_base:
+        raise ValueError(f"Unidad base {base!r} no coincide con esperada {expected_base!r}")
+
+
+def convert_with_unit(value: float, unit: str, expected_base: str) -> float:
+    factor, base = parse_unit(unit)
+    _check_base(base, expected_base)
+    return value * factor
+
+def parse_quantity(q: QuantityLike, expected_base: str) -> float:
+    if expected_base not in BASE_UNITS:
+        raise ValueError(f"expected_base debe ser una de {sorted(BASE_UNITS)}")
+    value, base = split_quantity(q)
+    _check_base(base, expected_base)
+    return value
+
+def parse_table_label(label: str) -> Tuple[float, str]:
+    """Etiqueta de un eje de la tabla: debe traer unidad."""
+    value, base = parse_label(label)
+    if base is None:
+        raise ValueError(f"Unidad desconocida: {label!r}")
+    return value, base
+
 def tableContents_to_cells(tableContents_str: str):
     """Convierte un string JSON del campo tableContents en una lista de celdas formateadas."""
     table = json.loads(tableContents_str)
 
-    def parse_value_with_unit(s: str) -> float:
-        s = s.strip()
-        if " " in s:
-            value_str, unit_str = s.split()
-        else:
-            value_str = ''.join(ch for ch in s if (ch.isdigit() or ch in ".,"))
-            unit_str = s.replace(value_str, "")
-        value = float(value_str.replace(",", "."))
-        multipliers = {
-            "Hz": 1.0, "kHz": 1e3, "MHz": 1e6,
-            "V": 1.0, "mV": 1e-3, "kV": 1e3
-        }
-        if unit_str not in multipliers:
-            raise ValueError(f"Unidad desconocida: {unit_str}")
-        return value * multipliers[unit_str]
-
     frequencies = []
     for col_idx in range(2, len(table["row_1"]) + 1):
         freq_label = table["row_1"][f"col_{col_idx}"]
-        frequencies.append(parse_value_with_unit(freq_label))
+        frequencies.append(parse_table_label(freq_label))
 
     cells = []
     num_cols = len(frequencies)
@@ -83,45 +133,358 @@ def tableContents_to_cells(tableContents_str: str):
         voltage_label = table[f"row_{row_idx}"]["col_1"]
         if "to" in voltage_label:
             v_start_str, v_end_str = voltage_label.split("to")
-            v_start = parse_value_with_unit(v_start_str.strip())
-            v_end = parse_value_with_unit(v_end_str.strip())
+            v_start, x_unit = parse_table_label(v_start_str)
+            v_end, _ = parse_table_label(v_end_str)
         else:
-            v_start = v_end = parse_value_with_unit(voltage_label.strip())
+            v_start, x_unit = parse_table_label(voltage_label)
+            v_end = v_start
 
         for col_idx in range(2, num_cols + 2):
             z_str = table[f"row_{row_idx}"][f"col_{col_idx}"]
             if z_str.strip() == "-":
                 continue
             z_val = float(z_str)
-            f_start = frequencies[col_idx - 2]
+            f_start, y_unit = frequencies[col_idx - 2]
             f_end = f_start
             cells.append({
-                "x": {"start": v_start, "end": v_end, "left_closed": True, "right_closed": True},
-                "y": {"start": f_start, "end": f_end, "left_closed": True, "right_closed": True},
+                "x": {"start": v_start, "end": v_end, "left_closed": True, "right_closed": True, "unit": x_unit},
+                "y": {"start": f_start, "end": f_end, "left_closed": True, "right_closed": True, "unit": y_unit},
                 "z": z_val,
                 "priority": 0
             })
         
     return cells
 
+def tableContents_to_arrays(tableContents_str: str):
+    """
+    Versión vectorizada de tableContents_to_cells: devuelve los límites de la
+    tabla compilada como arrays de NumPy (sin copia):
+    (límites de voltaje, eje de frecuencias, grilla de mínimos por ranura).
+    """
+    if np is None:
+        raise RuntimeError("El modo vectorizado requiere numpy")
+    table = compile_tableContents(tableContents_str)
+    v_bounds = np.frombuffer(table.v_bounds, dtype=np.float64)
+    frequencies = np.frombuffer(table.frequencies, dtype=np.float64)
+    grid = np.frombuffer(table.grid, dtype=np.float64).reshape(
+        max(2 * len(v_bounds) - 1, 0), len(frequencies))
+    # Son vistas sobre la tabla en caché: se exponen como solo lectura
+    for arr in (v_bounds, frequencies, grid):
+        arr.flags.writeable = False
+    return v_bounds, frequencies, grid
+
+
+def lookup_grid(voltages, frequencies, tableContents_str: str):
+    """
+    Evalúa la tabla sobre todas las combinaciones de voltajes x frecuencias
+    (en unidades base) usando searchsorted. Devuelve una matriz 2-D de forma
+    (len(voltages), len(frequencies)) con NaN donde no hay coincidencia; la
+    semántica (intervalos cerrados, mínimo si hay solapamiento) es la misma
+    que la de lookup_tableContents_raw.
+    """
+    v_bounds, freq_axis, grid = tableContents_to_arrays(tableContents_str)
+    xv = np.asarray(voltages, dtype=np.float64).ravel()
+    yv = np.asarray(frequencies, dtype=np.float64).ravel()
+    out = np.full((xv.size, yv.size), np.nan)
+    if v_bounds.size == 0 or freq_axis.size == 0:
+        return out
+
+    i = np.searchsorted(v_bounds, xv, side="left")
+    ic = np.minimum(i, v_bounds.size - 1)
+    exact = v_bounds[ic] == xv
+    slots = np.where(exact, 2 * i, 2 * i - 1)
+    rows_ok = exact | ((i > 0) & (i < v_bounds.size))
+
+    j = np.searchsorted(freq_axis, yv, side="left")
+    jc = np.minimum(j, freq_axis.size - 1)
+    cols_ok = freq_axis[jc] == yv
+
+    rows = np.flatnonzero(rows_ok)
+    cols = np.flatnonzero(cols_ok)
+    out[np.ix_(rows, cols)] = grid[np.ix_(slots[rows], jc[cols])]
+    return out
+
+
+def sweep_values(spec: Any, expected_base: str, max_num: Optional[int] = None):
+    """
+    Convierte una especificación de barrido en un array de valores en unidades base.
+    Acepta una lista de cantidades o un dict {'start', 'stop', 'num', 'scale'}
+    con scale 'lin' (por defecto) o 'log'. Con max_num, un barrido de más
+    puntos lanza ValueError.
+    """
+    if np is None:
+        raise RuntimeError("El modo vectorizado requiere numpy")
+    if isinstance(spec, dict):
+        num = int(spec.get("num", 50))
+        _check_sweep_size(num, max_num)
+        start = parse_quantity(spec["start"], expected_base)
+        stop = parse_quantity(spec["stop"], expected_base)
+        if spec.get("scale", "lin") == "log":
+            return np.geomspace(start, stop, num)
+        return np.linspace(start, stop, num)
+    if isinstance(spec, (list, tuple)):
+        _check_sweep_size(len(spec), max_num)
+        return np.array([parse_quantity(q, expected_base) for q in spec], dtype=np.float64)
+    raise TypeError(f"Barrido no soportado: {type(spec)}")
+
+
+def _check_sweep_size(num: int, max_num: Optional[int]):
+    if max_num is not None and num > max_num:
+        raise ValueError(f"el barrido tiene {num} puntos; el máximo es {max_num}")
+
+
+class CompiledTable:
+    """
+    Tabla de incertidumbre compilada para búsquedas repetidas.
+
+    Los límites de voltaje se guardan ordenados y sin duplicados; cada límite
+    y cada intervalo abierto entre dos límites consecutivos forman una "ranura".
+    Para cada ranura y cada frecuencia se precalcula el mínimo 'z' de las celdas
+    que la cubren, así una consulta se resuelve con dos bisect.
+
+    `x_base`/`y_base` son las unidades base de los ejes según las etiquetas
+    de la tabla (V y Hz en las tablas de tensión alterna).
+    """
+    __slots__ = ("v_bounds", "frequencies", "grid", "x_base", "y_base")
+
+    def __init__(self, cells):
+        v_bounds = sorted({c["x"]["start"] for c in cells} | {c["x"]["end"] for c in cells})
+        frequencies = sorted({c["y"]["start"] for c in cells})
+        n_freq = len(frequencies)
+        n_slots = max(2 * len(v_bounds) - 1, 0)
+        grid = array("d", [math.nan]) * (n_slots * n_freq)
+
+        for cell in cells:
+            first = 2 * bisect.bisect_left(v_bounds, cell["x"]["start"])
+            last = 2 * bisect.bisect_left(v_bounds, cell["x"]["end"])
+            col = bisect.bisect_left(frequencies, cell["y"]["start"])
+            z = cell["z"]
+            for slot in range(first, last + 1):
+                idx = slot * n_freq + col
+                current = grid[idx]
+                if math.isnan(current) or z < current:
+                    grid[idx] = z
+
+        self.v_bounds = array("d", v_bounds)
+        self.frequencies = array("d", frequencies)
+        self.grid = grid
+        self.x_base = cells[0]["x"].get("unit", "V") if cells else "V"
+        self.y_base = cells[0]["y"].get("unit", "Hz") if cells else "Hz"
+
+    def _slot(self, xv: float) -> Optional[int]:
+        bounds = self.v_bounds
+        i = bisect.bisect_left(bounds, xv)
+        if i < len(bounds) and bounds[i] == xv:
+            return 2 * i
+        if i == 0 or i == len(bounds):
+            return None
+        return 2 * i - 1
+
+    def lookup(self, xv: float, yv: float) -> Optional[float]:
+        """Devuelve el 'z' mínimo para (voltaje, frecuencia) en unidades base, o None."""
+        slot = self._slot(xv)
+        if slot is None:
+            return None
+        freqs = self.frequencies
+        col = bisect.bisect_left(freqs, yv)
+        if col == len(freqs) or freqs[col] != yv:
+            return None
+        z = self.grid[slot * len(freqs) + col]
+        return None if math.isnan(z) else z
+
+    @property
+    def coverage(self) -> Tuple[float, float, float, float]:
+        """(voltaje mínimo, máximo, frecuencia mínima, máxima) que abarca la tabla, en unidades base."""
+        if not len(self.v_bounds) or not len(self.frequencies):
+            return (math.nan,) * 4
+        return self.v_bounds[0], self.v_bounds[-1], self.frequencies[0], self.frequencies[-1]
+
+    def lookup_region(self, x_lo: float, x_hi: float, y_lo: float, y_hi: float) -> Optional[float]:
+        """
+        Peor (mayor) 'z' en los voltajes [x_lo, x_hi] y las frecuencias
+        [y_lo, y_hi], o None si la tabla no cubre la región entera. Entre
+        frecuencias se toman también las columnas que encierran los extremos
+        del rango. Con x_lo == x_hi e y_lo == y_hi equivale a lookup.
+        """
+        first, last = self._slot(x_lo), self._slot(x_hi)
+        if first is None or last is None:
+            return None
+        freqs = self.frequencies
+        if not len(freqs) or y_lo < freqs[0] or y_hi > freqs[-1]:
+            return None
+        if y_lo == y_hi:
+            c0 = bisect.bisect_left(freqs, y_lo)
+            if freqs[c0] != y_lo:
+                return None
+            c1 = c0 + 1
+        else:
+            c0 = bisect.bisect_right(freqs, y_lo) - 1
+            c1 = bisect.bisect_left(freqs, y_hi) + 1
+        n_freq = len(freqs)
+        worst = -math.inf
+        for slot in range(first, last + 1):
+            for z in self.grid[slot * n_freq + c0:slot * n_freq + c1]:
+                if math.isnan(z):
+                    return None
+                if z > worst:
+                    worst = z
+        return worst
+
+
+# Cada entrada retiene también su string tableContents (la clave), así que
+# la caché se acota por cantidad y por caracteres de las claves
+TABLE_CACHE_SIZE = 512
+TABLE_CACHE_MAX_CHARS = 16 * 1024 * 1024
+
+# Aciertos y fallos de la caché de tablas compiladas (para las métricas)
+TABLE_CACHE_STATS = {"hits": 0, "misses": 0}
+
+_table_cache: "OrderedDict[str, CompiledTable]" = OrderedDict()
+_table_cache_lock = threading.Lock()
+_table_cache_chars = 0
+
+# Tablas compiladas al arrancar (pin_tables): no se desalojan ni se modifican,
+# así se comparten entre los workers de gunicorn cargados con --preload
+_pinned_tables: Dict[str, CompiledTable] = {}
+
+
+def compile_tableContents(tableContents_str: str) -> CompiledTable:
+    """
+    Devuelve la tabla compilada para un string tableContents, usando una caché
+    LRU indexada por el propio string: Python guarda el hash en el objeto, así
+    repetir la consulta con el mismo string no lo vuelve a recorrer. La caché
+    retiene hasta TABLE_CACHE_SIZE tablas y TABLE_CACHE_MAX_CHARS caracteres
+    de strings (unos 16 MB con el valor por defecto).
+    """
+    global _table_cache_chars
+    key = tableContents_str
+    with _table_cache_lock:
+        compiled = _pinned_tables.get(key)
+        if compiled is None:
+            compiled = _table_cache.get(key)
+            if compiled is not None:
+                _table_cache.move_to_end(key)
+        if compiled is not None:
+            TABLE_CACHE_STATS["hits"] += 1
+            return compiled
+        TABLE_CACHE_STATS["misses"] += 1
+
+    compiled = CompiledTable(tableContents_to_cells(tableContents_str))
+
+    with _table_cache_lock:
+        if key not in _table_cache:
+            _table_cache_chars += len(key)
+        _table_cache[key] = compiled
+        _table_cache.move_to_end(key)
+        while len(_table_cache) > 1 and (len(_table_cache) > TABLE_CACHE_SIZE
+                                         or _table_cache_chars > TABLE_CACHE_MAX_CHARS):
+            _table_cache_chars -= len(_table_cache.popitem(last=False)[0])
+    return compiled
+
+
+def pin_tables(contents, limit: Optional[int] = None) -> int:
+    """
+    Compila y fija las tablas de `contents` (strings tableContents) fuera de
+    la caché LRU. Las que no se pueden compilar se ignoran. Devuelve la
+    cantidad de tablas fijadas.
+    """
+    for tableContents_str in contents:
+        if limit is not None and len(_pinned_tables) >= limit:
+            break
+        if tableContents_str in _pinned_tables:
+            continue
+        try:
+            _pinned_tables[tableContents_str] = CompiledTable(tableContents_to_cells(tableContents_str))
+        except Exception:
+            continue
+    return len(_pinned_tables)
+
+
+def clear_table_cache() -> None:
+    """Vacía la caché de tablas compiladas (incluidas las fijadas)."""
+    global _table_cache_chars
+    with _table_cache_lock:
+        _table_cache.clear()
+        _table_cache_chars = 0
+        _pinned_tables.clear()
+
+
 def lookup_tableContents_raw(x: QuantityLike, y: QuantityLike, tableContents_str: str) -> Optional[float]:
     """
     Consulta directamente un campo tableContents (string JSON original),
     con x (voltaje) y y (frecuencia) con soporte de unidades. Si hay múltiples
     coincidencias, devuelve el valor 'z' (incertidumbre) más bajo.
     """
-    cells = tableContents_to_cells(tableContents_str)
-    xv = parse_quantity(x, "V")
-    yv = parse_quantity(y, "Hz")
+    return lookup_compiled(compile_tableContents(tableContents_str), x, y)
+
+def lookup_compiled(table: CompiledTable, x: QuantityLike, y: QuantityLike) -> Optional[float]:
+    """Como lookup_tableContents_raw, sobre una tabla ya compilada."""
+    xv = parse_quantity(x, table.x_base)
+    yv = parse_quantity(y, table.y_base)
+    return table.lookup(xv, yv)
+
+def _point_values(point: Any) -> Tuple[Any, Any, Any]:
+    if isinstance(point, dict):
+        return point.get("voltage"), point.get("frequency"), point.get("table_id")
+    if isinstance(point, (list, tuple)) and len(point) == 2:
+        return point[0], point[1], None
+    raise TypeError(f"Punto no soportado: {point!r}")
 
-    matching_results = []
-    for cell in cells:
-        if cell["x"]["start"] <= xv <= cell["x"]["end"] and cell["y"]["start"] <= yv <= cell["y"]["end"]:
-            matching_results.append(cell["z"])
 
-    if not matching_results:
-        return None
-    return min(matching_results)
+def lookup_many(points, tables: Dict[Any, Optional[str]], default_table_ids=None):
+    """
+    Evalúa una lista de puntos (voltaje, frecuencia) contra una o varias tablas.
+
+    `tables` asocia cada table_id con su string tableContents (None si la tabla
+    no existe); cada tabla se compila una sola vez. Un punto puede ser un dict con 'voltage', 'frequency'
+    y opcionalmente 'table_id' (para limitarlo a esa tabla), o un par
+    (voltaje, frecuencia); los puntos sin 'table_id' se evalúan contra
+    `default_table_ids` (por defecto, todas las tablas). Devuelve una lista en el orden de entrada, con un
+    elemento por punto y tabla, y los errores se informan por punto (también
+    el de un punto sin tablas contra las que evaluarlo).
+    """
+    compiled: Dict[Any, Union[CompiledTable, Exception, None]] = {}
+    for table_id, contents in tables.items():
+        if contents is None:
+            compiled[table_id] = None
+            continue
+        try:
+            compiled[table_id] = compile_tableContents(contents)
+        except Exception as e:
+            compiled[table_id] = e
+
+    results = []
+    for index, point in enumerate(points):
+        try:
+            voltage, frequency, point_table = _point_values(point)
+            if point_table is not None:
+                targets = [point_table]
+            else:
+                targets = list(compiled) if default_table_ids is None else list(default_table_ids)
+            if not targets:
+                raise ValueError("El punto no indica table_id y no hay tablas por defecto")
+            xv, x_base = split_quantity(voltage)
+            yv, y_base = split_quantity(frequency)
+        except Exception as e:
+            results.append({"index": index, "success": False, "message": str(e)})
+            continue
+
+        for table_id in targets:
+            entry = {"index": index, "table_id": table_id}
+            table = compiled.get(table_id)
+            if table is None:
+                entry.update(success=False, message=f"No se encontró la tabla con ID {table_id}")
+            elif isinstance(table, Exception):
+                entry.update(success=False, message=f"Error al compilar la tabla: {table}")
+            else:
+                try:
+                    _check_base(x_base, table.x_base)
+                    _check_base(y_base, table.y_base)
+                    entry.update(success=True, result=table.lookup(xv, yv))
+                except ValueError as e:
+                    entry.update(success=False, message=str(e))
+            results.append(entry)
+    return results
 
 if __name__ == "__main__":
     # --- Sección de Pruebas Exhaustivas ---
@@ -0,0 +1,305 @@
+"""
+Cliente HTTP compartido para las llamadas a la API del KCDB.
+
+Reutiliza conexiones (pool keep-alive de requests.Session), aplica timeouts
+de conexión y lectura, reintenta con backoff exponencial con jitter ante
+errores transitorios, limita las llamadas concurrentes (y, si se pide, la
+cantidad de solicitudes por segundo) y guarda estadísticas de latencia por llamada. iter_page_streams recorre todas las
+páginas de un resultado grande pidiendo varias en paralelo y entrega los
+registros de cada una de a uno, leídos incrementalmente del cuerpo HTTP.
+"""
+
+import time
+import random
+import threading
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from json_stream import ArrayStream, CHUNK_SIZE, file_chunks
+
+# Respuestas que vale la pena reintentar
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Páginas bajadas por adelantado: en memoria hasta este tamaño, luego a disco
+SPOOL_MAX_BYTES = 1024 * 1024
+
+
+class UpstreamBusy(requests.exceptions.RequestException):
+    """No se obtuvo un lugar libre para llamar a la API a tiempo."""
+
+
+class RateLimiter:
+    """Espacia las solicitudes para no superar `rate` por segundo (entre todos los hilos)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def reserve(self):
+        """Reserva el próximo turno y devuelve cuántos segundos hay que esperarlo."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        return start - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _ClientBase:
+    """Parámetros, reintentos, límite de tasa y estadísticas comunes a los clientes sync y async."""
+
+    def __init__(self, url=None, connect_timeout=5.0, read_timeout=60.0, retries=2,
+                 backoff=0.5, max_backoff=10.0, queue_timeout=None, stats_window=1000, rate_limit=None):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        # Espera máxima por un lugar libre (por defecto, lo que dura una llamada)
+        self.queue_timeout = connect_timeout + read_timeout if queue_timeout is None else queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Solicitudes por segundo (None o 0: sin límite); cuenta también los reintentos
+        self._rate = RateLimiter(rate_limit) if rate_limit else None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=stats_window)
+        self._counters = {"calls": 0, "errors": 0, "retries": 0, "busy": 0}
+
+    def _target(self, url):
+        return url or self.url or Config.BIPM_API_URL
+
+    def _retry_delay(self, attempt):
+        # Backoff exponencial con "full jitter"
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return random.uniform(0, delay)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _record(self, elapsed, ok):
+        with self._stats_lock:
+            self._counters["calls"] += 1
+            if not ok:
+                self._counters["errors"] += 1
+            self._latencies.append(elapsed)
+
+    @staticmethod
+    def _spooled_stream(spool, limit):
+        def body():
+            try:
+                yield from file_chunks(spool)
+            finally:
+                spool.close()
+
+        return ArrayStream(body(), limit=limit)
+
+    @staticmethod
+    def _page_count(first, page_size, max_records):
+        """(total, páginas) a partir de la página 0 ya recorrida; páginas 0 si no hay más que pedir."""
+        if first.count >= max_records:
+            return first.count, 0
+        total = first.meta.get('totalElements')
+        if total is None:
+            total = first.count
+        total = min(int(total), max_records)
+        return total, -(-total // page_size)
+
+    def stats(self):
+        """Resumen de las últimas llamadas: contadores y latencias (segundos)."""
+        return combined_stats([self])
+
+
+def combined_stats(clients):
+    """Como _ClientBase.stats, sumando los contadores y las latencias de varios clientes."""
+    summary, latencies = {}, []
+    for client in clients:
+        with client._stats_lock:
+            latencies.extend(client._latencies)
+            for name, value in client._counters.items():
+                summary[name] = summary.get(name, 0) + value
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    summary.update({
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": latencies[-1] if latencies else None,
+    })
+    return summary
+
+
+class UpstreamClient(_ClientBase):
+    def __init__(self, url=None, connect_timeout=5.0, read_timeout=60.0, retries=2,
+                 backoff=0.5, max_backoff=10.0, pool_size=10, max_concurrency=8,
+                 queue_timeout=None, stats_window=1000, rate_limit=None):
+        super().__init__(url, connect_timeout, read_timeout, retries, backoff, max_backoff,
+                         queue_timeout, stats_window, rate_limit)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @classmethod
+    def from_config(cls):
+        """Crea el cliente con los parámetros de Config."""
+        return cls(
+            connect_timeout=Config.UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout=Config.UPSTREAM_READ_TIMEOUT,
+            retries=Config.UPSTREAM_RETRIES,
+            backoff=Config.UPSTREAM_BACKOFF,
+            pool_size=Config.UPSTREAM_POOL_SIZE,
+            max_concurrency=Config.UPSTREAM_MAX_CONCURRENCY,
+            rate_limit=Config.UPSTREAM_RATE_LIMIT,
+        )
+
+    def post(self, payload, url=None, **kwargs):
+        """
+        Envía el payload por POST y devuelve la respuesta (ya verificada con
+        raise_for_status). Lanza requests.exceptions.RequestException si se
+        agotan los reintentos.
+        """
+        target = self._target(url)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("busy")
+            raise UpstreamBusy("Demasiadas consultas simultáneas a la API")
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            attempt = 0
+            while True:
+                if self._rate is not None:
+                    self._rate.wait()
+                try:
+                    response = self.session.post(target, json=payload, timeout=self.timeout, **kwargs)
+                    if response.status_code not in RETRY_STATUS or attempt >= self.retries:
+                        response.raise_for_status()
+                        ok = True
+                        return response
+                    response.close()
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if attempt >= self.retries:
+                        raise
+                attempt += 1
+                self._count("retries")
+                time.sleep(self._retry_delay(attempt - 1))
+        finally:
+            self._slots.release()
+            self._record(time.perf_counter() - start, ok)
+
+    def search(self, payload, url=None):
+        """Consulta searchData y devuelve el JSON ya parseado."""
+        return self.post(payload, url=url).json()
+
+    def stream(self, payload, url=None, limit=None):
+        """
+        Consulta searchData y devuelve un ArrayStream que va leyendo los
+        registros de "data" a medida que llega el cuerpo de la respuesta.
+        """
+        response = self.post(payload, url=url, stream=True)
+
+        def body():
+            try:
+                yield from response.iter_content(CHUNK_SIZE)
+            finally:
+                response.close()
+
+        return ArrayStream(body(), limit=limit)
+
+    def _spool(self, payload):
+        """Baja la respuesta completa a un archivo temporal (en memoria si es chica)."""
+        response = self.post(payload, stream=True)
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        finally:
+            response.close()
+        spool.seek(0)
+        return spool
+
+    def iter_page_streams(self, payload, page_size=None, workers=None, max_records=None):
+        """
+        Recorre todas las páginas de una consulta y las entrega en orden, cada
+        una como un ArrayStream de sus registros (con las demás claves de la
+        página en .meta).
+
+        La página 0 se lee directo del socket; al terminarla se conoce el
+        total de elementos y las restantes se bajan en paralelo con un pool
+        acotado a archivos temporales, de los que se leen de a un registro.
+        Nunca hay más de `workers` páginas en vuelo o esperando ser
+        consumidas. Se corta en `max_records` registros.
+        """
+        page_size = page_size or Config.UPSTREAM_PAGE_SIZE
+        workers = workers or Config.UPSTREAM_PAGE_WORKERS
+        max_records = max_records or Config.UPSTREAM_MAX_RECORDS
+        base = {k: v for k, v in payload.items() if k not in ('page', 'pageSize')}
+
+        def page_payload(page):
+            return dict(base, page=page, pageSize=page_size)
+
+        first = self.stream(page_payload(0), limit=max_records)
+        try:
+            yield first
+            # Se termina de recorrer lo que el consumidor no leyó (el iterador
+            # retoma donde quedó) para llegar a las claves que vienen después
+            # de "data" (totalElements)
+            for _ in first:
+                pass
+        finally:
+            first.close()
+        total, n_pages = self._page_count(first, page_size, max_records)
+        if n_pages <= 1:
+            return
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            next_page = 1
+            while next_page < n_pages and len(pending) < workers:
+                pending.append((next_page, pool.submit(self._spool, page_payload(next_page))))
+                next_page += 1
+            while pending:
+                page, future = pending.popleft()
+                spool = future.result()
+                if next_page < n_pages:
+                    pending.append((next_page, pool.submit(self._spool, page_payload(next_page))))
+                    next_page += 1
+                page_stream = self._spooled_stream(spool, total - page * page_size)
+                try:
+                    yield page_stream
+                finally:
+                    page_stream.close()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            for _, future in pending:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    future.result().close()
+
+    def iter_pages(self, payload, page_size=None, workers=None, max_records=None):
+        """
+        Igual que iter_page_streams pero con cada página ya materializada
+        ({..., "data": [...]}), para quien necesite la página entera.
+        """
+        for page_stream in self.iter_page_streams(payload, page_size, workers, max_records):
+            data = list(page_stream)
+            yield dict(page_stream.meta, data=data)